@@ -0,0 +1,74 @@
+"""
+Compare the storage of the chapter texts without compression, with zlib and with zstd (if installed):
+size of the database, time to store the novel, time to read a chapter and memory held by a novel read lazily
+
+usage: python -m benchmarks.bench_compression --chapters 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from webNovelManager.data import compression
+from webNovelManager.database.sqlite import SQLiteDatabase
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+NOTE = "◆いつも読んでいただきありがとうございます。ブックマーク、評価をいただけると励みになります。"
+NAMES = ["アリス", "勇者", "魔王", "ギルドマスター", "セレスティア", "村長"]
+WORDS = ["剣を構えた", "魔法を唱えた", "空を見上げた", "溜息をついた", "笑みを浮かべた", "扉を開けた", "首を傾げた"]
+
+
+def make_text(index:int, lines:int, rng:random.Random)->str:
+    body = [f"「{rng.choice(NAMES)}、{rng.choice(WORDS)}のか？」\n{rng.choice(NAMES)}は{rng.choice(WORDS)}。{rng.randrange(10 ** 6)}"
+            for _ in range(lines)]
+    return "\n".join([f"第{index}話", NOTE, ""] + body + ["", NOTE])
+
+
+def make_novel(chapters:int, lines:int)->dict:
+    rng = random.Random(0)
+    return {"source": SOURCE, "extend": None, "chapters": [
+        {"language": "jp", "id": str(index), "source": f"{SOURCE}{index}/", "raw_content": make_text(index, lines, rng),
+         "artefact": {}, "title": f"第{index}話"} for index in range(1, chapters + 1)]}
+
+
+def bench(codec:str, directory:str, novel:dict, lookups:int)->None:
+    path = os.path.join(directory, codec)
+    database = SQLiteDatabase(path, compression=codec)
+    start = time.perf_counter()
+    database.store_novel_instance(novel)
+    stored = time.perf_counter() - start
+    database.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    text_size = database.connection.execute("SELECT SUM(LENGTH(CAST(raw_content AS BLOB))) FROM chapters").fetchone()[0]
+    chapter_ids = [str(random.randrange(1, len(novel["chapters"]) + 1)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for chapter_id in chapter_ids:
+        database.get_chapter_instance(SOURCE, chapter_id)
+    read = (time.perf_counter() - start) / lookups
+    tracemalloc.start()
+    lazy_novel = database.get_novel_instance(SOURCE, lazy=True)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del lazy_novel
+    database.close()
+    print(f"{codec:>5}: texts {text_size / 2 ** 20:7.2f} MiB | file {os.path.getsize(path) / 2 ** 20:7.2f} MiB | "
+          f"store {stored:6.2f}s | read {read * 10 ** 6:7.1f}us/chapter | lazy novel {held / 2 ** 20:7.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=60, help="lines of dialogue per chapter")
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+    novel = make_novel(args.chapters, args.lines)
+    codecs = ["none", "zlib"] + (["zstd"] if compression.zstandard is not None else [])
+    with tempfile.TemporaryDirectory() as directory:
+        for codec in codecs:
+            bench(codec, directory, novel, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
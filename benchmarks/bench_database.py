@@ -0,0 +1,65 @@
+"""
+Compare the database backends on the same workload:
+bulk insert of a novel, appends of single chapters and random single chapter lookups
+
+usage: python -m benchmarks.bench_database --chapters 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from webNovelManager.database.sqlite import SQLiteDatabase
+from webNovelManager.database.tiny import TinyDBDatabase
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+
+
+def make_novel(chapters:int, arc_size:int=100)->dict:
+    return {
+        "source": SOURCE,
+        "chapters": [
+            {"arc_id": arc_id, "arc_title": f"第{arc_id}章", "chapters": [
+                {"language": "jp", "id": str(index), "source": f"{SOURCE}{index}/",
+                 "raw_content": "　本文" * 1000, "artefact": {}, "title": f"第{index}話"}
+                for index in range(arc_id * arc_size + 1, min((arc_id + 1) * arc_size, chapters) + 1)]}
+            for arc_id in range((chapters + arc_size - 1) // arc_size)],
+        "extend": None,
+    }
+
+
+def bench(backend, path:str, chapters:int, appends:int, lookups:int)->None:
+    database = backend(path)
+    start = time.perf_counter()
+    database.store_novel_instance(make_novel(chapters))
+    inserted = time.perf_counter()
+    for index in range(chapters + 1, chapters + appends + 1):
+        database.store_chapter_instance(SOURCE, {"language": "jp", "id": str(index), "source": f"{SOURCE}{index}/",
+                                                 "raw_content": "　本文" * 1000, "artefact": {}})
+    appended = time.perf_counter()
+    for chapter_id in random.sample(range(1, chapters + 1), lookups):
+        assert database.get_chapter_instance(SOURCE, str(chapter_id)) is not None
+    looked_up = time.perf_counter()
+    database.close()
+    print(f"{backend.__name__:>16}: bulk insert {chapters} chapters {inserted - start:8.3f}s | "
+          f"{appends} single appends {(appended - inserted) / appends * 1000:8.3f}ms each | "
+          f"{lookups} lookups {(looked_up - appended) / lookups * 1000:8.3f}ms each")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=10000)
+    parser.add_argument("--appends", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=100)
+    parser.add_argument("--skip-tinydb", action="store_true", help="TinyDB gets very slow past a few 10k chapters")
+    args = parser.parse_args()
+    backends = [SQLiteDatabase] if args.skip_tinydb else [SQLiteDatabase, TinyDBDatabase]
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in backends:
+            bench(backend, os.path.join(directory, backend.__name__), args.chapters, args.appends, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
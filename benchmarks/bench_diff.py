@@ -0,0 +1,69 @@
+"""
+Time the comparison of two versions of a chapter: difflib.Differ plus HtmlDiff (the previous
+is_there_a_diff) against diff_chapters, with and without the hash fast path
+
+usage: python -m benchmarks.bench_diff --lines 480 --repeat 5
+"""
+import argparse
+import difflib
+import random
+import time
+
+from webNovelManager.plugins.diff import diff_chapters
+from webNovelManager.plugins.functions import hash_content
+
+
+def make_chapter(generator:random.Random, lines:int)->str:
+    alphabet = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん、。「」"
+    return "\n".join("".join(generator.choice(alphabet) for _ in range(generator.randint(20, 80)))
+                     if generator.random() > 0.2 else "" for _ in range(lines))
+
+
+def revise(generator:random.Random, text:str, edits:int)->str:
+    lines = text.splitlines()
+    for _ in range(edits):
+        position = generator.randrange(len(lines))
+        if generator.random() < 0.5:
+            lines[position] = lines[position][::-1]
+        else:
+            lines.insert(position, "追記。")
+    return "\n".join(lines)
+
+
+def previous_diff(old_chapter_text:str, new_chapter_text:str):
+    difference_list = list(difflib.Differ().compare(old_chapter_text.splitlines(), new_chapter_text.splitlines()))
+    diff_bool = len([line for line in difference_list if not line.startswith("  ")]) > 0
+    return (diff_bool,
+            difflib.HtmlDiff().make_table(old_chapter_text.splitlines(), new_chapter_text.splitlines())
+            if diff_bool else None)
+
+
+def timed(function, repeat:int)->float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=480, help="lines per chapter (~20k characters for 480)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    generator = random.Random(0)
+    old = make_chapter(generator, args.lines)
+    old_hash = hash_content(old)
+    print(f"chapter of {len(old)} characters, {args.lines} lines")
+    for edits in (0, 5, 50):
+        new = revise(generator, old, edits) if edits else old
+        new_hash = hash_content(new)
+        assert previous_diff(old, new)[0] == diff_chapters(old, new).changed
+        previous_ms = timed(lambda: previous_diff(old, new), args.repeat)
+        opcodes_ms = timed(lambda: diff_chapters(old, new, old_hash, new_hash), args.repeat)
+        html_ms = timed(lambda: diff_chapters(old, new, old_hash, new_hash).html(), args.repeat)
+        print(f"{edits:3d} edits: Differ+HtmlDiff {previous_ms:9.3f}ms | opcodes {opcodes_ms:8.3f}ms "
+              f"(x{previous_ms / opcodes_ms:7.1f}) | opcodes+html {html_ms:9.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Time the export of a long novel into an epub: a first full export, then the export after a single
+chapter changed, which copies every other entry still compressed from the previous book
+
+usage: python -m benchmarks.bench_epub --chapters 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from webNovelManager.export.epub import export_novel
+
+
+SENTENCES = ["　ギルドの受付嬢は首を傾げた。", "　「待ってくれ！」俺は剣を抜いた。", "　その夜、誰も眠れなかった。",
+             "　空は高く、風は冷たい。", "　森の奥から魔物の咆哮が響く。", "　村の長老は古い地図を広げた。"]
+
+
+def iter_chapters(chapters:int, changed:int=None):
+    """
+    yield the chapters of a synthetic novel one by one, ~15k characters each
+    """
+    generator = random.Random(0)
+    bodies = ["\n".join("".join(generator.choice(SENTENCES) for _ in range(generator.randint(1, 6))) for _ in range(300))
+              for _ in range(50)]
+    for number in range(1, chapters + 1):
+        text = f"{number}/{chapters}\n第{number}話\n{bodies[number % len(bodies)]}"
+        if number == changed:
+            text += "\n　追記。"
+        yield {"arc_id": (number - 1) // 100, "arc_title": f"第{(number - 1) // 100 + 1}章"}, \
+              {"language": "jp", "id": str(number), "title": f"第{number}話", "raw_content": text, "artefact": {}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=2000)
+    args = parser.parse_args()
+    info = {"title": "長編", "author": "作者", "link": "https://ncode.syosetu.com/n0000aa/"}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "novel.epub")
+        for label, changed in (("first export", None), ("one chapter changed", args.chapters // 2)):
+            start = time.perf_counter()
+            writer = export_novel(path, info, iter_chapters(args.chapters, changed))
+            elapsed = time.perf_counter() - start
+            tracemalloc.start() # measured apart, tracing slows everything down
+            export_novel(path, info, iter_chapters(args.chapters, changed)) if changed else \
+                export_novel(os.path.join(directory, "memory.epub"), info, iter_chapters(args.chapters))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{label:>20}: {elapsed:7.2f}s | {writer.compressed:5d} entries compressed, {writer.reused:5d} reused | "
+                  f"{os.path.getsize(path) / 2 ** 20:6.1f} MiB | peak {peak / 2 ** 20:6.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
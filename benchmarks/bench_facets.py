@@ -0,0 +1,95 @@
+"""
+Build the facet index of a synthetic library (tags following a Zipf law, as on the websites), then time
+AND/OR/NOT queries and tag counts against a scan of the novel info held in memory
+
+usage: python -m benchmarks.bench_facets --novels 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from webNovelManager.search.facets import FacetIndex, novel_facets, parse_term
+
+
+FLAGS = ["R15", "残酷な描写あり", "異世界転生", "異世界転移", "ボーイズラブ", "ガールズラブ"]
+GENRES = ["ファンタジー", "恋愛", "女主人公", "男主人公", "ハーレム", "チート", "スローライフ", "ざまぁ", "学園", "冒険"]
+
+
+def make_infos(novels:int, tags:int, authors:int)->dict:
+    rng = random.Random(0)
+    vocabulary = FLAGS + GENRES + [f"キーワード{number}" for number in range(tags)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return {f"https://ncode.syosetu.com/n{number:05d}aa/": {
+        "tags": sorted(set(rng.choices(vocabulary, weights, k=rng.randint(3, 15)))),
+        "author": f"作者{int(rng.paretovariate(1.2)) % authors}",
+        "type": "oneshot" if rng.random() < 0.2 else "webnovel",
+        "age_limit": rng.random() < 0.05,
+    } for number in range(novels)}
+
+
+def scan(infos:dict, all_of, any_of, none_of)->list:
+    all_of, any_of, none_of = ({parse_term(term) for term in terms} for terms in (all_of, any_of, none_of))
+    sources = []
+    for source, info in infos.items():
+        facets = novel_facets(info)
+        if all_of <= facets and (not any_of or any_of & facets) and not none_of & facets:
+            sources.append(source)
+    return sources
+
+
+def timed(function, repeat:int=20)->float:
+    """
+    :return: the best time of a function, in milliseconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--novels", type=int, default=100000)
+    parser.add_argument("--tags", type=int, default=20000)
+    parser.add_argument("--authors", type=int, default=30000)
+    args = parser.parse_args()
+    infos = make_infos(args.novels, args.tags, args.authors)
+    queries = {
+        "異世界転生 AND 女主人公 NOT R15": (["異世界転生", "女主人公"], [], ["R15"]),
+        "(恋愛 OR 学園) AND NOT R15": ([], ["恋愛", "学園"], ["R15"]),
+        "rare tag AND type": (["キーワード5000", "type:webnovel"], [], []),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "facets.sqlite")
+        index = FacetIndex(path)
+        start = time.perf_counter()
+        index.set_novels_info(infos)
+        print(f"indexed {args.novels} novels in {time.perf_counter() - start:.2f}s, "
+              f"{os.path.getsize(path) / 2 ** 20:.1f}MB")
+        index.close()
+        index = FacetIndex(path) # the bitmaps are read from the file
+        start = time.perf_counter()
+        index.query(["異世界転生"])
+        print(f"first query (loading its bitmaps): {(time.perf_counter() - start) * 1000:.2f}ms")
+        for name, (all_of, any_of, none_of) in queries.items():
+            bits = index.query(all_of, any_of, none_of)
+            assert index.sources(bits) == scan(infos, all_of, any_of, none_of)
+            print(f"{name}: {bits.bit_count()} novels, query {timed(lambda: index.query(all_of, any_of, none_of)):.3f}ms, "
+                  f"+sources {timed(lambda: index.sources(index.query(all_of, any_of, none_of)), 5):.2f}ms, "
+                  f"scan {timed(lambda: scan(infos, all_of, any_of, none_of), 1):.0f}ms")
+        print(f"tag counts of the library (top 20): {timed(lambda: index.count('tags', limit=20)):.3f}ms")
+        start = time.perf_counter()
+        index.count("tags", within=index.query(["R15"]), limit=20)
+        print(f"first count of a result (loading the bitmaps of the novels): {(time.perf_counter() - start) * 1000:.0f}ms")
+        for name, (all_of, any_of, none_of) in queries.items():
+            bits = index.query(all_of, any_of, none_of)
+            print(f"tag counts of {name}: {timed(lambda: index.count('tags', within=bits, limit=20), 5):.2f}ms")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Fetch the replayed long serial (see benchmarks/corpus.py) several times through the job queue with an increasing
+number of worker processes, against fetch_novel in a single process, then interrupt a job halfway
+and count the requests needed to resume it
+
+usage: python -m benchmarks.bench_jobs --novels 8 --processes 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import replaying_plugin
+from webNovelManager.database.sqlite import SQLiteDatabase
+from webNovelManager.jobs.queue import JobQueue
+from webNovelManager.jobs.worker import Worker, run_workers
+
+
+class CopyPlugin:
+    """
+    fetch the copies of the novel, "<link>?copy=<number>", from the recorded novel
+    """
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    def fetch_index(self, url:str):
+        return self.plugin.fetch_index(url.split("?")[0])
+
+    def fetch_chapter(self, url:str):
+        return self.plugin.fetch_chapter(url)
+
+
+__PLUGIN__ = None
+
+
+def get_plugin(url:str)->CopyPlugin:
+    """
+    the replaying plugin of the worker process
+    """
+    global __PLUGIN__
+    if __PLUGIN__ is None:
+        __PLUGIN__ = CopyPlugin(replaying_plugin("long_serial")[0])
+    return __PLUGIN__
+
+
+def bench_processes(directory:str, novels:int, processes:int)->float:
+    queue_path = os.path.join(directory, f"jobs-{processes}.sqlite")
+    queue = JobQueue(queue_path)
+    link = replaying_plugin("long_serial")[2]
+    # the same novel under several sources, as many jobs
+    for number in range(novels):
+        queue.submit(f"{link}?copy={number}")
+    start = time.perf_counter()
+    run_workers(queue_path, os.path.join(directory, f"novels-{processes}.sqlite"), processes, get_plugin=get_plugin)
+    elapsed = time.perf_counter() - start
+    assert queue.status() == {"done": queue.connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]}
+    queue.close()
+    return elapsed
+
+
+def bench_resume(directory:str)->None:
+    queue = JobQueue(os.path.join(directory, "resume.sqlite"))
+    database = SQLiteDatabase(os.path.join(directory, "resume-novels.sqlite"))
+    plugin, adapter, link = replaying_plugin("long_serial")
+    queue.submit(link)
+    worker = Worker(queue, database, lambda url: plugin)
+    while adapter.replayed < 30:
+        worker.run_once()
+    interrupted = adapter.replayed
+    plugin, adapter, link = replaying_plugin("long_serial") # a new process
+    Worker(queue, database, lambda url: plugin).run()
+    print(f"interrupted after {interrupted} requests, resumed with {adapter.replayed} more requests "
+          f"({queue.status()['done']} tasks done)")
+    database.close()
+    queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--novels", type=int, default=8)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    plugin, _, link = replaying_plugin("long_serial")
+    start = time.perf_counter()
+    for _ in range(args.novels):
+        plugin.fetch_novel(link, max_workers=1)
+    print(f"fetch_novel in one process: {args.novels} novels in {time.perf_counter() - start:.2f}s")
+    with tempfile.TemporaryDirectory() as directory:
+        for processes in args.processes:
+            elapsed = bench_processes(directory, args.novels, processes)
+            print(f"job queue, {processes} processes: {args.novels} novels in {elapsed:.2f}s")
+        bench_resume(directory)
+
+
+if __name__ == "__main__":
+    main()
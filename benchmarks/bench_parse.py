@@ -0,0 +1,57 @@
+"""
+Time the parsing of the saved chapter pages: full BeautifulSoup tree (the previous path)
+against the single pass lxml extraction used by Syosetu._parse_chapter
+
+usage: python -m benchmarks.bench_parse --repeat 50
+"""
+import argparse
+import pathlib
+import time
+
+from bs4 import BeautifulSoup
+
+from webNovelManager.plugins.syosetu import Syosetu
+
+
+FIXTURES = pathlib.Path(__file__).parent.parent / "tests" / "plugin" / "fixtures" / "syosetu"
+
+
+def parse_with_full_soup(plugin:Syosetu, link:str, html:str)->dict:
+    soup = BeautifulSoup(html, "lxml")
+    chapter_soup = plugin._minimun_parse_raw_chapter(soup.find("div", id="novel_color"))
+    chapter = {
+        "language": "jp",
+        "id": chapter_soup.find("div", id="novel_no").text.split("/")[0] if chapter_soup.find("div", id="novel_no") else None,
+        "source": link,
+        "raw_content": chapter_soup.text,
+        "artefact": plugin._resolve_artefact(chapter_soup),
+    }
+    if chapter_soup.find("p", {"class": "novel_subtitle"}):
+        chapter["title"] = chapter_soup.find("p", {"class": "novel_subtitle"}).text
+    return chapter
+
+
+def timed(function, repeat:int)->float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    plugin = Syosetu()
+    plugin._download_artefacts = lambda images: dict(images) # no network
+    for fixture in sorted(FIXTURES.glob("chapter_*.html")):
+        html = fixture.read_text(encoding="utf-8")
+        assert parse_with_full_soup(plugin, "link", html) == plugin._parse_chapter("link", html)
+        soup_ms = timed(lambda: parse_with_full_soup(plugin, "link", html), args.repeat)
+        lxml_ms = timed(lambda: plugin._parse_chapter("link", html), args.repeat)
+        print(f"{fixture.stem:>22} ({len(html.encode()) // 1024:4d} KiB): soup {soup_ms:8.3f}ms | "
+              f"single pass {lxml_ms:8.3f}ms | x{soup_ms / lxml_ms:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Replay the recorded scenarios of the Syosetu plugin (see benchmarks/corpus.py) fully offline and report,
+for each of them, the requests served per second, the parsing time per chapter and the peak memory,
+then the time spent in each instrumented stage of the plugin
+
+usage: python -m benchmarks.bench_plugins --repeat 5 --metrics metrics.prom --profile run.prof
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.corpus import SCENARIOS, replaying_plugin
+from webNovelManager.plugins.metrics import get_metrics, profiled
+
+
+def run(scenario:str, trace_memory:bool=False):
+    """
+    run a scenario once
+    :return: (seconds, requests replayed, items fetched, chapters parsed, seconds spent parsing, peak bytes)
+    """
+    plugin, adapter, link = replaying_plugin(scenario)
+    parsing = {"chapters": 0, "seconds": 0.0}
+    parse_chapter = plugin._parse_chapter
+
+    def timed_parse_chapter(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return parse_chapter(*args, **kwargs)
+        finally:
+            parsing["seconds"] += time.perf_counter() - start
+            parsing["chapters"] += 1
+
+    plugin._parse_chapter = timed_parse_chapter
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    items = SCENARIOS[scenario](plugin, link)
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, adapter.replayed, items, parsing["chapters"], parsing["seconds"], peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append", help="default: every scenario")
+    parser.add_argument("--metrics", help="write the metrics in the prometheus text format to this file")
+    parser.add_argument("--profile", help="profile the runs with cProfile, the stats are written to this file")
+    args = parser.parse_args()
+    metrics = get_metrics()
+    with profiled(args.profile or ""):
+        for scenario in args.scenario or SCENARIOS:
+            runs = [run(scenario) for _ in range(args.repeat)]
+            elapsed, replayed, items, chapters, parse_seconds, _ = min(runs)
+            peak = run(scenario, trace_memory=True)[-1]
+            parse_ms = f"{parse_seconds / chapters * 1000:7.3f}ms" if chapters else "      -  "
+            print(f"{scenario:>15}: {items:4d} items, {replayed:4d} requests in {elapsed * 1000:8.1f}ms "
+                  f"({replayed / elapsed:7.0f} req/s) | parse {parse_ms}/chapter | peak {peak / 2 ** 20:6.2f} MiB")
+    for ((_, stage),), histogram in sorted(metrics.histograms("webnovel_stage_duration_seconds").items()):
+        print(f"{stage:>40}: {histogram.count:6d} calls, mean {histogram.sum / histogram.count * 1000:8.3f}ms, "
+              f"p95 <= {histogram.quantile(0.95) * 1000:6.0f}ms")
+    if args.metrics:
+        metrics.write_prometheus(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure the memory a chapter manifest and a favorites listing hold once loaded: as the typed dicts, as slotted
+records, and as columnar batches, with the time to convert them from and back to the dicts
+
+usage: python -m benchmarks.bench_records --entries 1000000
+"""
+from datetime import datetime, timedelta
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from webNovelManager.data.records import (ChapterManifestBatch, ChapterManifestRecord, ShortNovelBatch,
+                                          ShortNovelRecord)
+from webNovelManager.plugins.functions import hash_content
+
+
+def manifest_text(entries:int)->str:
+    """
+    :return: a manifest as ManifestStore writes it, the chapters of novels of a thousand chapters
+    """
+    return json.dumps([{"link": f"https://ncode.syosetu.com/n{index // 1000:04d}aa/{index % 1000 + 1}/",
+                        "id": str(index % 1000 + 1),
+                        "update": f"2022/{index % 12 + 1:02d}/{index % 28 + 1:02d} {index % 24:02d}:00"
+                                  + (" (改)" if index % 7 == 0 else ""),
+                        "hash": hash_content(f"chapter {index}")} for index in range(entries)])
+
+
+def short_novels(entries:int):
+    """
+    :return: a favorites listing as the plugins give it, built anew on each call
+    """
+    start = datetime(2020, 1, 1)
+    return ({"title": f"異世界で勇者になった件 第{index}部", "author": f"作者{index % 5000}",
+             "ref": f"https://ncode.syosetu.com/n{index:07d}/", "last_modified": start + timedelta(minutes=index)}
+            for index in range(entries))
+
+
+def measure(build)->tuple:
+    """
+    :return: the result of build and the memory it still holds in bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, held
+
+
+def timed(function)->float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def compare(name:str, entries:int, load, record, batch)->None:
+    """
+    :param load: return fresh dicts of the entries, each form of the entries is measured with its strings
+    """
+    print(f"{name}: {entries} entries")
+    dicts, reference = measure(lambda: list(load()))
+    print(f"  {'dicts':<8} {reference / 2 ** 20:8.1f} MiB, {reference / entries:6.1f} bytes/entry")
+    records, held = measure(lambda: [record.from_dict(entry) for entry in load()])
+    print(f"  {'records':<8} {held / 2 ** 20:8.1f} MiB, {held / entries:6.1f} bytes/entry, {reference / held:4.1f}x less,"
+          f" from dicts {timed(lambda: [record.from_dict(entry) for entry in dicts]):5.2f}s,"
+          f" to dicts {timed(lambda: [entry.to_dict() for entry in records]):5.2f}s")
+    del records
+    columns, held = measure(lambda: batch(load()))
+    print(f"  {'batch':<8} {held / 2 ** 20:8.1f} MiB, {held / entries:6.1f} bytes/entry, {reference / held:4.1f}x less,"
+          f" from dicts {timed(lambda: batch(dicts)):5.2f}s, to dicts {timed(columns.to_dicts):5.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1000000)
+    args = parser.parse_args()
+    text = manifest_text(args.entries)
+    compare("chapter manifest", args.entries, lambda: json.loads(text), ChapterManifestRecord, ChapterManifestBatch)
+    del text
+    compare("favorites listing", args.entries, lambda: short_novels(args.entries), ShortNovelRecord, ShortNovelBatch)
+
+
+if __name__ == "__main__":
+    main()
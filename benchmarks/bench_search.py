@@ -0,0 +1,86 @@
+"""
+Index a synthetic library with the search index, then compare the latency of queries
+with loading every novel from the database to scan the texts of its chapters, the only way without the index.
+The chapters are made of random words of kanji joined by kana, the queries are a common phrase, a rare word,
+two rare words, a single kanji and a phrase of several words
+
+usage: python -m benchmarks.bench_search --novels 5 --chapters 1000
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+from webNovelManager.database.sqlite import SQLiteDatabase
+from webNovelManager.search.index import SearchIndex
+
+
+PARTICLES = ["は", "が", "を", "に", "と", "の", "で", "から", "まで"]
+ENDINGS = ["した。", "だった。", "と言った。", "ではない。", "かもしれない。"]
+
+
+def make_novel(source:str, chapters:int, lines:int, rng:random.Random)->dict:
+    vocabulary = ["".join(chr(0x4E00 + rng.randrange(1000)) for _ in range(rng.randint(2, 3))) for _ in range(1000)]
+    return {"source": source, "extend": None, "chapters": [
+        {"language": "jp", "id": str(index), "source": f"{source}{index}/", "artefact": {}, "title": f"第{index}話",
+         "raw_content": "\n".join("".join(f"{rng.choice(vocabulary)}{rng.choice(PARTICLES)}" for _ in range(rng.randint(3, 8)))
+                                  + rng.choice(ENDINGS) for _ in range(lines))}
+        for index in range(1, chapters + 1)]}
+
+
+def make_queries(novel:dict)->list:
+    line = novel["chapters"][7]["raw_content"].split("\n")[3]
+    words = re.findall("[\u4e00-\u9fff]+", line)
+    return ["と言った", words[0], f"{words[0]} {words[-1]}", words[0][0], line[:12]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--novels", type=int, default=5)
+    parser.add_argument("--chapters", type=int, default=1000, help="chapters per novel")
+    parser.add_argument("--lines", type=int, default=60, help="lines of dialogue per chapter")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    novels = [make_novel(f"https://ncode.syosetu.com/n{number:04d}aa/", args.chapters, args.lines, rng)
+              for number in range(args.novels)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "search.sqlite")
+        index = SearchIndex(path)
+        database = SQLiteDatabase(os.path.join(directory, "novels.sqlite"))
+        start = time.perf_counter()
+        for novel in novels:
+            index.add_novel(novel)
+        indexed = time.perf_counter() - start
+        for novel in novels:
+            database.store_novel_instance(novel)
+        start = time.perf_counter()
+        index.add_novel(novels[0])
+        print(f"index again an unchanged novel {time.perf_counter() - start:.2f}s")
+        index.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        text_size = sum(len(chapter["raw_content"].encode("utf-8")) for novel in novels for chapter in novel["chapters"])
+        print(f"indexed {args.novels * args.chapters} chapters ({text_size / 2 ** 20:.1f} MiB of text) in {indexed:.2f}s, "
+              f"index {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        start = time.perf_counter()
+        index.add_chapter(novels[0]["source"], {**novels[0]["chapters"][0], "raw_content": "書き直された章"})
+        print(f"re-index of a chapter {(time.perf_counter() - start) * 1000:.2f}ms")
+        for query in make_queries(novels[0]):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                results = index.search(query)
+            searched = (time.perf_counter() - start) / args.repeat
+            words = query.split()
+            start = time.perf_counter()
+            matches = sum(all(word in chapter["raw_content"] for word in words) for novel in novels
+                          for chapter in database.get_novel_instance(novel["source"])["chapters"])
+            scanned = time.perf_counter() - start
+            print(f"{query:>16}: index {searched * 1000:8.2f}ms ({len(results)} best) | scan {scanned * 1000:8.2f}ms "
+                  f"({matches} chapters)")
+        index.close()
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Time the start of the command-line entry point: run local commands of main.py on a small library
+in fresh interpreters, against an interpreter doing nothing, and check that they don't import
+the scraping modules. Exits with 1 when a read-only command goes over the budget, or a command imports one of them.
+export is reported without budget: it writes the epub and logs it, which imports structlog
+
+usage: python -m benchmarks.bench_startup --runs 10 --budget 100
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_compression import make_novel
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules only the downloading commands may import
+HEAVY_MODULES = ("requests", "bs4", "lxml", "tldextract", "dynaconf")
+
+
+def make_library(directory:str)->dict:
+    """
+    a library of a few novels and its search index
+    :param directory:
+    :return: the paths, by option of the commands
+    """
+    from webNovelManager.database.sqlite import SQLiteDatabase
+    from webNovelManager.search.index import SearchIndex
+
+    paths = {"db": os.path.join(directory, "library.sqlite"), "index": os.path.join(directory, "search.sqlite")}
+    database = SQLiteDatabase(paths["db"], compression="zlib")
+    index = SearchIndex(paths["index"])
+    for number in range(5):
+        novel = make_novel(20, 40)
+        novel["source"] = f"https://ncode.syosetu.com/n{number:04d}aa/"
+        novel["extend"] = {"title": f"小説{number}", "author": "作者"}
+        database.store_novel_instance(novel)
+        index.add_novel(novel)
+    database.close()
+    index.close()
+    return paths
+
+
+def run(arguments:list, runs:int)->float:
+    """
+    :return: the median wall time of a command, in seconds
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def imported(arguments:list)->list:
+    """
+    :return: the heavy modules a command imports, read from -X importtime
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", *arguments], cwd=ROOT, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    modules = {line.rsplit("|", 1)[-1].strip() for line in output.splitlines() if line.startswith("import time:")}
+    return [module for module in HEAVY_MODULES if module in modules]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=100.0, help="milliseconds over the bare interpreter")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_library(directory)
+        # name -> arguments, read-only
+        commands = {
+            "help": (["main.py", "--help"], True),
+            "list": (["main.py", "list", "--db", paths["db"]], True),
+            "stats": (["main.py", "stats", "--db", paths["db"]], True),
+            "search": (["main.py", "search", "勇者", "--index", paths["index"]], True),
+            "export": (["main.py", "export", "n0000aa", os.path.join(directory, "novel.epub"), "--db", paths["db"]], False),
+        }
+        baseline = run(["-c", "pass"], args.runs)
+        print(f"bare interpreter: {baseline * 1000:.1f}ms")
+        failed = False
+        for name, (arguments, read_only) in commands.items():
+            overhead = (run(arguments, args.runs) - baseline) * 1000
+            heavy = imported(arguments)
+            failed |= (read_only and overhead > args.budget) or bool(heavy)
+            print(f"{name:<7} +{overhead:6.1f}ms" + ("" if read_only else " (no budget)")
+                  + (f"  imports {', '.join(heavy)}" if heavy else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Simulate the favorites of an account over weeks of virtual time: a few novels update daily, some weekly,
+most are dormant, and a few dormant ones start again in the middle. Compare the update watcher, under its
+request budget, with blanket polling at fixed intervals: the requests sent and how long after their publication
+the updates are found
+
+usage: python -m benchmarks.bench_watcher --novels 300 --days 42 --budget 20
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+import math
+import random
+import statistics
+
+import structlog
+
+from webNovelManager.plugins.watcher import UpdateWatcher, WatchStore
+
+
+DAY = 86400.0
+PER_PAGE = 50 # novels per page of favorites
+
+
+class VirtualClock:
+    def __init__(self, now:float):
+        self.now = now
+
+    def __call__(self)->float:
+        return self.now
+
+    async def sleep(self, seconds:float)->None:
+        self.now += seconds
+
+
+class SimulatedFavorites:
+    """
+    the favorites and index pages of the simulated novels, counting the requests
+    """
+    def __init__(self, clock:VirtualClock, updates:dict):
+        self.clock = clock
+        self.updates = updates
+        self.requests = 0
+
+    def fetch_novels(self, max_workers=None)->dict:
+        self.requests += math.ceil(len(self.updates) / PER_PAGE)
+        now = self.clock()
+        return {"ncode": [{"title": source, "author": "", "ref": source,
+                           "last_modified": datetime.fromtimestamp(times[bisect_right(times, now) - 1])}
+                          for source, times in self.updates.items()]}
+
+    def fetch_index(self, source:str)->list:
+        self.requests += 1
+        published = bisect_right(self.updates[source], self.clock())
+        return [{"arc_id": 0, "arc_title": None,
+                 "chapters": [{"link": f"{source}{number}/", "update": None} for number in range(published)]}]
+
+
+def make_updates(novels:int, start:float, end:float, seed:int=0)->dict:
+    """
+    :return: the update times of each novel, from a year before start to end
+    """
+    rng = random.Random(seed)
+    updates = {}
+    for number in range(novels):
+        kind = rng.random()
+        if kind < 0.05: # daily, at about the same hour
+            period, resume = DAY, None
+        elif kind < 0.25:
+            period, resume = 7 * DAY, None
+        elif kind < 0.28: # dormant, then daily from the middle of the simulation
+            period, resume = DAY, (start + end) / 2
+        else:
+            period, resume = None, None
+        times = [start - 365 * DAY * rng.random()]
+        if period is not None:
+            now = start - 60 * DAY if resume is None else resume
+            while now < end:
+                times.append(now + rng.gauss(0, period / 10))
+                now += period
+        updates[f"https://ncode.syosetu.com/n{number:04d}aa/"] = sorted(time for time in times if time < end)
+    return updates
+
+
+def delays(updates:dict, found:dict, start:float, end:float)->list:
+    """
+    :param found: the times each novel was found updated
+    :return: the delay before each update published between start and end was found, in hours (end if never)
+    """
+    result = []
+    for source, times in updates.items():
+        detections = sorted(found.get(source, []))
+        for time in times:
+            if start <= time < end:
+                index = bisect_left(detections, time)
+                result.append(((detections[index] if index < len(detections) else end) - time) / 3600)
+    return result
+
+
+def blanket(updates:dict, start:float, end:float, warmup:float, hours:float, crawl:bool)->tuple:
+    """
+    poll at fixed intervals: crawl the favorites, then download the index of the updated novels to synchronize
+    them, or download the index of every novel
+    :return: the requests of the measured period and the delays
+    """
+    found = {source: [] for source in updates}
+    polls = [warmup + number * hours * 3600 for number in range(math.ceil((end - warmup) / (hours * 3600)))]
+    for source, times in updates.items():
+        for poll in polls:
+            if bisect_right(times, poll) > bisect_right(times, poll - hours * 3600):
+                found[source].append(poll)
+    if crawl:
+        requests = len(polls) * math.ceil(len(updates) / PER_PAGE) + sum(len(polls) for polls in found.values())
+    else:
+        requests = len(polls) * len(updates)
+    return requests, delays(updates, found, warmup, end)
+
+
+def watch(updates:dict, start:float, end:float, warmup:float, budget:float, delay_per_request:float)->tuple:
+    """
+    :return: the requests of the measured period, the index downloaded for the updated novels included, and the delays
+    """
+    clock = VirtualClock(start)
+    plugin = SimulatedFavorites(clock, updates)
+    found = {source: [] for source in updates}
+    watcher = UpdateWatcher(plugin, lambda novel, arcs: found[novel["ref"]].append(clock()), WatchStore(":memory:"),
+                            requests_per_hour=budget, delay_per_request=delay_per_request * 3600, clock=clock, sleep=clock.sleep,
+                            request_counter=lambda: plugin.requests)
+    asyncio.run(watcher.run(warmup - start))
+    before = plugin.requests
+    asyncio.run(watcher.run(end - warmup))
+    return plugin.requests - before, delays(updates, found, warmup, end)
+
+
+def summary(name:str, requests:int, found:list, days:float)->str:
+    return (f"{name:<36} {requests / days:8.0f} requests/day, updates found after "
+            f"{statistics.median(found):5.1f}h median, {statistics.mean(found):5.1f}h mean, "
+            f"{sorted(found)[int(len(found) * 0.95)]:5.1f}h p95")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--novels", type=int, default=300)
+    parser.add_argument("--days", type=float, default=42, help="the first third is a warmup, not measured")
+    parser.add_argument("--budget", type=float, default=20, help="requests per hour of the watcher")
+    parser.add_argument("--delay-per-request", type=float, nargs="+", default=[0.5, 1, 2, 4],
+                        help="the hours of waiting of the updates a request of the watcher must save")
+    args = parser.parse_args()
+    # the watcher logs every update found
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    start = 1_700_000_000.0
+    end = start + args.days * DAY
+    warmup = start + args.days / 3 * DAY
+    days = (end - warmup) / DAY
+    updates = make_updates(args.novels, start, end)
+    print(f"{args.novels} novels, {sum(start <= time < end for times in updates.values() for time in times)} "
+          f"updates in {args.days:.0f} days, measured over the last {days:.0f}")
+    for hours in (1, 6, 24):
+        print(summary(f"blanket index polling every {hours}h", *blanket(updates, start, end, warmup, hours, False), days))
+    for hours in (1, 3, 6):
+        print(summary(f"blanket favorites crawl every {hours}h", *blanket(updates, start, end, warmup, hours, True), days))
+    for delay_per_request in args.delay_per_request:
+        print(summary(f"watcher, {delay_per_request}h saved per request",
+                      *watch(updates, start, end, warmup, args.budget, delay_per_request), days))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Build the cassettes replayed by the offline tests and by bench_plugins, one per scenario:
+single chapter, long serial, illustrated serial, favorites crawl (with the login) and novel information.
+
+By default the pages are synthesized with the structure of the syosetu pages the plugin parses,
+so that the corpus is deterministic and holds no copyrighted text. With --live the scenarios
+are run against syosetu.com and every response is recorded instead (credentials are needed for the favorites)
+
+usage: python -m benchmarks.corpus [--live]
+"""
+import argparse
+import os
+import pathlib
+import random
+import struct
+import zlib
+
+from webNovelManager.plugins.replay import Cassette, open_cassette
+from webNovelManager.data.format import LoginInfo
+from webNovelManager.plugins.syosetu import Syosetu
+
+
+CORPUS = pathlib.Path(__file__).parent.parent / "tests" / "plugin" / "fixtures" / "replay" / "syosetu"
+
+SINGLE_CHAPTER = "https://ncode.syosetu.com/n0001aa/"
+LONG_SERIAL = "https://ncode.syosetu.com/n0002aa/"
+ILLUSTRATED = "https://ncode.syosetu.com/n0003aa/"
+LOGIN = "https://ssl.syosetu.com/login/login/"
+FAVORITES = {"ncode": "https://syosetu.com/favnovelmain/list/", "novel18": "https://syosetu.com/favnovelmain18/list/"}
+
+LONG_SERIAL_ARCS = 3
+LONG_SERIAL_CHAPTERS = 60
+ILLUSTRATED_CHAPTERS = 6
+IMAGES_PER_CHAPTER = 2
+FAVORITE_CATEGORIES = 3
+FAVORITE_PAGES = 5
+NOVELS_PER_PAGE = 10
+
+SENTENCES = ["　ギルドの受付嬢は首を傾げた。", "　「待ってくれ！」俺は剣を抜いた。", "　その夜、誰も眠れなかった。",
+             "　空は高く、風は冷たい。", "　森の奥から魔物の咆哮が響く。", "　村の長老は古い地図を広げた。",
+             "（まったく、面倒なことになった）", "　少女は振り返り、小さく笑った。", "　「レベルが上がりました」"]
+
+HTML_HEADERS = [("Content-Type", "text/html; charset=UTF-8")]
+
+
+def _page(title:str, body:str)->str:
+    return (f'<!DOCTYPE html>\n<html lang="ja">\n<head>\n<meta charset="UTF-8">\n<title>{title}</title>\n'
+            f'<link rel="stylesheet" type="text/css" media="all" href="https://static.syosetu.com/view/css/novel.css">\n'
+            f'<script type="text/javascript">var domain = \'syosetu.com\';</script>\n</head>\n<body>\n{body}\n'
+            f'<div id="footer"><ul><li>小説家になろう</li><li>運営会社</li></ul></div>\n</body>\n</html>\n')
+
+
+def _head_nav(ncode:str)->str:
+    return (f'<div id="novel_header">\n<ul id="head_nav">\n<li><a href="https://ncode.syosetu.com/{ncode}/">目次</a></li>\n'
+            f'<li><a href="https://ncode.syosetu.com/novelview/infotop/ncode/{ncode}/">小説情報</a></li>\n'
+            f'<li><a href="https://novelcom.syosetu.com/impression/list/ncode/{ncode}/">感想</a></li>\n</ul>\n</div>')
+
+
+def _paragraphs(generator:random.Random, count:int, images=())->str:
+    lines = ["".join(generator.choice(SENTENCES) for _ in range(generator.randint(1, 5))) if generator.random() > 0.1
+             else "<br>" for _ in range(count)]
+    for position, (href, src) in zip(sorted(generator.sample(range(count), len(images))), images):
+        lines[position] = f'<a href="{href}" target="_blank"><img src="{src}" alt="挿絵(By みてみん)" border="0"></a>'
+    return "\n".join(f'<p id="L{index + 1}">{line}</p>' for index, line in enumerate(lines))
+
+
+def chapter_page(generator:random.Random, ncode:str, number:int, total:int, lines:int, images=())->str:
+    previous = f'<a href="/{ncode}/{number - 1}/">&lt;&lt; 前へ</a>' if number > 1 else ""
+    following = f'<a href="/{ncode}/{number + 1}/">次へ &gt;&gt;</a>' if number < total else ""
+    body = (f'{_head_nav(ncode)}\n<div id="container">\n<div id="novel_contents">\n<div id="novel_color">\n'
+            f'<div class="novel_bn">{previous}{following}</div>\n'
+            + (f'<div id="novel_no">{number}/{total}</div>\n' if total > 1 else "")
+            + f'<p class="novel_subtitle">第{number}話</p>\n'
+            f'<div id="novel_p" class="novel_view">\n<p id="Lp1">前書き：いつも読んでいただきありがとうございます。</p>\n</div>\n'
+            f'<div id="novel_honbun" class="novel_view">\n{_paragraphs(generator, lines, images)}\n</div>\n'
+            f'<div id="novel_a" class="novel_view">\n<p id="La1">後書き：次回もお楽しみに。</p>\n</div>\n'
+            f'<div class="novel_bn">{previous}{following}</div>\n'
+            f'</div><!--novel_color-->\n</div><!--novel_contents-->\n</div><!--container-->')
+    return _page(f"第{number}話", body)
+
+
+def index_page(ncode:str, arcs:int, chapters:int)->str:
+    entries = []
+    for number in range(1, chapters + 1):
+        if (number - 1) % (chapters // arcs) == 0 and (number - 1) // (chapters // arcs) < arcs:
+            entries.append(f'<div class="chapter_title">第{(number - 1) // (chapters // arcs) + 1}章</div>')
+        entries.append(f'<dl class="novel_sublist2">\n<dd class="subtitle"><a href="/{ncode}/{number}/">第{number}話</a></dd>\n'
+                       f'<dt class="long_update">\n2022/01/{number % 28 + 1:02d} 10:00</dt>\n</dl>')
+    body = (f'{_head_nav(ncode)}\n<div id="novel_contents">\n<p class="novel_title">{ncode}</p>\n'
+            f'<div class="novel_writername">作者：<a href="https://mypage.syosetu.com/1/">作者</a></div>\n'
+            f'<div id="novel_ex">あらすじ</div>\n<div class="index_box">\n' + "\n".join(entries) + '\n</div>\n</div>')
+    return _page(ncode, body)
+
+
+def info_page(ncode:str)->str:
+    body = (f'<div id="contents_main">\n<h1><a href="https://ncode.syosetu.com/{ncode}/">長い連載</a></h1>\n'
+            f'<p id="ncode">{ncode.upper()}</p>\n<div id="infodata">\n<div id="pre_info">\n'
+            f'<span id="noveltype">連載</span>全{LONG_SERIAL_CHAPTERS}部分\n</div>\n<table id="noveltable1">\n'
+            f'<tr><th>あらすじ</th><td>異世界でのんびり暮らしたい。</td></tr>\n'
+            f'<tr><th>作者名</th><td><a href="https://mypage.syosetu.com/1/">作者</a>\n</td></tr>\n'
+            f'<tr><th>キーワード</th><td>R15\xa0異世界転生\xa0ファンタジー\n</td></tr>\n</table>\n</div>\n</div>')
+    return _page(ncode, body)
+
+
+def png(generator:random.Random, width:int=24, height:int=24)->bytes:
+    rows = b"".join(b"\x00" + bytes(generator.getrandbits(8) for _ in range(width * 3)) for _ in range(height))
+
+    def chunk(kind:bytes, data:bytes)->bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def favorite_pages()->dict:
+    pages = {}
+    for subdomain, favorite in FAVORITES.items():
+        categories = "".join(f'<li><a href="/{subdomain}list/?nowcategory={category}">カテゴリ{category}</a></li>'
+                             for category in range(1, FAVORITE_CATEGORIES + 1))
+        pages[favorite] = _page("ブックマーク", f'<ul class="category_box">{categories}</ul>')
+        for category in range(1, FAVORITE_CATEGORIES + 1):
+            for page in range(1, FAVORITE_PAGES + 1):
+                link = (f"https://syosetu.com/{subdomain}list/?nowcategory={category}" if page == 1
+                        else f"{favorite}?nowcategory={category}&p={page}")
+                novels = "\n".join(
+                    f'<table class="favnovel"><tr><td class="info">\n'
+                    f'<a class="title" href="https://{subdomain}.syosetu.com/n{category}{page:02d}{novel:02d}a/">小説{novel}</a>\n'
+                    f'<span class="fn_name">（作者{novel}）</span>\n<p>\n最新掲載日：2022/01/{page:02d} 10:{novel:02d}\n</p></td></tr></table>'
+                    for novel in range(NOVELS_PER_PAGE))
+                next_page = (f'<a title="next page" href="?nowcategory={category}&p={page + 1}">次へ</a>'
+                             if page < FAVORITE_PAGES else "")
+                pages[link] = _page("ブックマーク", f"{novels}\n{next_page}")
+    return pages
+
+
+def synthesize()->None:
+    """
+    write the synthetic cassettes
+    :return:
+    """
+    generator = random.Random(0)
+    cassettes = {}
+
+    def add(scenario, url, content, headers=HTML_HEADERS, method="GET", status_code=200):
+        if scenario not in cassettes:
+            path = CORPUS / f"{scenario}.jsonl"
+            if path.exists():
+                path.unlink()
+            cassettes[scenario] = Cassette(str(path))
+        cassettes[scenario].add(method, url, status_code, headers,
+                                content.encode("utf-8") if isinstance(content, str) else content)
+
+    add("single_chapter", SINGLE_CHAPTER, chapter_page(generator, "n0001aa", 1, 1, 60))
+
+    add("long_serial", LONG_SERIAL, index_page("n0002aa", LONG_SERIAL_ARCS, LONG_SERIAL_CHAPTERS))
+    for number in range(1, LONG_SERIAL_CHAPTERS + 1):
+        add("long_serial", f"{LONG_SERIAL}{number}/",
+            chapter_page(generator, "n0002aa", number, LONG_SERIAL_CHAPTERS, generator.randint(40, 100)))
+
+    add("illustrated", ILLUSTRATED, index_page("n0003aa", 1, ILLUSTRATED_CHAPTERS))
+    for number in range(1, ILLUSTRATED_CHAPTERS + 1):
+        images = [(f"//{number}{image}.mitemin.net/i{number}{image}/",
+                   f"//{number}{image}.mitemin.net/userpageimage/viewimagebig/icode/i{number}{image}/")
+                  for image in range(IMAGES_PER_CHAPTER)]
+        add("illustrated", f"{ILLUSTRATED}{number}/",
+            chapter_page(generator, "n0003aa", number, ILLUSTRATED_CHAPTERS, 80, images))
+        for _, src in images:
+            add("illustrated", f"https:{src}", png(generator), headers=[("Content-Type", "image/png")])
+
+    add("favorites", LOGIN, _page("ログイン", "ログインしました"), method="POST",
+        headers=HTML_HEADERS + [("Set-Cookie", "userl=corpus; Domain=.syosetu.com; Path=/"),
+                                ("Set-Cookie", "ses=corpus; Domain=.syosetu.com; Path=/")])
+    for link, page in favorite_pages().items():
+        add("favorites", link, page)
+
+    add("novel_info", LONG_SERIAL, index_page("n0002aa", LONG_SERIAL_ARCS, LONG_SERIAL_CHAPTERS))
+    add("novel_info", "https://ncode.syosetu.com/novelview/infotop/ncode/n0002aa/", info_page("n0002aa"))
+
+    for scenario, cassette in sorted(cassettes.items()):
+        print(f"{scenario:>15}: {len(cassette):4d} interactions, {os.path.getsize(cassette.path) // 1024:5d} KiB")
+
+
+def run_novel(plugin:Syosetu, link:str)->int:
+    novel = plugin.fetch_novel(link)
+    return sum(len(arc["chapters"]) if "arc_id" in arc else 1 for arc in novel["chapters"])
+
+
+def run_favorites(plugin:Syosetu, link:str)->int:
+    assert plugin.login()
+    return sum(len(novels) for novels in plugin.fetch_novels().values())
+
+
+def run_novel_info(plugin:Syosetu, link:str)->int:
+    assert plugin.get_novel_info(link)["ncode"]
+    return 1
+
+
+# scenario -> function running it from its entry link, returning the number of chapters, novels or infos fetched
+SCENARIOS = {
+    "single_chapter": run_novel,
+    "long_serial": run_novel,
+    "illustrated": run_novel,
+    "favorites": run_favorites,
+    "novel_info": run_novel_info,
+}
+
+
+def replaying_plugin(scenario:str):
+    """
+    return a plugin replaying the cassette of a scenario, without cache nor pacing so that every
+    request reaches the cassette, the adapter (to count the requests) and the entry link of the scenario
+    (the first url recorded)
+    :param scenario:
+    :return:
+    """
+    adapter = open_cassette(str(CORPUS / f"{scenario}.jsonl"))
+    plugin = Syosetu()
+    plugin.use_transport(adapter)
+    plugin.session.cache = None
+    # the recorded login answers whatever the credentials
+    plugin._get_credentials = lambda: LoginInfo(login="corpus", password="corpus")
+    return plugin, adapter, next(iter(adapter.cassette))["url"]
+
+
+def record(links:dict)->None:
+    """
+    run the scenarios against the website and record every response
+    :param links: scenario -> entry link
+    :return:
+    """
+    for scenario, link in links.items():
+        path = CORPUS / f"{scenario}.jsonl"
+        if path.exists():
+            path.unlink()
+        plugin = Syosetu()
+        plugin.use_transport(open_cassette(str(path), mode="record"), paced=True)
+        SCENARIOS[scenario](plugin, link)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="record the real pages instead of synthesizing them")
+    for scenario in SCENARIOS:
+        parser.add_argument(f"--{scenario.replace('_', '-')}", help=f"entry link of the {scenario} scenario when recording")
+    args = parser.parse_args()
+    CORPUS.mkdir(parents=True, exist_ok=True)
+    if args.live:
+        record({scenario: getattr(args, scenario) or (LOGIN if scenario == "favorites" else None) for scenario in SCENARIOS
+                if getattr(args, scenario) or scenario == "favorites"})
+    else:
+        synthesize()
+
+
+if __name__ == "__main__":
+    main()
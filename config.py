@@ -1,7 +1,46 @@
 
-from dynaconf import Dynaconf
+import threading
 
-settings = Dynaconf(
+
+class LazySettings:
+    """
+    The Dynaconf settings, created on first use: importing dynaconf takes longer than most commands
+    which don't read the settings, ex: the local commands given every path
+    """
+    def __init__(self, **options):
+        object.__setattr__(self, "_options", options)
+        object.__setattr__(self, "_settings", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _load(self):
+        if self._settings is None:
+            with self._lock:
+                if self._settings is None:
+                    from dynaconf import Dynaconf
+                    object.__setattr__(self, "_settings", Dynaconf(**self._options))
+        return self._settings
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    @property
+    def loaded(self)->bool:
+        return self._settings is not None
+
+
+settings = LazySettings(
     envvar_prefix="DYNACONF",
     settings_files=['settings.toml', '.secrets.toml'],
 )
@@ -1,2 +1,7 @@
+import sys
+
+from webNovelManager.cli import main
+
+
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    sys.exit(main())
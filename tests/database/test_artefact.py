@@ -0,0 +1,47 @@
+from webNovelManager.database.artefact import ArtefactStore
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.headers = {"Content-Type": "image/png"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+class FakeSession:
+    def __init__(self, contents):
+        self.contents = contents
+        self.requested = []
+
+    def get(self, url, headers=None, stream=False):
+        self.requested.append(url)
+        return FakeResponse(self.contents[url])
+
+
+class Test_ArtefactStore():
+    def test_deduplication(self, tmp_path):
+        image = b"\x89PNG" * 100000
+        session = FakeSession({"https://a/1.png": image, "https://b/1.png": image})
+        store = ArtefactStore(str(tmp_path))
+
+        first = store.fetch(session, "https://a/1.png")
+        second = store.fetch(session, "https://b/1.png")
+        assert first["sha256"] == second["sha256"] and first["size"] == len(image)
+        assert store.get(first["sha256"]) == image
+        assert len(list((tmp_path / "objects").rglob("*"))) == 2 # one sub directory, one object
+
+        assert store.fetch(session, "https://a/1.png") == first
+        assert session.requested == ["https://a/1.png", "https://b/1.png"]
+        store.close()
@@ -0,0 +1,115 @@
+import pytest
+
+from webNovelManager.data import compression
+from webNovelManager.data.compression import CompressedText, TextCompressor, as_text, read_header, train_dictionary
+from webNovelManager.database.sqlite import SQLiteDatabase
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+NOTE = "◆いつも読んでいただきありがとうございます。ブックマーク、評価をいただけると励みになります。"
+
+
+def chapter_text(index:int)->str:
+    return "\n".join([f"第{index}話", NOTE] + [f"「{index}番目の台詞です、勇者様」と魔王は言った。{line}" for line in range(30)] + [NOTE])
+
+
+def make_chapters(start:int, stop:int):
+    return [{"language": "jp", "id": str(index), "source": f"{SOURCE}{index}/", "raw_content": chapter_text(index),
+             "artefact": {}, "title": f"第{index}話"} for index in range(start, stop)]
+
+
+CODECS = ["zlib", "zstd"] if compression.zstandard is not None else ["zlib"]
+
+
+class Test_TextCompressor():
+    @pytest.mark.parametrize("codec", CODECS)
+    def test_round_trip_with_dictionary(self, codec):
+        samples = [chapter_text(index) for index in range(10)]
+        dictionary = train_dictionary(samples, compression.CODECS[codec])
+        compressor = TextCompressor(compression.CODECS[codec], dictionary, 7)
+        plain = TextCompressor(compression.CODECS[codec])
+        blob = compressor.compress(chapter_text(42))
+        assert read_header(blob) == (compression.CODECS[codec], 7)
+        assert compressor.decompress(blob) == chapter_text(42)
+        assert len(blob) < len(plain.compress(chapter_text(42)))
+        with pytest.raises(ValueError):
+            plain.decompress(blob)
+
+    def test_compressed_text(self):
+        compressor = TextCompressor(compression.ZLIB)
+        text = CompressedText(compressor.compress("本文"), compressor)
+        assert text == "本文" and str(text) == "本文" and as_text(text) == "本文"
+        assert as_text("本文") == "本文" and as_text(None) is None
+
+
+class Test_CompressedStorage():
+    @pytest.mark.parametrize("codec", CODECS)
+    def test_round_trip(self, tmp_path, codec):
+        database = SQLiteDatabase(str(tmp_path / "db"), compression=codec)
+        database.store_novel_instance({"source": SOURCE, "chapters": make_chapters(1, 11), "extend": None})
+        database.store_chapter_instance(SOURCE, make_chapters(11, 12))
+        assert database.get_chapter_instance(SOURCE, "11")["raw_content"] == chapter_text(11)
+        novel = database.get_novel_instance(SOURCE)
+        assert [chapter["raw_content"] for chapter in novel["chapters"]] == [chapter_text(index) for index in range(1, 12)]
+        assert database.connection.execute("SELECT COUNT(*) FROM dictionaries").fetchone()[0] == 1
+        assert all(isinstance(content, bytes) and read_header(content)[1] != 0 for content, in
+                   database.connection.execute("SELECT raw_content FROM chapters"))
+        database.close()
+
+    def test_lazy(self, tmp_path):
+        database = SQLiteDatabase(str(tmp_path / "db"), compression="zlib")
+        database.store_novel_instance({"source": SOURCE, "chapters": make_chapters(1, 6), "extend": None})
+        chapter = database.get_chapter_instance(SOURCE, "3", lazy=True)
+        assert isinstance(chapter["raw_content"], CompressedText)
+        assert chapter["raw_content"].text == chapter_text(3)
+        database.store_chapter_instance(SOURCE, chapter) # stored back without being read by the caller
+        assert database.get_chapter_instance(SOURCE, "3")["raw_content"] == chapter_text(3)
+        database.close()
+
+    def test_dictionary_trained_once_enough_chapters(self, tmp_path):
+        database = SQLiteDatabase(str(tmp_path / "db"), compression="zlib")
+        for chapter in make_chapters(1, 7):
+            database.store_chapter_instance(SOURCE, chapter)
+        dictionary_ids = [read_header(content)[1] for content, in
+                          database.connection.execute("SELECT raw_content FROM chapters ORDER BY position")]
+        assert dictionary_ids[:3] == [0, 0, 0] and dictionary_ids[-1] != 0
+        assert [database.get_chapter_instance(SOURCE, str(index))["raw_content"] for index in range(1, 7)] == \
+               [chapter_text(index) for index in range(1, 7)]
+        database.delete_novel(SOURCE)
+        assert database.connection.execute("SELECT COUNT(*) FROM dictionaries").fetchone()[0] == 0
+        database.close()
+
+    @pytest.mark.parametrize("autoincrement", [True, False])
+    def test_stored_again(self, tmp_path, autoincrement):
+        path = str(tmp_path / "db")
+        database = SQLiteDatabase(path, compression="zlib")
+        if not autoincrement: # a database created before the dictionary ids were autoincremented
+            database.connection.executescript("DROP TABLE dictionaries; CREATE TABLE dictionaries (id INTEGER PRIMARY KEY, "
+                                              "novel_id INTEGER NOT NULL REFERENCES novels (id) ON DELETE CASCADE, "
+                                              "codec INTEGER NOT NULL, content BLOB NOT NULL);")
+        database.store_novel_instance({"source": SOURCE, "chapters": make_chapters(1, 6), "extend": None})
+        chapters = make_chapters(1, 6)
+        for chapter in chapters:
+            chapter["raw_content"] = chapter["raw_content"].replace("勇者", "姫")
+        database.store_novel_instance({"source": SOURCE, "chapters": chapters, "extend": None})
+        database.close()
+        database = SQLiteDatabase(path)
+        assert [database.get_chapter_instance(SOURCE, str(index))["raw_content"] for index in range(1, 6)] == \
+               [chapter["raw_content"] for chapter in chapters]
+        database.close()
+
+    def test_plain_and_legacy_rows(self, tmp_path):
+        path = str(tmp_path / "db")
+        database = SQLiteDatabase(path, compression="none")
+        database.store_novel_instance({"source": SOURCE, "chapters": make_chapters(1, 6), "extend": None})
+        assert database.connection.execute("SELECT raw_content FROM chapters WHERE chapter_id = '1'").fetchone()[0] == chapter_text(1)
+        database.close()
+        database = SQLiteDatabase(path, compression="zlib")
+        database.store_chapter_instance(SOURCE, make_chapters(6, 7))
+        novel = database.get_novel_instance(SOURCE, lazy=True)
+        assert [as_text(chapter["raw_content"]) for chapter in novel["chapters"]] == [chapter_text(index) for index in range(1, 7)]
+        database.close()
+
+    def test_unknown_compression(self, tmp_path):
+        with pytest.raises(ValueError):
+            SQLiteDatabase(str(tmp_path / "db"), compression="lzma")
@@ -0,0 +1,58 @@
+import pytest
+
+from webNovelManager.database.sqlite import SQLiteDatabase
+from webNovelManager.database.tiny import TinyDBDatabase
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+
+NOVEL = {
+    "source": SOURCE,
+    "chapters": [
+        {"chapters": [
+            {"language": "jp", "id": "1", "source": f"{SOURCE}1/", "raw_content": "一", "artefact": {}, "title": "一"},
+            {"language": "jp", "id": "2", "source": f"{SOURCE}2/", "raw_content": "二", "artefact": {"//img/1": b"\x89PNG"}},
+        ], "arc_id": 0, "arc_title": "第一章"},
+        {"arc_title": "第二章", "chapters": [
+            {"language": "jp", "id": "3", "source": f"{SOURCE}3/", "raw_content": "三", "artefact": {}, "title": "三"},
+        ], "arc_id": 1},
+    ],
+    "extend": None,
+}
+
+
+@pytest.fixture(params=[SQLiteDatabase, TinyDBDatabase])
+def database(request, tmp_path):
+    database = request.param(str(tmp_path / "db"))
+    yield database
+    database.close()
+
+
+class Test_Database():
+    def test_round_trip(self, database):
+        database.store_novel_instance(NOVEL)
+        assert database.get_novel_instance(SOURCE) == NOVEL
+        assert database.get_novel_instance(ncode="N0000AA") == NOVEL
+        assert database.get_chapter_instance(SOURCE, "2")["artefact"] == {"//img/1": b"\x89PNG"}
+        assert database.get_novel_instance("https://ncode.syosetu.com/n9999zz/") is None
+
+    def test_chapters_and_deletion(self, database):
+        database.store_novel_instance(NOVEL)
+        database.store_chapter_instance(SOURCE, [{"language": "jp", "id": "4", "source": f"{SOURCE}4/",
+                                                  "raw_content": "四", "artefact": {}}],
+                                        arc={"arc_id": 1, "arc_title": "第二章"})
+        database.store_chapter_instance(SOURCE, {"language": "jp", "id": "1", "source": f"{SOURCE}1/",
+                                                 "raw_content": "壱", "artefact": {}, "title": "一"})
+        novel = database.get_novel_instance(SOURCE)
+        assert [chapter["id"] for chapter in novel["chapters"][1]["chapters"]] == ["3", "4"]
+        assert database.get_chapter_instance(SOURCE, "1")["raw_content"] == "壱"
+
+        reference = {"sha256": "ab" * 32, "url": "https://img/3", "size": 3, "media_type": "image/gif"}
+        database.store_artefacts(SOURCE, "3", {"//img/2": b"GIF", "//img/3": reference})
+        assert database.get_artefacts(SOURCE, "3") == {"//img/2": b"GIF", "//img/3": reference}
+
+        database.delete_chapter(SOURCE, "3")
+        assert database.get_chapter_instance(SOURCE, "3") is None
+        database.delete_novel(SOURCE)
+        assert database.get_novel_instance(SOURCE) is None
+        assert database.get_chapter_instance(SOURCE, "1") is None
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+
+from webNovelManager.data.records import (ChapterManifestBatch, ChapterRecord, NovelInstanceRecord, NovelRecord,
+                                          ShortNovelBatch, ShortNovelRecord)
+from webNovelManager.plugins.functions import hash_content
+from webNovelManager.plugins.sync import ManifestStore, NovelSynchronizer
+from tests.plugin.test_sync import FakePlugin
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+
+
+def make_novel():
+    chapters = [{"language": "jp", "id": str(index), "source": f"{SOURCE}{index}/", "raw_content": f"本文{index}",
+                 "artefact": {}} for index in range(1, 4)]
+    chapters[0]["title"] = "プロローグ"
+    return {"author": "作者", "tags": None, "description": None, "instance": [
+        {"source": SOURCE, "extend": None, "chapters": [{"arc_id": 0, "arc_title": "第一章", "chapters": chapters[:2]}]},
+        {"source": SOURCE, "extend": {}, "chapters": chapters[2:]},
+    ]}
+
+
+class Test_Records():
+    def test_round_trip(self):
+        novel = make_novel()
+        record = NovelRecord.from_dict(novel)
+        assert record.to_dict() == novel and record == novel
+        instance = record["instance"][1]
+        assert isinstance(instance, NovelInstanceRecord) and isinstance(instance["chapters"][0], ChapterRecord)
+        chapter = record["instance"][0]["chapters"][0]["chapters"][1]
+        assert "title" not in chapter and chapter.get("title") is None and len(chapter) == 5
+        chapter["title"] = "第二話"
+        assert chapter.to_dict()["title"] == "第二話"
+        with pytest.raises(KeyError):
+            chapter["unknown"] = 1
+
+    def test_given_as_dict(self, tmp_path):
+        plugin = FakePlugin([{"arc_id": 0, "chapters": [{"link": f"{SOURCE}1", "update": "2022/01/01"}]}])
+        plugin.contents = {f"{SOURCE}1": "one"}
+        short_novel = ShortNovelRecord(title="t", author="a", ref=SOURCE, last_modified=datetime(2022, 1, 1))
+        report = NovelSynchronizer(plugin, ManifestStore(str(tmp_path))).sync_novel(short_novel, max_workers=1)
+        assert len(report["new"]) == 1
+
+
+class Test_Batches():
+    def test_manifest(self):
+        entries = [{"link": f"{SOURCE}{index}/", "id": str(index) if index % 3 else None,
+                    "update": "2022/01/01 12:00" if index % 2 else "改稿 2022/01/02", "hash": hash_content(str(index))}
+                   for index in range(20)]
+        entries[4]["hash"] = None
+        batch = ChapterManifestBatch(entries)
+        assert len(batch) == 20 and batch.to_dicts() == entries
+        assert [record.to_dict() for record in batch] == entries
+        assert batch[-1] == entries[-1] and batch[3]["id"] is None and batch[4]["hash"] is None
+        with pytest.raises(ValueError):
+            batch.append({"link": SOURCE, "hash": "abcd"})
+        assert len(batch.columns["link"]) == 20 and batch.to_dicts() == entries
+
+    def test_short_novels(self):
+        novels = [{"title": "勇者の旅", "author": "作者", "ref": SOURCE, "last_modified": datetime(2022, 1, 2, 3, 4, 5, 6)},
+                  {"title": "", "author": None, "ref": SOURCE, "last_modified": None}]
+        batch = ShortNovelBatch(novels)
+        assert batch.to_dicts() == novels and list(batch.columns["title"]) == ["勇者の旅", ""]
+        assert batch[1]["author"] is None and batch[0]["last_modified"] == novels[0]["last_modified"]
@@ -0,0 +1,92 @@
+import zipfile
+from xml.etree import ElementTree
+
+from webNovelManager.database.artefact import ArtefactStore
+from webNovelManager.export.archive import RawZipReader, StreamingZipWriter
+from webNovelManager.export.epub import EpubWriter, export_novel, iter_novel_instance
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+
+def make_novel(chapters=6, changed=None):
+    def chapter(number):
+        text = f"{number}/{chapters}\n第{number}話\n\n　本文{number}。\n　<続く> & 終わり"
+        if number == changed:
+            text += "\n　追記。"
+        return {"language": "jp", "id": str(number), "source": f"https://ncode.syosetu.com/n0000aa/{number}/",
+                "title": f"第{number}話", "raw_content": text, "artefact": {"i": PNG} if number % 3 == 0 else {}}
+    return {"source": "https://ncode.syosetu.com/n0000aa/",
+            "chapters": [{"arc_id": arc, "arc_title": f"第{arc + 1}章",
+                          "chapters": [chapter(number) for number in range(arc * 3 + 1, arc * 3 + 4)]}
+                         for arc in range(chapters // 3)]}
+
+
+class Test_Epub():
+    INFO = {"title": "小説", "author": "作者", "link": "https://ncode.syosetu.com/n0000aa/"}
+
+    def test_structure(self, tmp_path):
+        path = str(tmp_path / "novel.epub")
+        export_novel(path, self.INFO, iter_novel_instance(make_novel()))
+        with zipfile.ZipFile(path) as book:
+            assert book.testzip() is None
+            assert book.infolist()[0].filename == "mimetype" and book.infolist()[0].compress_type == zipfile.ZIP_STORED
+            assert book.read("mimetype") == b"application/epub+zip"
+            for name in book.namelist():
+                if name.endswith((".xhtml", ".opf", ".ncx", ".xml")):
+                    ElementTree.fromstring(book.read(name)) # well formed
+            package = book.read("OEBPS/content.opf").decode("utf-8")
+            assert package.count("<itemref ") == 6 and package.count("image/png") == 1 # the image is stored once
+            navigation = book.read("OEBPS/nav.xhtml").decode("utf-8")
+            assert navigation.index("第1章") < navigation.index("第3話") < navigation.index("第2章")
+            assert "&lt;続く&gt; &amp; 終わり" in book.read("OEBPS/text/chapter_00001.xhtml").decode("utf-8")
+
+    def test_reuse(self, tmp_path):
+        path = str(tmp_path / "novel.epub")
+        first = export_novel(path, self.INFO, iter_novel_instance(make_novel()))
+        assert first.reused == 0
+        with zipfile.ZipFile(path) as book:
+            before = {name: book.read(name) for name in book.namelist()}
+
+        second = export_novel(path, self.INFO, iter_novel_instance(make_novel(changed=4)))
+        # only the changed chapter, and the package holding the modification date, are compressed again
+        assert second.compressed <= 2 and second.reused == first.compressed - second.compressed
+        with zipfile.ZipFile(path) as book:
+            assert book.testzip() is None
+            after = {name: book.read(name) for name in book.namelist()}
+        assert [name for name in after if after[name] != before.get(name) and name.startswith("OEBPS/text/")] == \
+               ["OEBPS/text/chapter_00004.xhtml"]
+
+    def test_artefact_reference_and_abort(self, tmp_path):
+        store = ArtefactStore(str(tmp_path / "artefacts"))
+        reference = store.put(PNG, url="https://example.com/i.png", media_type="image/png")
+        path = str(tmp_path / "novel.epub")
+        with EpubWriter(path, "小説", artefact_store=store) as writer:
+            writer.add_chapter({"title": "t", "raw_content": "a", "artefact": {"i": reference}})
+        with zipfile.ZipFile(path) as book:
+            assert book.read(f"OEBPS/images/{reference['sha256'][:32]}.png") == PNG
+        try:
+            with EpubWriter(path, "小説") as writer:
+                writer.add_chapter({"title": "t", "raw_content": "a", "artefact": {"i": reference}}) # no store
+        except ValueError:
+            pass
+        assert not (tmp_path / "novel.epub.part").exists()
+        with zipfile.ZipFile(path) as book: # the previous book is kept
+            assert book.testzip() is None
+
+
+class Test_Archive():
+    def test_raw_copy(self, tmp_path):
+        with open(tmp_path / "a.zip", "wb") as output:
+            writer = StreamingZipWriter(output)
+            writer.write("a.txt", "あいう".encode("utf-8") * 100)
+            writer.write("b.bin", b"\x00" * 10, compress=False)
+            writer.close()
+        reader = RawZipReader(str(tmp_path / "a.zip"))
+        with open(tmp_path / "b.zip", "wb") as output:
+            writer = StreamingZipWriter(output)
+            writer.write_raw("c.txt", reader.read_raw("a.txt"))
+            writer.close()
+        reader.close()
+        with zipfile.ZipFile(tmp_path / "b.zip") as archive:
+            assert archive.read("c.txt") == "あいう".encode("utf-8") * 100
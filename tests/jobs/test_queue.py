@@ -0,0 +1,107 @@
+import pytest
+
+from webNovelManager.database.sqlite import SQLiteDatabase
+from webNovelManager.jobs.queue import JobQueue
+from webNovelManager.jobs.worker import Worker, run_workers
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+LINKS = [f"{SOURCE}{index}/" for index in range(1, 6)]
+
+
+class FakePlugin():
+    def __init__(self, failing=()):
+        self.fetched = []
+        self.failing = set(failing)
+
+    def fetch_index(self, novel_link):
+        return [{"arc_id": 0, "arc_title": "第一章", "chapters": [{"link": link, "update": None} for link in LINKS[:3]]},
+                {"arc_id": 1, "arc_title": "第二章", "chapters": [{"link": link, "update": None} for link in LINKS[3:]]}]
+
+    def fetch_chapter(self, link):
+        if link in self.failing:
+            raise ConnectionError(link)
+        self.fetched.append(link)
+        return {"language": "jp", "id": link.rstrip("/").rsplit("/", 1)[-1], "source": link, "raw_content": f"本文{link}",
+                "artefact": {}, "title": link}
+
+
+def fake_plugin(url):
+    return FakePlugin()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2, retry_delay=0.2)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / "novels.sqlite"))
+    yield database
+    database.close()
+
+
+def stored_links(database):
+    return [chapter["source"] for arc in database.get_novel_instance(SOURCE)["chapters"] for chapter in arc["chapters"]]
+
+
+class Test_JobQueue():
+    def test_run_job(self, queue, database):
+        queue.submit(SOURCE)
+        plugin = FakePlugin()
+        assert Worker(queue, database, lambda url: plugin).run() == 7 # index, 5 chapters, store
+        assert stored_links(database) == LINKS
+        assert [arc["arc_title"] for arc in database.get_novel_instance(SOURCE)["chapters"]] == ["第一章", "第二章"]
+        assert queue.job_state(SOURCE) == "done" and not queue.has_work()
+        assert queue.connection.execute("SELECT COUNT(*) FROM tasks WHERE result IS NOT NULL").fetchone()[0] == 0
+
+    def test_empty_arc(self, queue):
+        queue.submit(SOURCE)
+        index = FakePlugin().fetch_index(SOURCE)
+        index.insert(1, {"arc_id": 2, "arc_title": "幕間", "chapters": []})
+        queue.complete_index(queue.claim(), index)
+        while (task := queue.claim()).kind == "chapter":
+            queue.complete_chapter(task, {"source": task.url})
+        novel = queue.assemble(task)
+        assert [(arc["arc_title"], len(arc["chapters"])) for arc in novel["chapters"]] == \
+               [("第一章", 3), ("幕間", 0), ("第二章", 2)]
+
+    def test_resume_after_crash(self, queue, database):
+        queue.submit(SOURCE)
+        first = FakePlugin()
+        worker = Worker(queue, database, lambda url: first, owner="first")
+        for _ in range(3): # the index and two chapters
+            worker.run_once()
+        abandoned = queue.claim("crashed", lease=-1) # its worker died, the lease is already expired
+        assert abandoned.url == LINKS[2]
+        second = FakePlugin()
+        Worker(queue, database, lambda url: second, owner="second").run()
+        assert first.fetched == LINKS[:2] and second.fetched == LINKS[2:]
+        assert stored_links(database) == LINKS
+        queue.submit(SOURCE) # a finished job is fetched again from scratch
+        assert queue.status(SOURCE) == {"pending": 2}
+
+    def test_failed_job_resumed(self, queue, database):
+        queue.submit(SOURCE)
+        Worker(queue, database, lambda url: FakePlugin(failing=[LINKS[3]])).run()
+        assert queue.job_state(SOURCE) == "failed"
+        assert queue.status(SOURCE) == {"done": 5, "failed": 1, "pending": 1}
+        queue.submit(SOURCE)
+        plugin = FakePlugin()
+        Worker(queue, database, lambda url: plugin).run()
+        assert plugin.fetched == [LINKS[3]]
+        assert stored_links(database) == LINKS
+
+    def test_worker_processes(self, tmp_path):
+        queue_path, database_path = str(tmp_path / "jobs.sqlite"), str(tmp_path / "novels.sqlite")
+        queue = JobQueue(queue_path)
+        queue.submit(SOURCE)
+        assert sum(run_workers(queue_path, database_path, processes=2, get_plugin=fake_plugin)) == 7
+        assert queue.job_state(SOURCE) == "done"
+        queue.close()
+        database = SQLiteDatabase(database_path)
+        assert stored_links(database) == LINKS
+        database.close()
@@ -0,0 +1,127 @@
+import os
+import stat
+from pathlib import Path
+
+import pytest
+
+from webNovelManager.data.format import LoginInfo
+from webNovelManager.plugins.accounts import AccountPool
+from webNovelManager.plugins.cookies import CookieStore
+from webNovelManager.plugins.replay import Cassette, Interaction, ReplayAdapter, open_cassette
+from webNovelManager.plugins.syosetu import Syosetu
+
+
+CORPUS = Path(__file__).parent / "fixtures" / "replay" / "syosetu"
+ACCOUNT = LoginInfo(login="corpus", password="corpus")
+
+
+def replaying(plugin, adapter):
+    plugin.use_transport(adapter)
+    plugin.session.cache = None
+    return plugin
+
+
+class ExpiringServer(ReplayAdapter):
+    """
+    a server accepting only the session of its last login, the favorites redirect to the login form otherwise
+    """
+    def __init__(self, tmp_path):
+        super().__init__(Cassette(str(tmp_path / "none.jsonl")))
+        self.logins = 0
+        self.accepting = True # False: the logins succeed but the favorites are never shown
+
+    def send(self, request, **kwargs):
+        if request.method == "POST":
+            self.logins += 1
+            return self.build_response(request, Interaction(
+                method="POST", url=request.url, status_code=200, body="", body_base64=None,
+                headers=[("Set-Cookie", "userl=corpus; Domain=.syosetu.com; Path=/"),
+                         ("Set-Cookie", f"ses=login{self.logins}; Domain=.syosetu.com; Path=/")]))
+        if self.accepting and f"ses=login{self.logins}" in request.headers.get("Cookie", ""):
+            return self.build_response(request, Interaction(method="GET", url=request.url, status_code=200,
+                                                            headers=[], body="favorites", body_base64=None))
+        if "/login/" in request.url:
+            return self.build_response(request, Interaction(method="GET", url=request.url, status_code=200,
+                                                            headers=[], body="login form", body_base64=None))
+        return self.build_response(request, Interaction(
+            method="GET", url=request.url, status_code=302, body="", body_base64=None,
+            headers=[("Location", "https://ssl.syosetu.com/login/input/")]))
+
+
+class Test_CookieStore():
+    def test_login_is_saved_and_reused(self, tmp_path):
+        store = CookieStore(str(tmp_path))
+        adapter = open_cassette(str(CORPUS / "favorites.jsonl"))
+        plugin = replaying(Syosetu(credentials=ACCOUNT, cookie_store=store), adapter)
+        assert plugin.ensure_logged() and adapter.replayed == 1
+        files = [name for name in os.listdir(tmp_path) if name.endswith(".json")]
+        assert len(files) == 1 and "corpus" not in files[0]
+        assert stat.S_IMODE(os.stat(tmp_path / files[0]).st_mode) == 0o600
+        # another process: the saved cookies are used instead of posting the credentials
+        adapter = open_cassette(str(CORPUS / "favorites.jsonl"))
+        plugin = replaying(Syosetu(credentials=ACCOUNT, cookie_store=store), adapter)
+        assert plugin.ensure_logged() and plugin.is_logged() and adapter.replayed == 0
+
+    def test_relogin_when_rejected(self, tmp_path):
+        store = CookieStore(str(tmp_path))
+        server = ExpiringServer(tmp_path)
+        plugin = replaying(Syosetu(credentials=ACCOUNT, cookie_store=store), server)
+        assert plugin.ensure_logged() and server.logins == 1
+        server.logins += 1 # the server forgets the session
+        plugin = replaying(Syosetu(credentials=ACCOUNT, cookie_store=store), server)
+        assert plugin.ensure_logged() and server.logins == 2 # the saved cookies are trusted
+        assert not plugin.check_session()
+        assert plugin._get_logged_page(Syosetu.__FAVORITE_SUBDOMAIN__["ncode"]).text == "favorites"
+        assert server.logins == 3
+        assert store.load("Syosetu", "corpus")["ses"] == "login3"
+
+
+    def test_relogin_despite_new_cookies(self, tmp_path):
+        store = CookieStore(str(tmp_path))
+        server = ExpiringServer(tmp_path)
+        plugin = replaying(Syosetu(credentials=ACCOUNT, cookie_store=store), server)
+        assert plugin.ensure_logged() and server.logins == 1
+        plugin.session.cookies.set("tracking", "1", domain=".syosetu.com") # set after the login, never saved
+        server.logins += 1
+        assert plugin._get_logged_page(Syosetu.__FAVORITE_SUBDOMAIN__["ncode"]).text == "favorites"
+        assert server.logins == 3
+
+    def test_still_rejected(self, tmp_path):
+        server = ExpiringServer(tmp_path)
+        plugin = replaying(Syosetu(credentials=ACCOUNT, cookie_store=CookieStore(str(tmp_path))), server)
+        assert plugin.ensure_logged()
+        server.accepting = False
+        with pytest.raises(PermissionError):
+            plugin._get_logged_page(Syosetu.__FAVORITE_SUBDOMAIN__["ncode"])
+        assert plugin._get_favorite_page("ncode") is None and server.logins == 3
+
+class Test_AccountPool():
+    def test_accounts_in_parallel(self, tmp_path):
+        store = CookieStore(str(tmp_path))
+        accounts = [LoginInfo(login="first", password="corpus"), LoginInfo(login="second", password="corpus")]
+        pool = AccountPool(Syosetu, accounts=accounts, cookie_store=store)
+        for plugin in pool.plugins.values():
+            replaying(plugin, open_cassette(str(CORPUS / "favorites.jsonl")))
+        novels = pool.fetch_novels(max_workers=2)
+        assert {login: {subdomain: len(section) for subdomain, section in favorites.items()}
+                for login, favorites in novels.items()} == \
+               {"first": {"ncode": 150, "novel18": 150}, "second": {"ncode": 150, "novel18": 150}}
+        assert len([name for name in os.listdir(tmp_path) if name.endswith(".json")]) == 2
+        with pool.acquire() as plugin:
+            assert plugin.is_logged()
+
+    def test_map_borrows_the_plugins(self, tmp_path):
+        accounts = [LoginInfo(login=login, password="corpus") for login in ("first", "second", "third")]
+        pool = AccountPool(Syosetu, accounts=accounts, cookie_store=CookieStore(str(tmp_path)))
+        for plugin in pool.plugins.values():
+            plugin.ensure_logged = lambda validate=False: True
+
+        def crawl(plugin):
+            with pool.acquire(timeout=1) as other: # the plugin being crawled is never lent meanwhile
+                assert other is not plugin
+            return None if plugin.credentials["login"] == "second" else plugin.credentials["login"]
+
+        assert pool.map(crawl, max_workers=1) == {"first": "first", "second": None, "third": "third"}
+        # an account which can't log in is left out, not one whose result is None
+        pool.plugins["third"].ensure_logged = lambda validate=False: False
+        assert pool.map(lambda plugin: None, max_workers=1) == {"first": None, "second": None}
@@ -0,0 +1,93 @@
+import requests
+from requests.adapters import BaseAdapter
+
+from webNovelManager.plugins.cache import ResponseCache
+from webNovelManager.plugins.session import PluginSession
+
+
+class ETagAdapter(BaseAdapter):
+    """
+    answer every request with the same page and its ETag, or 304 when the client already has it
+    """
+    def __init__(self, headers=None, content="本文".encode("utf-8")):
+        super().__init__()
+        self.requests = []
+        self.headers = {"Content-Type": "text/html; charset=utf-8", **(headers or {})}
+        self.content = content
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.headers["ETag"] = '"v1"'
+        response.headers.update(self.headers)
+        if request.headers.get("If-None-Match") == '"v1"':
+            response.status_code = 304
+            response._content = b""
+        else:
+            response.status_code = 200
+            response._content = self.content
+            response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
+
+
+def make_session(cache, **kwargs):
+    session = PluginSession(cache)
+    adapter = ETagAdapter(**kwargs)
+    session.mount("https://", adapter)
+    return session, adapter
+
+
+class Test_Cache():
+    URL = "https://ncode.syosetu.com/n0000aa/"
+
+    def test_memory(self):
+        session, adapter = make_session(ResponseCache(memory_size=4))
+        assert session.get(self.URL).text == "本文"
+        assert session.get(self.URL).text == "本文"
+        assert len(adapter.requests) == 1
+
+        session.cookies["over18"] = "yes"
+        session.get(self.URL)
+        assert len(adapter.requests) == 2
+
+    def test_cache_control(self, tmp_path):
+        cases = [({"Cache-Control": "no-store"}, 2), ({"Cache-Control": "max-age=0"}, 2),
+                 ({"Cache-Control": "private, max-age=60"}, 1), ({"Content-Type": "image/png"}, 2),
+                 ({"Expires": "Thu, 01 Dec 1994 16:00:00 GMT"}, 2)]
+        for number, (headers, requests_sent) in enumerate(cases):
+            session, adapter = make_session(ResponseCache(str(tmp_path / str(number))), headers=headers)
+            session.get(self.URL)
+            session.get(self.URL)
+            assert len(adapter.requests) == requests_sent, headers
+        # a response marked no-store isn't stored on disk either
+        assert adapter.requests[1].headers.get("If-None-Match") == '"v1"'
+        session, adapter = make_session(ResponseCache(str(tmp_path / "no-store")), headers={"Cache-Control": "no-store"})
+        session.get(self.URL)
+        session.get(self.URL)
+        assert adapter.requests[1].headers.get("If-None-Match") is None
+
+    def test_memory_bytes(self):
+        cache = ResponseCache(memory_bytes=1000)
+        session, adapter = make_session(cache, content=b"x" * 400)
+        for page in range(3):
+            session.get(f"{self.URL}{page}/")
+        session.get(f"{self.URL}0/") # dropped for the third page
+        session.get(f"{self.URL}2/")
+        assert len(adapter.requests) == 4
+
+    def test_revalidation(self, tmp_path):
+        session, adapter = make_session(ResponseCache(str(tmp_path), memory_size=0))
+        session.get(self.URL)
+        response = session.get(self.URL)
+        assert response.text == "本文" and response.status_code == 200
+        assert [request.headers.get("If-None-Match") for request in adapter.requests] == [None, '"v1"']
+
+        # another process sharing the cache directory
+        other_session, other_adapter = make_session(ResponseCache(str(tmp_path)))
+        assert other_session.get(self.URL).text == "本文"
+        assert other_adapter.requests[0].headers["If-None-Match"] == '"v1"'
@@ -0,0 +1,47 @@
+import difflib
+import random
+
+import pytest
+
+from webNovelManager.plugins.diff import diff_chapters, get_opcodes, matching_blocks
+from webNovelManager.plugins.functions import is_there_a_diff
+
+
+def apply(a, b, opcodes):
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            result += a[i1:i2]
+        else:
+            result += b[j1:j2]
+    return result
+
+
+class Test_Diff():
+    @pytest.mark.parametrize("seed", range(30))
+    def test_random(self, seed):
+        generator = random.Random(seed)
+        a = [generator.randint(0, 8) for _ in range(generator.randint(0, 60))]
+        b = list(a)
+        for _ in range(generator.randint(0, 10)):
+            position = generator.randint(0, len(b))
+            if generator.random() < 0.5 and b:
+                del b[min(position, len(b) - 1)]
+            else:
+                b.insert(position, generator.randint(0, 12))
+        opcodes = get_opcodes(a, b)
+        assert apply(a, b, opcodes) == b
+        # a longest common subsequence is at least as long as difflib's heuristic one
+        matched = sum(size for _, _, size in matching_blocks(a, b))
+        assert matched >= sum(size for _, _, size in difflib.SequenceMatcher(None, a, b, autojunk=False).get_matching_blocks())
+
+    def test_chapter(self):
+        old = "\n".join(f"line {index}" for index in range(1000))
+        new = old.replace("line 500", "line five hundred").replace("line 10\n", "")
+        chapter_diff = diff_chapters(old, new)
+        assert chapter_diff.changes() == [("delete", 10, 11, 10, 10), ("replace", 500, 501, 499, 500)]
+        assert not diff_chapters(old, old).changed and diff_chapters(old, old).html() is None
+        assert not diff_chapters("a", "b", old_hash="h", new_hash="h").changed
+        assert is_there_a_diff(old, new)[0] and "five&nbsp;hundred" in is_there_a_diff(old, new)[1]
+        assert is_there_a_diff("a\nb", "a\nb\n") == (False, None)
@@ -0,0 +1,24 @@
+import pytest
+
+from webNovelManager.plugins.functions import resolve_host, resolve_url
+
+
+class Test_Resolve_Url():
+    def test_known_domain_fast_path(self):
+        result = resolve_url("https://ncode.syosetu.com/n1234ab/5/")
+        assert (result.subdomain, result.domain, result.suffix) == ("ncode", "syosetu", "com")
+        assert result.fqdn == "ncode.syosetu.com"
+        assert resolve_url("https://syosetu.com/favnovelmain/list/").subdomain == ""
+
+    def test_snapshot_and_cache(self):
+        result = resolve_url("http://forums.news.cnn.co.uk:8080/a?b=c")
+        assert (result.subdomain, result.domain, result.suffix) == ("forums.news", "cnn", "co.uk")
+        hits = resolve_host.cache_info().hits
+        resolve_url("https://forums.news.cnn.co.uk/other")
+        assert resolve_host.cache_info().hits == hits + 1
+
+    @pytest.mark.parametrize("url", ["ncode.syosetu.com/n1234ab", "ftp://syosetu.com", "https://local host/",
+                                     "https://localhost/", "not an url", "http://[::1/"])
+    def test_invalid(self, url):
+        with pytest.raises(TypeError):
+            resolve_url(url)
@@ -0,0 +1,64 @@
+import pstats
+
+import pytest
+
+from webNovelManager.plugins.cache import ResponseCache
+from webNovelManager.plugins.metrics import Metrics, get_metrics, profiled, timed
+from tests.plugin.test_replay import replaying_plugin
+
+
+CHAPTER = "https://ncode.syosetu.com/n0002aa/1/"
+
+
+@pytest.fixture
+def metrics():
+    metrics = get_metrics()
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+class Test_Metrics():
+    def test_prometheus_format(self):
+        metrics = Metrics()
+        metrics.increment("webnovel_http_response_bytes_total", 512, host="ncode.syosetu.com")
+        for seconds in (0.003, 0.2, 20):
+            metrics.observe("webnovel_stage_duration_seconds", seconds, stage='a"b')
+        dump = metrics.to_prometheus()
+        assert '# TYPE webnovel_http_response_bytes_total counter' in dump
+        assert 'webnovel_http_response_bytes_total{host="ncode.syosetu.com"} 512' in dump
+        assert 'webnovel_stage_duration_seconds_bucket{stage="a\\"b",le="0.005"} 1' in dump
+        assert 'webnovel_stage_duration_seconds_bucket{stage="a\\"b",le="0.25"} 2' in dump
+        assert 'webnovel_stage_duration_seconds_bucket{stage="a\\"b",le="+Inf"} 3' in dump
+        assert 'webnovel_stage_duration_seconds_count{stage="a\\"b"} 3' in dump
+        assert metrics.histogram("webnovel_stage_duration_seconds", stage='a"b').quantile(0.5) == 0.25
+
+    def test_timed(self, metrics):
+        @timed("failing")
+        def failing():
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            failing()
+        assert metrics.counter("webnovel_stage_errors_total", stage="failing") == 1
+        assert metrics.histogram("webnovel_stage_duration_seconds", stage="failing").count == 1
+
+    def test_plugin_requests_and_stages(self, metrics):
+        plugin = replaying_plugin("long_serial")
+        plugin.session.cache = ResponseCache()
+        plugin.fetch_chapter(CHAPTER)
+        plugin.fetch_chapter(CHAPTER)
+        histogram = metrics.histogram("webnovel_http_request_duration_seconds", method="GET", host="ncode.syosetu.com", status="200")
+        assert histogram.count == 2
+        assert metrics.counter("webnovel_cache_requests_total", cache="miss") == 1
+        assert metrics.counter("webnovel_http_response_bytes_total", host="ncode.syosetu.com") > 0
+        assert metrics.histogram("webnovel_stage_duration_seconds", stage="Syosetu._parse_chapter").count == 2
+        assert metrics.histogram("webnovel_stage_duration_seconds", stage="Syosetu._fetch_chapter").count == 2
+
+    def test_profiled(self, tmp_path):
+        with profiled(None) as profiler:
+            assert profiler is None
+        path = str(tmp_path / "run.prof")
+        with profiled(path) as profiler:
+            sorted(range(1000))
+        assert pstats.Stats(path).total_calls > 0
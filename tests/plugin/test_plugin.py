@@ -1,4 +1,5 @@
 from webNovelManager.plugins.syosetu import Syosetu, _find_novel_info_page
+from pathlib import Path
 import pytest
 
 
@@ -48,4 +49,118 @@ class Test_Syosetu():
 
     def test_artefact(self):
         random_chapter_with_image = self.plugin_instance.fetch_chapter('https://ncode.syosetu.com/n9534hf/72/')
-        assert len(random_chapter_with_image['artefact'])>0
\ No newline at end of file
+        assert len(random_chapter_with_image['artefact'])>0
+
+class Test_Concurrent_Fetch():
+    INDEX_PAGE = """<html><body><div class="index_box">
+    <div class="chapter_title">第一章</div>
+    <dl class="novel_sublist2"><dd class="subtitle"><a href="/n0000aa/1/">1</a></dd></dl>
+    <dl class="novel_sublist2"><dd class="subtitle"><a href="/n0000aa/2/">2</a></dd></dl>
+    <div class="chapter_title">第二章</div>
+    <dl class="novel_sublist2"><dd class="subtitle"><a href="/n0000aa/3/">3</a></dd></dl>
+    <dl class="novel_sublist2"><dd class="subtitle"><a href="/n0000aa/4/">4</a></dd></dl>
+    <dl class="novel_sublist2"><dd class="subtitle"><a href="/n0000aa/5/">5</a></dd></dl>
+    </div></body></html>"""
+
+    def test_order_is_kept(self, monkeypatch):
+        import random
+        import time
+        from bs4 import BeautifulSoup
+
+        plugin = Syosetu()
+
+        def fake_fetch_chapter(link):
+            time.sleep(random.random() / 100)
+            return {"source": link}
+
+        monkeypatch.setattr(plugin, "_fetch_chapter", fake_fetch_chapter)
+        arcs = plugin._parse_index(BeautifulSoup(self.INDEX_PAGE, "lxml"), "ncode.syosetu.com")
+        links = [entry["link"] for arc in arcs for entry in arc["chapters"]]
+        assert [arc["arc_title"] for arc in arcs] == ["第一章", "第二章"]
+        assert plugin._fetch_chapters(links, max_workers=4) == [{"source": link} for link in links]
+        assert plugin._fetch_chapters(links, max_workers=1) == [{"source": link} for link in links]
+
+    def test_stream_and_novel(self, monkeypatch):
+        from bs4 import BeautifulSoup
+
+        plugin = Syosetu()
+        index = plugin._parse_index(BeautifulSoup(self.INDEX_PAGE, "lxml"), "ncode.syosetu.com")
+        monkeypatch.setattr(plugin, "fetch_index", lambda novel_link: index)
+        monkeypatch.setattr(plugin, "_fetch_chapter", lambda link: {"source": link})
+
+        stream = plugin.iter_chapters("https://ncode.syosetu.com/n0000aa/", max_workers=2)
+        assert [(arc["arc_id"], chapter["source"][-2]) for arc, chapter in stream] == \
+               [(0, "1"), (0, "2"), (1, "3"), (1, "4"), (1, "5")]
+
+        novel = plugin.fetch_novel("https://ncode.syosetu.com/n0000aa/", max_workers=2)
+        assert [(arc["arc_title"], len(arc["chapters"])) for arc in novel["chapters"]] == [("第一章", 2), ("第二章", 3)]
+
+        # an arc without chapter is kept
+        index.insert(1, {"arc_id": 2, "arc_title": "幕間", "chapters": []})
+        novel = plugin.fetch_novel("https://ncode.syosetu.com/n0000aa/", max_workers=2)
+        assert [(arc["arc_title"], len(arc["chapters"])) for arc in novel["chapters"]] == \
+               [("第一章", 2), ("幕間", 0), ("第二章", 3)]
+
+
+class Test_Chapter_Parsing():
+    FIXTURES = sorted((Path(__file__).parent / "fixtures" / "syosetu").glob("chapter_*.html"))
+
+    @pytest.mark.parametrize("fixture", FIXTURES, ids=lambda path: path.stem)
+    def test_same_as_soup(self, fixture, monkeypatch):
+        plugin = Syosetu()
+        monkeypatch.setattr(plugin, "_download_artefacts", lambda images: dict(images))
+        html = fixture.read_text(encoding="utf-8")
+
+        chapter_soup = plugin._parse_chapter_html(html)
+        expected = {
+            "language": "jp",
+            "id": chapter_soup.find("div", id="novel_no").text.split("/")[0],
+            "source": "link",
+            "raw_content": chapter_soup.text,
+            "artefact": plugin._resolve_artefact(chapter_soup),
+            "title": chapter_soup.find("p", {"class": "novel_subtitle"}).text,
+        }
+        assert plugin._parse_chapter("link", html) == expected
+
+
+class Test_Favorites_Crawl():
+    FAVORITES = {"ncode": "https://syosetu.com/favnovelmain/list/", "novel18": "https://syosetu.com/favnovelmain18/list/"}
+    NOVEL = """<table class="favnovel"><tr><td class="info">
+    <a class="title" href="https://{subdomain}.syosetu.com/{ncode}/">{ncode}</a>
+    <span class="fn_name">（作者）</span>
+    <p>\n最新掲載日：2022/01/0{day} 10:00\n</p></td></tr></table>"""
+
+    def make_pages(self):
+        pages = {}
+        for subdomain, favorite in self.FAVORITES.items():
+            categories = "".join(f'<li><a href="/{subdomain}/{category}/">c</a></li>' for category in range(2))
+            pages[favorite] = f'<html><body><ul class="category_box">{categories}</ul></body></html>'
+            for category in range(2):
+                for page in range(12): # more than the former cap of 10 pages
+                    link = f"{favorite}?nowcategory={category}&p={page}" if page else f"https://syosetu.com/{subdomain}/{category}/"
+                    # the last page links back to the second one, the crawl must stop anyway
+                    next_page = f'<a title="next page" href="?nowcategory={category}&p={page + 1 if page < 11 else 1}">次</a>'
+                    novel = self.NOVEL.format(subdomain=subdomain, ncode=f"n{category}{page:02d}aa", day=page % 9 + 1)
+                    pages[link] = f"<html><body>{novel}{next_page}</body></html>"
+        return pages
+
+    def test_crawl(self, monkeypatch):
+        import requests
+
+        pages = self.make_pages()
+
+        def fake_get(url, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            response._content = pages[url].encode("utf-8")
+            response.encoding = "utf-8"
+            return response
+
+        plugin = Syosetu()
+        monkeypatch.setattr(plugin.session, "get", fake_get)
+        novels = plugin.fetch_novels(max_workers=4)
+        assert [novel["ref"].split("/")[-2] for novel in novels["ncode"]] == \
+               [f"n{category}{page:02d}aa" for category in range(2) for page in range(12)]
+        assert len(novels["novel18"]) == 24
+        assert sorted(novel["ref"] for _, novel in plugin.iter_novels(max_workers=4)) == \
+               sorted(novel["ref"] for section in novels.values() for novel in section)
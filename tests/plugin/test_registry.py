@@ -0,0 +1,38 @@
+import sys
+
+from webNovelManager.plugins import registry as registry_module
+from webNovelManager.plugins.plugins import WebsitePlugin
+from webNovelManager.plugins.registry import PluginRegistry, PluginSpec, get_registry
+
+
+class Test_Registry():
+    def test_route_without_import(self):
+        registry = PluginRegistry([PluginSpec("example", "tests.plugin.not_a_module", "Example", ["books"])])
+        routed, unhandled = registry.route(["https://books.example.com/1", "https://www.example.co.uk/2",
+                                            "https://other.org/3", "not an url"])
+        assert routed == {"example": ["https://books.example.com/1", "https://www.example.co.uk/2"]}
+        assert unhandled == ["https://other.org/3", "not an url"]
+
+    def test_subdomain_precedence_and_registration(self, monkeypatch):
+        # the classes below register themselves in the registry of the process, replaced for the test
+        monkeypatch.setattr(registry_module, "__REGISTRY__", PluginRegistry())
+        registry = PluginRegistry([])
+
+        class Whole(WebsitePlugin):
+            _DOMAIN_ = "example"
+
+        class Books(WebsitePlugin):
+            _DOMAIN_ = "example"
+            _SUBDOMAIN_ = "books"
+
+        registry.register(Whole)
+        registry.register(Books)
+        assert registry.find_plugin_class("https://books.example.com/1") is Books
+        assert registry.find_plugin_class("https://www.example.com/1") is Whole
+        assert get_registry().find_plugin_class("https://books.example.com/1") is Books
+        assert registry.get_plugin("https://example.com") is registry.get_plugin("https://www.example.com/x")
+
+    def test_bundled_plugin_is_lazy(self):
+        spec = get_registry().find_spec("https://ncode.syosetu.com/n0000a/")
+        assert spec.domain == "syosetu" and spec.class_name == "Syosetu"
+        assert spec.load() is sys.modules["webNovelManager.plugins.syosetu"].Syosetu
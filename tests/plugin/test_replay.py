@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+import requests
+
+from webNovelManager.data.format import LoginInfo
+from webNovelManager.database.artefact import ArtefactStore
+from webNovelManager.plugins.replay import Cassette, ReplayAdapter, open_cassette
+from webNovelManager.plugins.syosetu import Syosetu
+
+
+CORPUS = Path(__file__).parent / "fixtures" / "replay" / "syosetu"
+
+
+def replaying_plugin(scenario, **kwargs):
+    plugin = Syosetu(**kwargs)
+    plugin.use_transport(open_cassette(str(CORPUS / f"{scenario}.jsonl")))
+    plugin.session.cache = None
+    plugin._get_credentials = lambda: LoginInfo(login="corpus", password="corpus")
+    return plugin
+
+
+class Test_Replay():
+    def test_single_chapter(self):
+        novel = replaying_plugin("single_chapter").fetch_novel("https://ncode.syosetu.com/n0001aa/")
+        assert len(novel["chapters"]) == 1 and novel["chapters"][0]["title"] == "第1話"
+
+    def test_long_serial(self):
+        novel = replaying_plugin("long_serial").fetch_novel("https://ncode.syosetu.com/n0002aa/", max_workers=4)
+        assert [(arc["arc_title"], len(arc["chapters"])) for arc in novel["chapters"]] == \
+               [("第1章", 20), ("第2章", 20), ("第3章", 20)]
+        assert [chapter["id"] for arc in novel["chapters"] for chapter in arc["chapters"]] == \
+               [str(number) for number in range(1, 61)]
+
+    def test_illustrated(self, tmp_path):
+        plugin = replaying_plugin("illustrated", artefact_store=ArtefactStore(str(tmp_path)))
+        chapter = plugin.fetch_chapter("https://ncode.syosetu.com/n0003aa/1/")
+        assert len(chapter["artefact"]) == 2
+        for reference in chapter["artefact"].values():
+            assert plugin.artefact_store.get(reference["sha256"]).startswith(b"\x89PNG")
+            assert reference["media_type"] == "image/png"
+
+    def test_favorites(self):
+        plugin = replaying_plugin("favorites")
+        assert plugin.login() and plugin.is_logged() # the recorded cookies are set
+        novels = plugin.fetch_novels(max_workers=4)
+        assert {subdomain: len(section) for subdomain, section in novels.items()} == {"ncode": 150, "novel18": 150}
+
+    def test_novel_info(self):
+        info = replaying_plugin("novel_info").get_novel_info("https://ncode.syosetu.com/n0002aa/")
+        assert info["ncode"] == "N0002AA" and info["tags"] == ["R15", "異世界転生", "ファンタジー"]
+
+    def test_missing_url(self):
+        with pytest.raises(requests.ConnectionError):
+            replaying_plugin("single_chapter").fetch_chapter("https://ncode.syosetu.com/n9999zz/")
+
+
+class Test_Record():
+    class Network(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            response.headers["Content-Type"] = "application/octet-stream"
+            response._content = request.url.encode("utf-8") + b"\xff"
+            response.url = request.url
+            response.request = request
+            return response
+
+    def test_record_then_replay(self, tmp_path):
+        path = str(tmp_path / "cassette.jsonl")
+        session = requests.Session()
+        session.mount("https://", ReplayAdapter(Cassette(path), mode="record", network_adapter=self.Network()))
+        assert session.get("https://example.com/a").content == b"https://example.com/a\xff"
+
+        session = requests.Session()
+        session.mount("https://", open_cassette(path))
+        response = session.get("https://example.com/a", stream=True)
+        assert b"".join(response.iter_content(4)) == b"https://example.com/a\xff"
+        assert response.headers["Content-Type"] == "application/octet-stream"
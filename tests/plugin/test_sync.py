@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from webNovelManager.plugins.plugins import WebsitePlugin
+from webNovelManager.plugins.sync import ManifestStore, NovelSynchronizer
+
+
+class FakePlugin(WebsitePlugin):
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+        self.contents = {}
+        self.fetched = []
+
+    def fetch_index(self, novel_link):
+        self.fetched.append(novel_link)
+        return self.index
+
+    def _fetch_chapter(self, link):
+        self.fetched.append(link)
+        return {"id": link.rsplit("/", 1)[-1], "source": link, "raw_content": self.contents[link]}
+
+
+class Test_Sync():
+    SOURCE = "https://ncode.syosetu.com/n0000aa/"
+
+    def _short(self, day):
+        return {"title": "t", "author": "a", "ref": self.SOURCE, "last_modified": datetime(2022, 1, day)}
+
+    def test_incremental(self, tmp_path):
+        index = [{"arc_id": 0, "chapters": [
+            {"link": f"{self.SOURCE}1", "update": "2022/01/01"},
+            {"link": f"{self.SOURCE}2", "update": "2022/01/01"},
+        ]}]
+        plugin = FakePlugin(index)
+        plugin.contents = {f"{self.SOURCE}1": "one", f"{self.SOURCE}2": "two", f"{self.SOURCE}3": "three"}
+        synchronizer = NovelSynchronizer(plugin, ManifestStore(str(tmp_path)))
+
+        report = synchronizer.sync_novel(self._short(1), max_workers=1)
+        assert len(report["new"]) == 2 and not report["skipped"]
+
+        plugin.fetched = []
+        assert synchronizer.sync_novel(self._short(1))["skipped"]
+        assert plugin.fetched == []
+
+        index[0]["chapters"][1]["update"] = "2022/01/01 2022/01/02 改稿"
+        index[0]["chapters"].append({"link": f"{self.SOURCE}3", "update": "2022/01/02"})
+        plugin.contents[f"{self.SOURCE}2"] = "two revised"
+        report = synchronizer.sync_novel(self._short(2), max_workers=1)
+        assert plugin.fetched == [self.SOURCE, f"{self.SOURCE}2", f"{self.SOURCE}3"]
+        assert [chapter["source"] for chapter in report["new"]] == [f"{self.SOURCE}3"]
+        assert [chapter["source"] for chapter in report["changed"]] == [f"{self.SOURCE}2"]
+        assert report["arcs"] == {f"{self.SOURCE}2": {"arc_id": 0}, f"{self.SOURCE}3": {"arc_id": 0}}
+
+    def test_downloaded_index(self, tmp_path):
+        plugin = FakePlugin([])
+        plugin.contents = {f"{self.SOURCE}1": "one"}
+        synchronizer = NovelSynchronizer(plugin, ManifestStore(str(tmp_path)))
+        arcs = [{"arc_id": 0, "chapters": [{"link": f"{self.SOURCE}1", "update": "2022/01/01"}]}]
+        report = synchronizer.sync_novel(self._short(1), max_workers=1, arcs=arcs)
+        assert len(report["new"]) == 1 and plugin.fetched == [f"{self.SOURCE}1"]
@@ -0,0 +1,89 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+import json
+import threading
+
+import pytest
+
+from webNovelManager.plugins.replay import open_cassette
+from webNovelManager.plugins.syosetu import Syosetu
+
+
+API_NOVELS = {
+    "novelapi": {
+        "N0001AA": {"title": "短編", "ncode": "N0001AA", "writer": "作者", "story": "あらすじ\nです。",
+                    "keyword": "ファンタジー 冒険", "noveltype": 2, "isr15": 0, "iszankoku": 1},
+    },
+    "novel18api": {
+        "N0003BB": {"title": "連載", "ncode": "N0003BB", "writer": "作者18", "story": "あらすじ",
+                    "keyword": "R15 恋愛", "noveltype": 1, "isr15": 1},
+    },
+}
+
+
+class StubApi(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        type(self).requests.append((url.path, query))
+        novels = API_NOVELS[url.path.split("/")[1]]
+        found = [novels[ncode.upper()] for ncode in query["ncode"][0].split("-") if ncode.upper() in novels]
+        body = json.dumps([{"allcount": len(found)}] + found).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubApi)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubApi.requests = []
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class Test_Novel_Api():
+    def test_batch_and_fallback(self, api_server):
+        plugin = Syosetu()
+        plugin.session.scheduler = None
+        plugin.session.cache = None
+        plugin._API_ = {"ncode": f"{api_server}/novelapi/api/", "novel18": f"{api_server}/novel18api/api/"}
+        # the novel unknown to the API is scraped from the recorded pages
+        plugin.session.mount("https://ncode.syosetu.com",
+                             open_cassette(str(Path(__file__).parent / "fixtures" / "replay" / "syosetu" / "novel_info.jsonl")))
+
+        links = ["https://ncode.syosetu.com/n0001aa/", "https://ncode.syosetu.com/n0002aa/",
+                 "https://novel18.syosetu.com/n0003bb/", "https://ncode.syosetu.com/N0001AA"]
+        novels_info = plugin.get_novels_info(links)
+
+        assert sorted(path for path, _ in StubApi.requests) == ["/novel18api/api/", "/novelapi/api/"]
+        assert [query["ncode"][0] for path, query in StubApi.requests if path == "/novelapi/api/"] == ["n0001aa-n0002aa"]
+        assert novels_info["https://ncode.syosetu.com/n0001aa/"] == {
+            "ncode": "N0001AA", "link": "https://ncode.syosetu.com/n0001aa/", "title": "短編", "age_limit": False,
+            "type": "oneshot", "abstract": "あらすじ\nです。", "author": "作者", "tags": ["残酷な描写あり", "ファンタジー", "冒険"]}
+        assert novels_info["https://ncode.syosetu.com/N0001AA"] is novels_info["https://ncode.syosetu.com/n0001aa/"]
+        assert novels_info["https://novel18.syosetu.com/n0003bb/"]["age_limit"]
+        assert novels_info["https://novel18.syosetu.com/n0003bb/"]["tags"] == ["R15", "恋愛"]
+        assert novels_info["https://ncode.syosetu.com/n0002aa/"]["ncode"] == "N0002AA"
+        assert novels_info["https://ncode.syosetu.com/n0002aa/"]["tags"] == ["R15", "異世界転生", "ファンタジー"]
+
+    def test_batches(self, api_server):
+        plugin = Syosetu()
+        plugin.session.scheduler = None
+        plugin._API_ = {"ncode": f"{api_server}/novelapi/api/"}
+        plugin._API_BATCH_SIZE_ = 2
+        plugin._scrape_novel_info = lambda novel_link: {"ncode": "scraped"}
+        links = [f"https://ncode.syosetu.com/n000{index}zz/" for index in range(5)]
+        assert {info["ncode"] for info in plugin.get_novels_info(links).values()} == {"scraped"}
+        assert len(StubApi.requests) == 3
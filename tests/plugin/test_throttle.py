@@ -0,0 +1,83 @@
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from webNovelManager.plugins.session import PluginSession
+from webNovelManager.plugins.throttle import DomainScheduler, TokenBucket, parse_retry_after
+
+
+class FlakyAdapter(BaseAdapter):
+    """
+    answer with the given statuses in turn, or raise the given errors
+    """
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        if isinstance(self.statuses[0], Exception):
+            raise self.statuses.pop(0)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.status_code = self.statuses.pop(0)
+        response._content = b""
+        if response.status_code == 429:
+            response.headers["Retry-After"] = "0"
+        return response
+
+    def close(self):
+        pass
+
+
+def make_session(statuses, **kwargs):
+    session = PluginSession(scheduler=DomainScheduler("test", rate=100, base_backoff=0.001, **kwargs))
+    adapter = FlakyAdapter(statuses)
+    session.mount("https://", adapter)
+    return session, adapter
+
+
+class Test_Throttle():
+    URL = "https://ncode.syosetu.com/n0000aa/"
+
+    def test_retry_and_slow_down(self):
+        session, adapter = make_session([429, 503, 200])
+        assert session.get(self.URL).status_code == 200
+        assert adapter.sent == 3
+        assert session.scheduler.rate < 100
+
+    def test_give_up(self):
+        session, adapter = make_session([503, 503, 503], max_retries=2)
+        assert session.get(self.URL).status_code == 503
+        assert adapter.sent == 3
+
+    def test_post_not_sent_twice(self):
+        session, adapter = make_session([requests.ReadTimeout("read"), 200])
+        with pytest.raises(requests.ReadTimeout):
+            session.post(self.URL, {"pass": "secret"})
+        assert adapter.sent == 1
+        session, adapter = make_session([503, 200])
+        assert session.post(self.URL).status_code == 503 and adapter.sent == 1
+        # the server didn't get it, or asked to send it again later
+        session, adapter = make_session([requests.ConnectTimeout("connect"), 429, 200])
+        assert session.post(self.URL).status_code == 200 and adapter.sent == 3
+        session, adapter = make_session([requests.ReadTimeout("read"), 503, 200])
+        assert session.get(self.URL).status_code == 200 and adapter.sent == 3
+
+    def test_speed_up(self):
+        session, _ = make_session([200] * 10, max_rate=100.2)
+        for _ in range(10):
+            session.get(self.URL)
+        assert session.scheduler.rate == 100.2
+
+    def test_bucket(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert [bucket.reserve() for _ in range(2)] == [0, 0]
+        assert 0.05 < bucket.reserve() <= 0.1
+
+    def test_retry_after(self):
+        assert parse_retry_after("120") == 120
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+        assert parse_retry_after("soon") is None
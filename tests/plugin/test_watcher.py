@@ -0,0 +1,129 @@
+from datetime import datetime
+import asyncio
+
+import pytest
+
+from webNovelManager.plugins.plugins import WebsitePlugin
+from webNovelManager.plugins.watcher import UpdateWatcher, WatchedNovel, WatchStore
+
+
+DAY = 86400.0
+START = 1_700_000_000.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = START
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakePlugin(WebsitePlugin):
+    """
+    two favorites: one updated every period (a day at noon), one which never updates
+    """
+    DAILY = "https://ncode.syosetu.com/n0001aa/"
+    DORMANT = "https://ncode.syosetu.com/n0002aa/"
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.period = DAY
+        self.requests = 0
+        self.down = False
+
+    def updates(self, source):
+        if source == self.DORMANT:
+            return [START - 300 * DAY]
+        return [START + (number + 0.5) * self.period
+                for number in range(-30, int((self.clock() - START) / self.period + 0.5))]
+
+    def fetch_novels(self, max_workers=None):
+        self.requests += 1
+        if self.down: # as Syosetu, the pages failing are logged and listed empty
+            return {"ncode": []}
+        return {"ncode": [{"title": source, "author": "a", "ref": source,
+                           "last_modified": datetime.fromtimestamp(self.updates(source)[-1])}
+                          for source in (self.DAILY, self.DORMANT)]}
+
+    def fetch_index(self, novel_link):
+        self.requests += 1
+        return [{"arc_id": 0, "arc_title": None,
+                 "chapters": [{"link": f"{novel_link}{number}/", "update": None}
+                              for number in range(len(self.updates(novel_link)))]}]
+
+
+@pytest.fixture
+def watched(tmp_path):
+    clock = Clock()
+    plugin = FakePlugin(clock)
+    found = []
+    store = WatchStore(str(tmp_path / "watch.sqlite"))
+    watcher = UpdateWatcher(plugin, lambda novel, arcs: found.append((novel["ref"], clock(), len(arcs[0]["chapters"]))),
+                            store, requests_per_hour=10, delay_per_request=1800, clock=clock, sleep=clock.sleep,
+                            request_counter=lambda: plugin.requests)
+    yield watcher, plugin, clock, found
+    store.close()
+
+
+class Test_Watcher():
+    def test_pace(self):
+        novel = WatchedNovel("n", updates=[START + day * DAY for day in range(8)], checked=START + 7 * DAY)
+        probability, delay = novel.expectations(START + 7.1 * DAY, DAY)
+        assert probability < 0.01 and delay < 60
+        probability, delay = novel.expectations(START + 8.5 * DAY, DAY)
+        assert probability == 1.0 and 0.4 * DAY < delay < 0.6 * DAY
+        # too late on its pace, back to a rate
+        novel.checked = START + 12 * DAY
+        probability, _ = novel.expectations(START + 13 * DAY, DAY)
+        assert 0 < probability < 0.5
+
+    def test_watch(self, watched):
+        watcher, plugin, clock, found = watched
+        asyncio.run(watcher.run(40 * DAY))
+        assert {source for source, _, _ in found} == {plugin.DAILY}
+        # the daily updates are found within hours, each once, with the index just downloaded
+        updates = plugin.updates(plugin.DAILY)
+        recent = [time for time in updates if time > START + 10 * DAY]
+        detections = [(time, chapters) for source, time, chapters in found if time > START + 10 * DAY]
+        assert len(detections) == len(recent)
+        assert all(0 <= time - update < DAY / 4 for update, (time, _) in zip(recent, detections))
+        assert [chapters for _, chapters in detections] == [updates.index(update) + 1 for update in recent]
+        # far fewer requests than the budget, or than checking the index of both novels every hour
+        assert plugin.requests == watcher.requests < 40 * 24 / 4
+
+    def test_budget(self, watched):
+        watcher, plugin, clock, found = watched
+        plugin.period = watcher.prior_span = 60
+        watcher.delay_per_request, watcher.max_sleep = 1, 60 # always worth a check
+        asyncio.run(watcher.run(DAY))
+        assert 10 * 24 <= plugin.requests <= 10 * 24 + watcher.budget.capacity + 1
+
+    def test_store(self, watched, tmp_path):
+        watcher, plugin, clock, found = watched
+        asyncio.run(watcher.run(10 * DAY))
+        reopened = WatchStore(str(tmp_path / "watch.sqlite")).load()
+        assert reopened.keys() == watcher.novels.keys()
+        novel = reopened[plugin.DAILY]
+        assert novel.updates == watcher.novels[plugin.DAILY].updates and len(novel.updates) == 11
+        assert novel.digest == watcher.novels[plugin.DAILY].digest
+
+    def test_failed_crawl(self, watched, tmp_path):
+        watcher, plugin, clock, found = watched
+        asyncio.run(watcher.crawl())
+        updates = watcher.novels[plugin.DAILY].updates
+        plugin.down = True
+        clock.now += DAY
+        assert asyncio.run(watcher.crawl()) == [] and watcher.novels.keys() == {plugin.DAILY, plugin.DORMANT}
+        assert WatchStore(str(tmp_path / "watch.sqlite")).load().keys() == watcher.novels.keys()
+        assert watcher.novels[plugin.DAILY].updates == updates
+        # the update published meanwhile is found once the site is back, by a restarted watcher too
+        plugin.down = False
+        restarted = UpdateWatcher(plugin, lambda novel, arcs: found.append(novel["ref"]),
+                                  WatchStore(str(tmp_path / "watch.sqlite")), clock=clock, sleep=clock.sleep,
+                                  request_counter=lambda: plugin.requests)
+        assert [novel["ref"] for novel in asyncio.run(restarted.crawl())] == [plugin.DAILY] == found
@@ -0,0 +1,62 @@
+import pytest
+
+from webNovelManager.search.facets import FacetIndex, bit_positions, novel_facets
+
+
+INFOS = {
+    "https://ncode.syosetu.com/n0001aa/": {"tags": ["R15", "異世界転生", "女主人公"], "author": "作者A", "type": "webnovel",
+                                          "age_limit": False},
+    "https://ncode.syosetu.com/n0002aa/": {"tags": ["異世界転生", "女主人公"], "author": "作者B", "type": "webnovel",
+                                          "age_limit": False},
+    "https://ncode.syosetu.com/n0003aa/": {"tags": ["異世界転生", "男主人公"], "author": "作者A", "type": "oneshot",
+                                          "age_limit": True},
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FacetIndex(str(tmp_path / "facets.sqlite"))
+    index.set_novels_info(INFOS)
+    yield index
+    index.close()
+
+
+class Test_FacetIndex():
+    def test_novel_facets(self):
+        assert novel_facets({"tags": [{"original_term": "恋愛", "description": None}], "age_limit": True, "author": " "}) == \
+               {("tags", "恋愛"), ("age_limit", "true")}
+
+    def test_query(self, index):
+        assert index.sources(index.query(["異世界転生", "女主人公"], none_of=["R15"])) == ["https://ncode.syosetu.com/n0002aa/"]
+        assert index.sources(index.query(any_of=["R15", "男主人公"])) == \
+               ["https://ncode.syosetu.com/n0001aa/", "https://ncode.syosetu.com/n0003aa/"]
+        assert index.query(["author:作者A", "type:webnovel"]) == index.query([("tags", "R15")])
+        assert index.query(["unknown"]) == 0
+        assert len(index) == 3
+
+    def test_count(self, index):
+        assert index.count("tags") == [("異世界転生", 3), ("女主人公", 2), ("R15", 1), ("男主人公", 1)]
+        assert index.count("author", within=index.query(["異世界転生"], none_of=["R15"])) == [("作者A", 1), ("作者B", 1)]
+        assert index.count("age_limit", limit=1) == [("false", 2)]
+
+    def test_update(self, index, tmp_path):
+        index.set_novel_info("https://ncode.syosetu.com/n0002aa/", {"tags": ["R15"], "author": "作者B"})
+        assert not index.set_novel_info("https://ncode.syosetu.com/n0002aa/", {"tags": ["R15"], "author": "作者B"})
+        index.remove_novel("https://ncode.syosetu.com/n0001aa/")
+        assert index.count("tags", within=index.query()) == [("R15", 1), ("男主人公", 1), ("異世界転生", 1)]
+        assert ("女主人公", 1) not in index.count("tags")
+        reopened = FacetIndex(str(tmp_path / "facets.sqlite"))
+        assert reopened.sources(reopened.query(["R15"])) == ["https://ncode.syosetu.com/n0002aa/"]
+        reopened.close()
+
+    def test_dense_and_rollback(self, tmp_path):
+        index = FacetIndex(str(tmp_path / "dense.sqlite"))
+        index.set_novels_info({f"novel{number}": {"tags": ["all", f"tag{number % 100}"]} for number in range(1000)})
+        assert isinstance(index._load(("tags", "all")), int) and not isinstance(index._load(("tags", "tag1")), int)
+        with pytest.raises(RuntimeError):
+            with index.batch():
+                index.set_novel_info("novel1", {"tags": []})
+                raise RuntimeError()
+        assert bit_positions(index.query(["tag1"])) == list(range(2, 1001, 100)) # the ids start at 1
+        assert index.count("tags", limit=1) == [("all", 1000)]
+        index.close()
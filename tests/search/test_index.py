@@ -0,0 +1,70 @@
+import pytest
+
+from webNovelManager.search.index import SearchIndex, _decode_positions, _encode_positions, normalize, tokenize
+
+
+SOURCE = "https://ncode.syosetu.com/n0000aa/"
+OTHER = "https://ncode.syosetu.com/n1111bb/"
+
+
+def chapter(chapter_id:str, text:str, title:str=None):
+    return {"language": "jp", "id": chapter_id, "source": f"{SOURCE}{chapter_id}/", "raw_content": text,
+            "artefact": {}, "title": title or f"第{chapter_id}話"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite"))
+    index.add_novel({"source": SOURCE, "extend": None, "chapters": [
+        {"arc_id": 0, "arc_title": "第一章", "chapters": [
+            chapter("1", "勇者は剣を抜いた。\n魔王城はまだ遠い。"),
+            chapter("2", "魔王が現れた！勇者と魔王の戦いが始まる。魔王は笑った。"),
+        ]},
+        chapter("3", "ＡＢＣの村で休んだ。"),
+    ]}, info={"title": "勇者の旅", "abstract": "勇者が魔王を倒す物語", "author": "作者"})
+    yield index
+    index.close()
+
+
+class Test_Tokenize():
+    def test_bigrams(self):
+        assert list(tokenize("勇者、魔王")) == [("勇者", 0), ("者", 1), ("魔王", 3), ("王", 4)]
+        assert normalize("ＡＢＣｶ") == "abcカ"
+
+    def test_positions(self):
+        positions = [0, 1, 127, 128, 100000]
+        assert _decode_positions(_encode_positions(positions)) == positions
+
+
+class Test_SearchIndex():
+    def test_phrase_ranking_and_snippet(self, index):
+        results = index.search("魔王")
+        assert [(result.chapter_id, result.field) for result in results][0] == (None, "abstract")
+        assert {result.chapter_id for result in results} == {None, "1", "2"}
+        chapters = [result for result in results if result.chapter_id is not None]
+        assert chapters[0].chapter_id == "2" # three occurrences
+        assert "【魔王】" in chapters[0].snippet
+        assert [result.chapter_id for result in index.search("魔王城")] == ["1"]
+        assert index.search("王魔") == []
+
+    def test_several_words_and_single_character(self, index):
+        assert {result.chapter_id for result in index.search("勇者 剣")} == {"1"}
+        assert {result.chapter_id for result in index.search("城")} == {"1"}
+        assert [result.chapter_id for result in index.search("abc")] == ["3"]
+        assert [result.field for result in index.search("勇者の旅")] == ["title"]
+        assert index.search("勇者", novel=OTHER) == []
+
+    def test_update_only_the_chapter(self, index):
+        assert index.add_chapter(SOURCE, chapter("1", "勇者は剣を抜いた。\n魔王城はまだ遠い。")) is False
+        assert index.add_chapter(SOURCE, chapter("1", "竜が空を飛んだ。")) is True
+        assert "1" not in {result.chapter_id for result in index.search("魔王")}
+        assert [result.chapter_id for result in index.search("竜")] == ["1"]
+        assert index.connection.execute("SELECT COUNT(*) FROM postings WHERE gram = '魔王'").fetchone()[0] == 2
+        assert index.connection.execute("SELECT COUNT(*) FROM postings WHERE gram = '城'").fetchone()[0] == 0
+
+    def test_remove(self, index):
+        index.remove_chapter(SOURCE, "2")
+        assert {result.chapter_id for result in index.search("戦い")} == set()
+        index.remove_novel(SOURCE)
+        assert index.search("勇者") == []
+        assert index.connection.execute("SELECT COUNT(*) FROM postings").fetchone()[0] == 0
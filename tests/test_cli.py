@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from webNovelManager.cli import _store_report, main
+from webNovelManager.database.sqlite import SQLiteDatabase
+from webNovelManager.search.facets import FacetIndex
+from webNovelManager.search.index import SearchIndex
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def library(tmp_path):
+    paths = {"db": str(tmp_path / "library.sqlite"), "index": str(tmp_path / "search.sqlite"),
+             "facets": str(tmp_path / "facets.sqlite")}
+    novel = {"source": "https://ncode.syosetu.com/n0001aa/", "extend": {"title": "勇者の旅", "author": "作者"},
+             "chapters": [{"language": "ja", "id": str(index), "source": f"https://ncode.syosetu.com/n0001aa/{index}/",
+                           "title": f"第{index}話", "raw_content": f"勇者は魔王城へ向かった。{index}", "artefact": {}}
+                          for index in range(1, 6)]}
+    database = SQLiteDatabase(paths["db"])
+    database.store_novel_instance(novel)
+    database.close()
+    index = SearchIndex(paths["index"])
+    index.add_novel(novel, novel["extend"])
+    index.close()
+    facets = FacetIndex(paths["facets"])
+    facets.set_novel_info(novel["source"], {**novel["extend"], "tags": ["異世界転生"]})
+    facets.close()
+    return paths
+
+
+class Test_Cli():
+    def test_local_commands(self, library, tmp_path, capsys):
+        assert main(["list", "--db", library["db"]]) == 0
+        assert "n0001aa" in capsys.readouterr().out
+        assert main(["stats", "--db", library["db"]]) == 0
+        assert "chapters      5" in capsys.readouterr().out
+        assert main(["search", "魔王城", "--index", library["index"]]) == 0
+        assert "【魔王城】" in capsys.readouterr().out
+        assert main(["search", "ギルド", "--index", library["index"]]) == 1
+        assert main(["facets", "異世界転生", "--exclude", "R15", "--count", "author", "--facets", library["facets"]]) == 0
+        assert capsys.readouterr().out.split("\n")[:3] == ["1 novels", "https://ncode.syosetu.com/n0001aa/", "      1  作者"]
+        output = str(tmp_path / "novel.epub")
+        assert main(["export", "n0001aa", output, "--db", library["db"]]) == 0
+        assert "OEBPS/content.opf" in zipfile.ZipFile(output).namelist()
+        assert main(["export", "n9999zz", output, "--db", library["db"]]) == 1
+
+    def test_no_scraping_modules(self, library):
+        # a fresh interpreter, the tests already imported everything
+        script = ("import sys; import config; from webNovelManager.cli import main; "
+                  f"main(['list', '--db', {library['db']!r}]); main(['search', '勇者', '--index', {library['index']!r}]); "
+                  "print(sorted(module for module in ('requests', 'bs4', 'lxml', 'tldextract', 'dynaconf', 'structlog') "
+                  "if module in sys.modules), config.settings.loaded)")
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        assert output.splitlines()[-1] == "[] False"
+
+    @pytest.mark.parametrize("verbose", [False, True])
+    def test_debug_events_filtered(self, library, verbose):
+        # structlog imported first, as by the scraping commands
+        script = ("from webNovelManager.plugins.metrics import timed; from webNovelManager.cli import main; "
+                  f"main({['-v'] * verbose + ['list', '--db', library['db']]!r}); stage = timed('stage')(lambda: None); "
+                  "stage(); stage()")
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        assert "n0001aa" in output and output.count("stage=stage") == 2 * verbose
+
+    def test_store_report(self, tmp_path, capsys):
+        source = "https://ncode.syosetu.com/n0002aa/"
+        chapters = [{"language": "ja", "id": str(index), "source": f"{source}{index}/", "title": f"第{index}話",
+                     "raw_content": f"勇者は旅立った。{index}", "artefact": {}} for index in range(1, 4)]
+        arcs = {f"{source}1/": {"arc_id": 0, "arc_title": "一章"}, f"{source}2/": {"arc_id": 1, "arc_title": "二章"},
+                f"{source}3/": {"arc_id": 1, "arc_title": "二章"}}
+        plugin = type("Plugin", (), {"get_novel_info": lambda self, link: {"title": "旅", "author": "作者",
+                                                                            "tags": ["異世界転生"]}})()
+        database = SQLiteDatabase(str(tmp_path / "library.sqlite"))
+        facets = FacetIndex(str(tmp_path / "facets.sqlite"))
+        try:
+            # first synchronization: the novel is stored with its arcs and its info
+            _store_report({"source": source, "skipped": False, "new": chapters[:2], "changed": [], "removed": [],
+                           "arcs": arcs}, database, None, plugin, facets)
+            novel = database.get_novel_instance(source)
+            assert novel["extend"]["title"] == "旅"
+            assert [(arc["arc_title"], len(arc["chapters"])) for arc in novel["chapters"]] == [("一章", 1), ("二章", 1)]
+            assert facets.sources(facets.query(["異世界転生"])) == [source]
+
+            _store_report({"source": source, "skipped": False, "new": chapters[2:], "changed": [], "removed": [],
+                           "arcs": arcs}, database, None, plugin, facets)
+            novel = database.get_novel_instance(source)
+            assert [(arc["arc_title"], len(arc["chapters"])) for arc in novel["chapters"]] == [("一章", 1), ("二章", 2)]
+            assert novel["extend"]["title"] == "旅"
+        finally:
+            database.close()
+            facets.close()
+        assert "1 new" in capsys.readouterr().out
@@ -0,0 +1,324 @@
+"""
+Manage a library of web novels
+
+usage: python main.py <command> [options], see python main.py <command> --help
+
+The paths not given are read from the settings. Only the commands downloading (fetch, sync, watch) import the
+scraping modules (requests, bs4, lxml, tldextract): the local ones (list, stats, search, facets, export) start fast,
+even faster given every path as the settings aren't loaded then
+"""
+from typing import Callable, List, Optional
+import argparse
+import sys
+
+from .log import set_level
+
+
+def _database(args:argparse.Namespace):
+    from .database.sqlite import SQLiteDatabase
+    return SQLiteDatabase(args.db)
+
+
+def _search_index(args:argparse.Namespace):
+    from .search.index import SearchIndex
+    return SearchIndex(args.index)
+
+
+def _facet_index(args:argparse.Namespace):
+    """
+    :return: the facet index of --facets, None without it
+    """
+    if not args.facets:
+        return None
+    from .search.facets import FacetIndex
+    return FacetIndex(args.facets)
+
+
+def _format_size(size:float)->str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def list_novels(args:argparse.Namespace)->int:
+    database = _database(args)
+    try:
+        for novel in database.iter_novels():
+            print(f"{novel.ncode or '-':<10} {novel.chapters:>6}  {novel.title or novel.source}"
+                  + (f" / {novel.author}" if novel.author else ""))
+    finally:
+        database.close()
+    return 0
+
+
+def stats(args:argparse.Namespace)->int:
+    database = _database(args)
+    try:
+        counts = database.stats()
+    finally:
+        database.close()
+    for name, value in counts.items():
+        print(f"{name:<13} {_format_size(value) if name.endswith('_bytes') else value}")
+    return 0
+
+
+def search(args:argparse.Namespace)->int:
+    index = _search_index(args)
+    try:
+        results = index.search(" ".join(args.query), limit=args.limit, novel=args.novel)
+    finally:
+        index.close()
+    for result in results:
+        location = (result.title or result.field) if result.chapter_id is None else f"{result.chapter_id} {result.title or ''}"
+        print(f"{result.score:6.2f}  {result.novel}  {location}\n        {result.snippet}")
+    return 0 if results else 1
+
+
+def facets(args:argparse.Namespace)->int:
+    from .search.facets import FacetIndex
+
+    index = FacetIndex(args.facets)
+    try:
+        filtered = bool(args.terms or args.any or args.exclude)
+        bits = index.query(args.terms, args.any, args.exclude)
+        if filtered:
+            print(f"{bits.bit_count()} novels")
+            for source in index.sources(bits, limit=args.limit):
+                print(source)
+        if args.count:
+            for value, count in index.count(args.count, within=bits if filtered else None, limit=args.limit):
+                print(f"{count:>7}  {value}")
+    finally:
+        index.close()
+    return 0
+
+
+def export(args:argparse.Namespace)->int:
+    from .database.artefact import ArtefactStore
+    from .export.epub import export_novel, iter_novel_instance
+
+    database = _database(args)
+    try:
+        novel = database.get_novel_instance(args.source, lazy=True) or database.get_novel_instance(ncode=args.source, lazy=True)
+        if novel is None:
+            print(f"{args.source} isn't in the library", file=sys.stderr)
+            return 1
+        info = {"link": novel["source"], **(novel.get("extend") or {})}
+        artefact_store = ArtefactStore(args.artefacts) if args.artefacts else None
+        writer = export_novel(args.output, info, iter_novel_instance(novel), artefact_store=artefact_store)
+    finally:
+        database.close()
+    print(f"{args.output}: {writer.compressed} entries compressed, {writer.reused} reused")
+    return 0
+
+
+def fetch(args:argparse.Namespace)->int:
+    from .plugins.registry import get_registry
+
+    database = _database(args)
+    index = _search_index(args) if args.index else None
+    facet_index = _facet_index(args)
+    failed = 0
+    try:
+        for link in args.links:
+            plugin = get_registry().get_plugin(link)
+            if plugin is None:
+                print(f"No plugin handles {link}", file=sys.stderr)
+                failed += 1
+                continue
+            novel = plugin.fetch_novel(link, max_workers=args.workers)
+            get_novel_info = getattr(plugin, "get_novel_info", None)
+            if get_novel_info is not None:
+                novel["extend"] = get_novel_info(link)
+            database.store_novel_instance(novel)
+            if index is not None:
+                index.add_novel(novel, novel["extend"])
+            if facet_index is not None and novel["extend"]:
+                facet_index.set_novel_info(link, novel["extend"])
+            print(f"{link}: {sum(len(element.get('chapters', [element])) for element in novel['chapters'])} chapters")
+    finally:
+        database.close()
+        if index is not None:
+            index.close()
+        if facet_index is not None:
+            facet_index.close()
+    return 1 if failed else 0
+
+
+def sync(args:argparse.Namespace)->int:
+    from .plugins.registry import get_registry
+    from .plugins.sync import ManifestStore, NovelSynchronizer
+
+    plugin = get_registry().get_plugin(args.site)
+    if plugin is None:
+        print(f"No plugin handles {args.site}", file=sys.stderr)
+        return 1
+    if not plugin.ensure_logged():
+        print(f"Could not log in {args.site}, check the credentials of the settings", file=sys.stderr)
+        return 1
+    database = _database(args)
+    index = _search_index(args) if args.index else None
+    facet_index = _facet_index(args)
+    try:
+        synchronizer = NovelSynchronizer(plugin, ManifestStore(args.manifests))
+        for report in synchronizer.sync_favorites(max_workers=args.workers):
+            _store_report(report, database, index, plugin, facet_index)
+    finally:
+        database.close()
+        if index is not None:
+            index.close()
+        if facet_index is not None:
+            facet_index.close()
+    return 0
+
+
+def _store_report(report, database, index, plugin, facet_index=None)->None:
+    from .plugins.sync import group_by_arc
+
+    if report["skipped"]:
+        return
+    source = report["source"]
+    chapters = report["new"] + report["changed"]
+    if not database.has_novel(source): # first synchronization: stored as fetch does, with its info
+        novel = {"source": source, "chapters": group_by_arc(chapters, report["arcs"]), "extend": None}
+        get_novel_info = getattr(plugin, "get_novel_info", None)
+        if get_novel_info is not None:
+            novel["extend"] = get_novel_info(source)
+        database.store_novel_instance(novel)
+        if index is not None:
+            index.add_novel(novel, novel["extend"])
+        if facet_index is not None and novel["extend"]:
+            facet_index.set_novel_info(source, novel["extend"])
+    elif chapters:
+        for element in group_by_arc(chapters, report["arcs"]):
+            if "chapters" in element:
+                database.store_chapter_instance(source, element["chapters"],
+                                                {key: value for key, value in element.items() if key != "chapters"})
+            else:
+                database.store_chapter_instance(source, element)
+        if index is not None:
+            index.add_chapters(source, chapters)
+    # the removed chapters stay in the library
+    print(f"{source}: {len(report['new'])} new, {len(report['changed'])} changed, "
+          f"{len(report['removed'])} removed")
+
+
+def watch(args:argparse.Namespace)->int:
+    import asyncio
+    from .plugins.registry import get_registry
+    from .plugins.sync import ManifestStore, NovelSynchronizer
+    from .plugins.watcher import UpdateWatcher, WatchStore
+
+    plugin = get_registry().get_plugin(args.site)
+    if plugin is None:
+        print(f"No plugin handles {args.site}", file=sys.stderr)
+        return 1
+    if not plugin.ensure_logged():
+        print(f"Could not log in {args.site}, check the credentials of the settings", file=sys.stderr)
+        return 1
+    database = _database(args)
+    index = _search_index(args) if args.index else None
+    facet_index = _facet_index(args)
+    store = WatchStore(args.state)
+    synchronizer = NovelSynchronizer(plugin, ManifestStore(args.manifests))
+
+    async def on_update(short_novel, arcs):
+        report = await asyncio.to_thread(synchronizer.sync_novel, short_novel, max_workers=args.workers, arcs=arcs)
+        _store_report(report, database, index, plugin, facet_index) # in the thread of the event loop, which opened the sqlite files
+
+    watcher = UpdateWatcher(plugin, on_update, store, requests_per_hour=args.budget,
+                            delay_per_request=args.delay * 3600 if args.delay else None)
+    try:
+        asyncio.run(watcher.run(args.hours * 3600 if args.hours else None))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+        database.close()
+        if index is not None:
+            index.close()
+        if facet_index is not None:
+            facet_index.close()
+    return 0
+
+
+def make_parser()->argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="webNovelManager", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true", help="also log every request and parse stage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name:str, function:Callable[[argparse.Namespace], int], help:str,
+                db:bool=True, index:bool=False, scraping:bool=False)->argparse.ArgumentParser:
+        subparser = commands.add_parser(name, help=help, description=help)
+        subparser.set_defaults(function=function, scraping=scraping)
+        if db:
+            subparser.add_argument("--db", help="the sqlite file of the library, default: SQLiteDatabase.path of the settings")
+        if index:
+            subparser.add_argument("--index", help="the sqlite file of the search index, default: SearchIndex.path of the settings")
+        return subparser
+
+    command("list", list_novels, "list the novels of the library")
+    command("stats", stats, "count what the library holds")
+
+    subparser = command("search", search, "search the chapters and the novel info", db=False, index=True)
+    subparser.add_argument("query", nargs="+")
+    subparser.add_argument("--limit", type=int, default=20)
+    subparser.add_argument("--novel", help="search only in the novel of this source")
+
+    subparser = command("facets", facets, "find the novels by tag, author, type or age limit, and count them",
+                        db=False)
+    subparser.add_argument("terms", nargs="*", help="the values every novel holds: facet:value, a bare value "
+                                                    "being a tag, ex: 異世界転生 author:作者")
+    subparser.add_argument("--any", nargs="+", default=[], help="the novels hold one of these values at least")
+    subparser.add_argument("--exclude", nargs="+", default=[], help="the novels hold none of these values, ex: R15")
+    subparser.add_argument("--count", metavar="FACET", help="count the novels found (all of them without terms) "
+                                                            "by value of tags, author, type or age_limit")
+    subparser.add_argument("--limit", type=int, default=20)
+    subparser.add_argument("--facets", help="the sqlite file of the facet index, default: FacetIndex.path of the settings")
+
+    subparser = command("export", export, "export a novel of the library into an epub")
+    subparser.add_argument("source", help="the link or the ncode of the novel")
+    subparser.add_argument("output", help="the epub file, its unchanged entries are reused")
+    subparser.add_argument("--artefacts", help="the artefact store holding the images of the chapters")
+
+    subparser = command("fetch", fetch, "download novels into the library", scraping=True)
+    subparser.add_argument("links", nargs="+")
+    subparser.add_argument("--index", help="also index the novels in this search index")
+    subparser.add_argument("--facets", help="also index the info of the novels in this facet index")
+    subparser.add_argument("--workers", type=int, help="chapters downloaded at the same time")
+
+    subparser = command("sync", sync, "download the new and revised chapters of the favorites of an account",
+                        scraping=True)
+    subparser.add_argument("site", help="a link of the website, ex: https://syosetu.com/")
+    subparser.add_argument("--manifests", help="where the state of the novels is kept, default: ManifestStore.path of the settings")
+    subparser.add_argument("--index", help="also index the chapters in this search index")
+    subparser.add_argument("--facets", help="also index the info of the new novels in this facet index")
+    subparser.add_argument("--workers", type=int, help="pages downloaded at the same time")
+
+    subparser = command("watch", watch, "keep synchronizing the favorites of an account, checking first the novels "
+                                        "most likely updated", scraping=True)
+    subparser.add_argument("site", help="a link of the website, ex: https://syosetu.com/")
+    subparser.add_argument("--manifests", help="where the state of the novels is kept, default: ManifestStore.path of the settings")
+    subparser.add_argument("--state", help="the sqlite file of the pace of the novels, default: WatchStore.path of the settings")
+    subparser.add_argument("--budget", type=float, help="requests per hour at most, "
+                                                        "default: UpdateWatcher.requests_per_hour of the settings")
+    subparser.add_argument("--delay", type=float, help="the hours of waiting of the updates a request must save, "
+                                                       "default: UpdateWatcher.delay_per_request of the settings")
+    subparser.add_argument("--hours", type=float, help="stop after this many hours, default: never")
+    subparser.add_argument("--index", help="also index the chapters in this search index")
+    subparser.add_argument("--facets", help="also index the info of the new novels in this facet index")
+    subparser.add_argument("--workers", type=int, help="chapters downloaded at the same time")
+    return parser
+
+
+def main(argv:Optional[List[str]]=None)->int:
+    """
+    :param argv: the arguments, default: the ones of the command line
+    :return: the exit status
+    """
+    args = make_parser().parse_args(argv)
+    # the scraping modules log through structlog itself, configured before their first event
+    set_level("debug" if args.verbose else "info", now=args.scraping)
+    return args.function(args)
@@ -0,0 +1,164 @@
+from typing import List, Optional, Tuple, Union
+from collections import Counter
+import struct
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError: # optional, zlib is used instead
+    zstandard = None
+
+from ..log import getLogger
+
+
+log = getLogger(__name__)
+
+
+PLAIN = 0
+ZLIB = 1
+ZSTD = 2
+CODECS = {"none": PLAIN, "zlib": ZLIB, "zstd": ZSTD}
+
+# every compressed text starts with its codec and the id of its dictionary (0 without dictionary)
+_HEADER_ = struct.Struct(">BI")
+_DICTIONARY_SIZE_ = 32 * 1024 # the window of deflate, zstd could use more but gains little on chapters
+_MIN_LINE_LENGTH_ = 4 # shorter lines are cheaper to compress than to look up
+
+
+def default_codec()->int:
+    return ZSTD if zstandard is not None else ZLIB
+
+
+def read_header(blob:bytes)->Tuple[int, int]:
+    """
+    :param blob: a compressed text
+    :return: its codec and the id of its dictionary
+    """
+    return _HEADER_.unpack_from(blob)
+
+
+def _common_content(samples:List[str], size:int)->bytes:
+    """
+    Build a raw dictionary from chapters of a novel: the lines repeated from chapter to chapter
+    (author notes, separators, names...) then the beginning of the samples for the common vocabulary.
+    The most valuable lines are put at the end, the closest to the data
+    :param samples: texts of chapters
+    :param size: the maximum size of the dictionary
+    :return:
+    """
+    counts = Counter(line for sample in samples for line in set(sample.split("\n")) if len(line) >= _MIN_LINE_LENGTH_)
+    repeated = sorted((line for line, count in counts.items() if count > 1), key=lambda line: counts[line] * len(line))
+    content = "\n".join(repeated).encode("utf-8")[-size:]
+    if len(content) < size:
+        vocabulary = "\n".join(samples).encode("utf-8")[:size - len(content)]
+        content = vocabulary.decode("utf-8", errors="ignore").encode("utf-8") + content
+    return content
+
+
+def train_dictionary(samples:List[str], codec:Optional[int]=None, size:int=_DICTIONARY_SIZE_)->bytes:
+    """
+    Build the dictionary shared by the chapters of a novel
+    :param samples: texts of chapters of the novel
+    :param codec: ZLIB or ZSTD
+    :param size: the maximum size of the dictionary
+    :return: the dictionary, to be given to TextCompressor
+    """
+    codec = default_codec() if codec is None else codec
+    if codec == ZSTD:
+        try:
+            return zstandard.train_dictionary(size, [sample.encode("utf-8") for sample in samples]).as_bytes()
+        except zstandard.ZstdError: # too few samples, a raw dictionary works as well
+            pass
+    return _common_content(samples, size)
+
+
+class TextCompressor:
+    """
+    Compress and decompress texts with a codec and an optional dictionary. Thread safe
+    """
+    def __init__(self, codec:Optional[int]=None, dictionary:bytes=b"", dictionary_id:int=0, level:Optional[int]=None):
+        self.codec = default_codec() if codec is None else codec
+        if self.codec == ZSTD and zstandard is None:
+            raise ValueError("zstandard isn't installed, the texts compressed with zstd can't be read")
+        self.dictionary = dictionary
+        self.dictionary_id = dictionary_id if dictionary else 0
+        self.level = level
+        self._local = threading.local() # zstd (de)compressors can't be shared between threads
+        self._zstd_dictionary = None
+        if self.codec == ZSTD and dictionary:
+            self._zstd_dictionary = zstandard.ZstdCompressionDict(dictionary)
+
+    def _zstd(self):
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level or 3, dict_data=self._zstd_dictionary)
+            self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._zstd_dictionary)
+        return self._local.compressor, self._local.decompressor
+
+    def compress(self, text:str)->bytes:
+        """
+        :param text:
+        :return: the compressed text, starting with its header
+        """
+        data = text.encode("utf-8")
+        if self.codec == ZLIB:
+            compressor = zlib.compressobj(self.level or 6, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                          **({"zdict": self.dictionary} if self.dictionary else {}))
+            data = compressor.compress(data) + compressor.flush()
+        elif self.codec == ZSTD:
+            data = self._zstd()[0].compress(data)
+        return _HEADER_.pack(self.codec, self.dictionary_id) + data
+
+    def decompress(self, blob:bytes)->str:
+        """
+        :param blob: a text compressed by a compressor with the same codec and dictionary
+        :return:
+        """
+        codec, dictionary_id = read_header(blob)
+        if codec != PLAIN and dictionary_id != self.dictionary_id:
+            raise ValueError(f"The text was compressed with the dictionary {dictionary_id}, not {self.dictionary_id}")
+        data = memoryview(blob)[_HEADER_.size:]
+        if codec == ZLIB:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS, **({"zdict": self.dictionary} if self.dictionary else {}))
+            data = decompressor.decompress(data) + decompressor.flush()
+        elif codec == ZSTD:
+            data = self._zstd()[1].decompress(data)
+        return bytes(data).decode("utf-8")
+
+
+class CompressedText:
+    """
+    A text kept compressed in memory and only decompressed when read
+    """
+    __slots__ = ("data", "compressor")
+
+    def __init__(self, data:bytes, compressor:TextCompressor):
+        self.data = data
+        self.compressor = compressor
+
+    @property
+    def text(self)->str:
+        return self.compressor.decompress(self.data)
+
+    def __str__(self)->str:
+        return self.text
+
+    def __eq__(self, other)->bool:
+        if isinstance(other, CompressedText):
+            return self.text == other.text
+        return self.text == other
+
+    def __hash__(self)->int:
+        return hash(self.text)
+
+    def __repr__(self)->str:
+        return f"CompressedText({len(self.data)} bytes)"
+
+
+def as_text(value:Union[str, CompressedText, None])->Optional[str]:
+    """
+    return the text of a chapter content, whether it is compressed or not
+    :param value:
+    :return:
+    """
+    return value.text if isinstance(value, CompressedText) else value
@@ -1,4 +1,5 @@
 from typing import TypedDict, Optional, List, Dict, Union
+from datetime import datetime
 
 
 class LoginInfo(TypedDict):
@@ -25,9 +26,18 @@ class Chapter(TypedDict):
     title: Optional[str]
     id: float
     source: Optional[str]
-    raw_content: str # should be convertable into epub
+    raw_content: str # should be convertable into epub, a data.compression.CompressedText when read lazily
     artefact: Dict # ex: images
 
+class ShortNovel(TypedDict):
+    """
+    A typed dict representing a novel to use for updates or quick presentation
+    """
+    title: str
+    author: str
+    ref: str
+    last_modified: datetime
+
 class ArcChapter(TypedDict):
     """
     a collection of chapter which defines an arc/volume/etc..
@@ -52,3 +62,47 @@ class Novel(TypedDict):
     tags: Optional[List[Tag]]
     description: Optional[str]
     instance: List[NovelInstance]
+
+
+class ChapterIndexEntry(TypedDict):
+    """
+    a chapter as listed in the index of a novel, before being downloaded
+    """
+    link: str
+    update: Optional[str] # the publication/revision stamp shown in the index
+
+
+class ArcHeader(TypedDict, total=False):
+    """
+    the description of an arc, without its chapters
+    """
+    arc_id: int
+    arc_title: Optional[str]
+
+
+class ArcIndex(TypedDict):
+    """
+    the index of an arc: its chapters are not downloaded yet
+    """
+    chapters: List[ChapterIndexEntry]
+    arc_id: int
+    arc_title: Optional[str]
+
+
+class ChapterManifestEntry(TypedDict):
+    """
+    what is remembered of a downloaded chapter to detect its changes
+    """
+    link: str
+    id: Optional[str]
+    update: Optional[str]
+    hash: str # hash of the raw content
+
+
+class NovelManifest(TypedDict):
+    """
+    what is remembered of a synchronized novel
+    """
+    source: str
+    last_modified: Optional[str] # iso format
+    chapters: List[ChapterManifestEntry]
@@ -0,0 +1,338 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Type, Union
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+
+from .format import (ArcChapter, Chapter, ChapterIndexEntry, ChapterManifestEntry, Novel, NovelInstance,
+                     ShortNovel)
+
+
+class Record(MutableMapping):
+    """
+    The fields of a typed dict of format held in slots rather than in a dict, for a third of the memory.
+    A record reads and writes as the dict does (record["title"], record.get("title"), "title" in record), so it
+    can be given where the dict is expected; a key missing from the dict is an unset slot
+    """
+    __slots__ = ()
+    _NESTED_: Dict[str, "Type[Record]"] = {} # the fields holding a list of records
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            self[name] = value
+
+    @classmethod
+    def _convert(cls, name:str, value):
+        nested = cls._NESTED_.get(name)
+        if nested is None or value is None:
+            return value
+        return [element if isinstance(element, Record) else nested.from_dict(element) for element in value]
+
+    @classmethod
+    def from_dict(cls, data:Mapping)->"Record":
+        """
+        :param data: a typed dict, the lists of nested dicts are converted too
+        :return:
+        """
+        record = cls.__new__(cls)
+        for name, value in data.items():
+            record[name] = cls._convert(name, value)
+        return record
+
+    def to_dict(self)->Dict:
+        """
+        :return: the typed dict, with the nested records converted too
+        """
+        return {name: [element.to_dict() if isinstance(element, Record) else element for element in value]
+                if name in self._NESTED_ and value is not None else value for name, value in self.items()}
+
+    def __getitem__(self, name:str):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name:str, value)->None:
+        try:
+            setattr(self, name, value)
+        except AttributeError:
+            raise KeyError(f"{name} is not a field of {type(self).__name__}") from None
+
+    def __delitem__(self, name:str)->None:
+        try:
+            delattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __iter__(self)->Iterator[str]:
+        return (name for name in self.__slots__ if hasattr(self, name))
+
+    def __len__(self)->int:
+        return sum(1 for _ in self)
+
+    def __repr__(self)->str:
+        return f"{type(self).__name__}({', '.join(f'{name}={value!r}' for name, value in self.items())})"
+
+
+class ShortNovelRecord(Record):
+    __slots__ = tuple(ShortNovel.__annotations__)
+
+
+class ChapterRecord(Record):
+    __slots__ = tuple(Chapter.__annotations__)
+
+
+class ArcChapterRecord(Record):
+    __slots__ = tuple(ArcChapter.__annotations__)
+    _NESTED_ = {"chapters": ChapterRecord}
+
+
+class NovelInstanceRecord(Record):
+    __slots__ = tuple(NovelInstance.__annotations__)
+
+    @classmethod
+    def _convert(cls, name:str, value):
+        if name != "chapters" or value is None:
+            return value
+        # the chapters of a novel are either all chapters, or all arcs
+        return [element if isinstance(element, Record)
+                else ArcChapterRecord.from_dict(element) if "chapters" in element
+                else ChapterRecord.from_dict(element) for element in value]
+
+    def to_dict(self)->Dict:
+        novel = dict(self.items())
+        if novel.get("chapters") is not None:
+            novel["chapters"] = [element.to_dict() if isinstance(element, Record) else element
+                                 for element in novel["chapters"]]
+        return novel
+
+
+class NovelRecord(Record):
+    __slots__ = tuple(Novel.__annotations__)
+    _NESTED_ = {"instance": NovelInstanceRecord}
+
+
+class ChapterIndexRecord(Record):
+    __slots__ = tuple(ChapterIndexEntry.__annotations__)
+
+
+class ChapterManifestRecord(Record):
+    __slots__ = tuple(ChapterManifestEntry.__annotations__)
+
+
+class StringColumn:
+    """
+    The strings of a column encoded in utf-8 one after the other in a single buffer, with the offset of their ends.
+    The end of a None is stored as -1 - end
+    """
+    __slots__ = ("_data", "_ends")
+
+    def __init__(self):
+        self._data = bytearray()
+        self._ends = array("q")
+
+    def append(self, value:Optional[str])->None:
+        if value is None:
+            self._ends.append(-1 - len(self._data))
+            return
+        self._data += value.encode("utf-8")
+        self._ends.append(len(self._data))
+
+    def truncate(self, length:int)->None:
+        del self._data[self._end(length - 1) if length else 0:]
+        del self._ends[length:]
+
+    def _end(self, index:int)->int:
+        end = self._ends[index]
+        return end if end >= 0 else -1 - end
+
+    def __getitem__(self, index:int)->Optional[str]:
+        end = self._ends[index]
+        if end < 0:
+            return None
+        index = index % len(self._ends)
+        start = self._end(index - 1) if index else 0
+        return self._data[start:end].decode("utf-8")
+
+    def __iter__(self)->Iterator[Optional[str]]:
+        data, start = self._data, 0
+        for end in self._ends:
+            if end < 0:
+                start = -1 - end
+                yield None
+            else:
+                yield data[start:end].decode("utf-8")
+                start = end
+
+    def __len__(self)->int:
+        return len(self._ends)
+
+    @property
+    def nbytes(self)->int:
+        return len(self._data) + self._ends.itemsize * len(self._ends)
+
+
+class HexColumn:
+    """
+    Hexadecimal strings of a fixed length, a hash for instance, stored as bytes: half the size of their text.
+    A None is marked in a bitmap
+    """
+    __slots__ = ("width", "_data", "_nulls")
+
+    def __init__(self, width:int):
+        """
+        :param width: the number of bytes of a value, 32 for a sha256
+        """
+        self.width = width
+        self._data = bytearray()
+        self._nulls = bytearray()
+
+    def append(self, value:Optional[str])->None:
+        data = bytes(self.width) if value is None else bytes.fromhex(value)
+        if len(data) != self.width:
+            raise ValueError(f"{value!r} isn't {self.width} bytes long")
+        index = len(self)
+        if index % 8 == 0:
+            self._nulls.append(0)
+        if value is None:
+            self._nulls[index // 8] |= 1 << index % 8
+        self._data += data
+
+    def truncate(self, length:int)->None:
+        del self._data[length * self.width:]
+        del self._nulls[(length + 7) // 8:]
+        if length % 8:
+            self._nulls[-1] &= (1 << length % 8) - 1
+
+    def __getitem__(self, index:int)->Optional[str]:
+        index = range(len(self))[index]
+        if self._nulls[index // 8] >> index % 8 & 1:
+            return None
+        return self._data[index * self.width:(index + 1) * self.width].hex()
+
+    def __iter__(self)->Iterator[Optional[str]]:
+        return (self[index] for index in range(len(self)))
+
+    def __len__(self)->int:
+        return len(self._data) // self.width
+
+    @property
+    def nbytes(self)->int:
+        return len(self._data) + len(self._nulls)
+
+
+_EPOCH_ = datetime(1970, 1, 1)
+_NO_DATE_ = -2 ** 63
+
+
+class DatetimeColumn:
+    """
+    Naive datetimes stored as microseconds since the epoch, as the websites give them
+    """
+    __slots__ = ("_data",)
+
+    def __init__(self):
+        self._data = array("q")
+
+    def append(self, value:Optional[datetime])->None:
+        if value is None:
+            self._data.append(_NO_DATE_)
+        elif value.tzinfo is not None:
+            raise ValueError(f"{value!r} isn't a naive datetime")
+        else:
+            self._data.append((value - _EPOCH_) // timedelta(microseconds=1))
+
+    def truncate(self, length:int)->None:
+        del self._data[length:]
+
+    def __getitem__(self, index:int)->Optional[datetime]:
+        value = self._data[index]
+        return None if value == _NO_DATE_ else _EPOCH_ + timedelta(microseconds=value)
+
+    def __iter__(self)->Iterator[Optional[datetime]]:
+        return (None if value == _NO_DATE_ else _EPOCH_ + timedelta(microseconds=value) for value in self._data)
+
+    def __len__(self)->int:
+        return len(self._data)
+
+    @property
+    def nbytes(self)->int:
+        return self._data.itemsize * len(self._data)
+
+
+Column = Union[StringColumn, HexColumn, DatetimeColumn]
+
+
+class RecordBatch:
+    """
+    A list of flat records held column by column in arrays: a bulk listing takes four times less memory than as dicts,
+    strings included. The records are built when read, a missing field being read as None
+    """
+    _RECORD_: Type[Record] = Record
+    _COLUMNS_: Dict[str, Callable[[], Column]] = {}
+
+    def __init__(self, entries:Iterable[Mapping]=()):
+        self.columns: Dict[str, Column] = {name: column() for name, column in self._COLUMNS_.items()}
+        self.extend(entries)
+
+    def append(self, entry:Mapping)->None:
+        length = len(self)
+        try:
+            for name, column in self.columns.items():
+                column.append(entry.get(name))
+        except (TypeError, ValueError, AttributeError):
+            for column in self.columns.values(): # the columns keep the same length
+                column.truncate(length)
+            raise
+
+    def extend(self, entries:Iterable[Mapping])->None:
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self)->int:
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, index:int)->Record:
+        return self._RECORD_(**{name: column[index] for name, column in self.columns.items()})
+
+    def __iter__(self)->Iterator[Record]:
+        names, record = list(self.columns), self._RECORD_
+        for values in zip(*self.columns.values()):
+            yield record(**dict(zip(names, values)))
+
+    def to_dicts(self)->List[Dict]:
+        """
+        :return: the entries as the typed dicts
+        """
+        names = list(self.columns)
+        return [dict(zip(names, values)) for values in zip(*self.columns.values())]
+
+    @property
+    def nbytes(self)->int:
+        """
+        :return: the size of the arrays of the columns
+        """
+        return sum(column.nbytes for column in self.columns.values())
+
+
+class ShortNovelBatch(RecordBatch):
+    """
+    a listing of novels, the favorites of an account for instance
+    """
+    _RECORD_ = ShortNovelRecord
+    _COLUMNS_ = {"title": StringColumn, "author": StringColumn, "ref": StringColumn, "last_modified": DatetimeColumn}
+
+
+class ChapterIndexBatch(RecordBatch):
+    """
+    the chapters of a novel index
+    """
+    _RECORD_ = ChapterIndexRecord
+    _COLUMNS_ = {"link": StringColumn, "update": StringColumn}
+
+
+class ChapterManifestBatch(RecordBatch):
+    """
+    the chapters of a manifest, their hash being a sha256 (functions.hash_content)
+    """
+    _RECORD_ = ChapterManifestRecord
+    _COLUMNS_ = {"link": StringColumn, "id": StringColumn, "update": StringColumn, "hash": lambda: HexColumn(32)}
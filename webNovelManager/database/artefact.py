@@ -0,0 +1,156 @@
+from typing import TYPE_CHECKING, BinaryIO, Dict, Optional, TypedDict
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+
+from config import settings
+
+from ..log import getLogger
+
+if TYPE_CHECKING: # the exports read the store without the scraping modules
+    import requests
+
+
+log = getLogger(__name__)
+
+
+class ArtefactReference(TypedDict):
+    """
+    what a chapter keeps of an artefact stored in an ArtefactStore
+    """
+    sha256: str
+    url: str
+    size: int
+    media_type: Optional[str]
+
+
+class ArtefactStore:
+    """
+    An on-disk store of artefacts (ex: images) addressed by the sha256 of their content.
+    The same image used by several chapters or novels is stored once, and the urls already
+    downloaded are remembered so that they are never downloaded again
+    """
+    _CHUNK_SIZE_ = 64 * 1024
+
+    def __init__(self, path:Optional[str]=None):
+        if path is None:
+            try:
+                path = settings[type(self).__name__]['path']
+            except KeyError:
+                log.warning(f"No path configured for {type(self).__name__}, using the working directory")
+                path = "artefacts"
+        self.path = path
+        os.makedirs(os.path.join(self.path, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(self.path, "urls.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, media_type TEXT)")
+        self.connection.commit()
+
+    def close(self)->None:
+        self.connection.close()
+
+    def object_path(self, sha256:str)->str:
+        """
+        return the path of the file holding an artefact
+        :param sha256: the hash of the artefact
+        :return:
+        """
+        return os.path.join(self.path, "objects", sha256[:2], sha256[2:])
+
+    def lookup(self, url:str)->Optional[ArtefactReference]:
+        """
+        return the reference of an url already downloaded, if its content is still in the store
+        :param url:
+        :return:
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT sha256, size, media_type FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.object_path(row[0])):
+            return None
+        return ArtefactReference(sha256=row[0], url=url, size=row[1], media_type=row[2])
+
+    def fetch(self, session:"requests.Session", url:str, headers:Optional[Dict]=None)->ArtefactReference:
+        """
+        Download an artefact into the store, unless the url was already downloaded.
+        The body is streamed to disk and hashed on the fly, never fully held in memory
+        :param session: the session used for the download
+        :param url:
+        :param headers:
+        :return: the reference of the artefact
+        """
+        reference = self.lookup(url)
+        if reference is not None:
+            return reference
+        digest = hashlib.sha256()
+        size = 0
+        with session.get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            media_type = response.headers.get("Content-Type")
+            with tempfile.NamedTemporaryFile(dir=os.path.join(self.path, "objects"), delete=False) as temporary_file:
+                try:
+                    for chunk in response.iter_content(self._CHUNK_SIZE_):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        temporary_file.write(chunk)
+                except BaseException:
+                    temporary_file.close()
+                    os.remove(temporary_file.name)
+                    raise
+        sha256 = digest.hexdigest()
+        self._add_object(temporary_file.name, sha256)
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO urls (url, sha256, size, media_type) VALUES (?, ?, ?, ?)",
+                                    (url, sha256, size, media_type))
+            self.connection.commit()
+        return ArtefactReference(sha256=sha256, url=url, size=size, media_type=media_type)
+
+    def put(self, content:bytes, url:Optional[str]=None, media_type:Optional[str]=None)->ArtefactReference:
+        """
+        Add an artefact already in memory to the store
+        :param content:
+        :param url: the url of the artefact, remembered if given
+        :param media_type:
+        :return: the reference of the artefact
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        with tempfile.NamedTemporaryFile(dir=os.path.join(self.path, "objects"), delete=False) as temporary_file:
+            temporary_file.write(content)
+        self._add_object(temporary_file.name, sha256)
+        if url is not None:
+            with self._lock:
+                self.connection.execute("INSERT OR REPLACE INTO urls (url, sha256, size, media_type) VALUES (?, ?, ?, ?)",
+                                        (url, sha256, len(content), media_type))
+                self.connection.commit()
+        return ArtefactReference(sha256=sha256, url=url, size=len(content), media_type=media_type)
+
+    def _add_object(self, temporary_path:str, sha256:str)->None:
+        """
+        Move a downloaded file to its place, or drop it if the same content is already stored
+        """
+        path = self.object_path(sha256)
+        if os.path.exists(path):
+            os.remove(temporary_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temporary_path, path)
+
+    def open(self, sha256:str)->BinaryIO:
+        """
+        open an artefact for reading
+        :param sha256:
+        :return: a binary file
+        """
+        return open(self.object_path(sha256), "rb")
+
+    def get(self, sha256:str)->bytes:
+        """
+        return the content of an artefact
+        :param sha256:
+        :return:
+        """
+        with self.open(sha256) as artefact_file:
+            return artefact_file.read()
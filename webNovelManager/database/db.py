@@ -1,44 +1,117 @@
-from typing import List, Optional, Union
+from typing import Dict, Iterable, Optional, Union
+from urllib.parse import urlsplit
 
-import structlog
-from tinydb import TinyDB, Query
 from config import settings
 
+from ..data.format import ArcHeader, Chapter, NovelInstance
+from ..log import getLogger
 
-log = structlog.getLogger(__name__)
+
+log = getLogger(__name__)
+
+
+def get_ncode(novel_source:str)->Optional[str]:
+    """
+    return the code identifying a novel on its website, i.e. the first part of the path of its link
+    ex: https://ncode.syosetu.com/n7975cr/ -> n7975cr
+    :param novel_source: the link of the novel
+    :return:
+    """
+    path = urlsplit(novel_source).path.strip("/")
+    return path.split("/")[0].lower() if path else None
 
 
 class Database:
     """
-    Base class for all website plugins
+    Base class for all databases
     """
-    def __init__(self):
+    def __init__(self, path:Optional[str]=None):
+        if path is not None:
+            self.db_location = path
+            return
         try:
             self.db_location = settings[type(self).__name__]['path']
         except Exception:
-            log.error(f"Couldn't set the path to: {settings[type(self).__name__]['path']}")
+            log.error(f"Couldn't find the path of the database in the settings: {type(self).__name__}")
             self.db_location = "" #TODO
 
-    def store_novel_instance(self):
+    def store_novel_instance(self, novel:NovelInstance, ncode:Optional[str]=None)->None:
+        """
+        Store a novel and all its chapters, replacing the previous instance from the same source
+        :param novel:
+        :param ncode: the code of the novel on its website, guessed from the source if not given
+        :return:
+        """
+        raise NotImplementedError
+
+    def store_chapter_instance(self, novel_source:str, chapters:Union[Chapter, Iterable[Chapter]],
+                               arc:Optional[ArcHeader]=None)->None:
+        """
+        Store or replace one or several chapters of an already stored novel, in a single transaction
+        :param novel_source: the source of the novel
+        :param chapters: a chapter or an iterable of chapters
+        :param arc: the arc of the chapters if any
+        :return:
+        """
         raise NotImplementedError
 
-    def store_chapter_instance(self):
+    def has_novel(self, novel_source:str)->bool:
+        """
+        :param novel_source: the source of the novel
+        :return: whether the novel is stored
+        """
         raise NotImplementedError
 
-    def store_artefacts(self):
+    def store_artefacts(self, novel_source:str, chapter_id:str, artefacts:Dict)->None:
+        """
+        Store the artefacts (ex: images) of a chapter
+        :param novel_source:
+        :param chapter_id:
+        :param artefacts: a dictionary href -> artefact
+        :return:
+        """
         raise NotImplementedError
 
-    def get_artefacts(self):
+    def get_artefacts(self, novel_source:str, chapter_id:str)->Dict:
+        """
+        Return the artefacts of a chapter
+        :param novel_source:
+        :param chapter_id:
+        :return: a dictionary href -> artefact
+        """
         raise NotImplementedError
 
-    def get_novel_instance(self):
+    def get_novel_instance(self, novel_source:Optional[str]=None, ncode:Optional[str]=None)->Optional[NovelInstance]:
+        """
+        Return a stored novel from its source or its ncode
+        :param novel_source:
+        :param ncode:
+        :return: None if the novel is unknown
+        """
         raise NotImplementedError
 
-    def get_chapter_instance(self):
+    def get_chapter_instance(self, novel_source:str, chapter_id:str)->Optional[Chapter]:
+        """
+        Return a stored chapter
+        :param novel_source:
+        :param chapter_id:
+        :return: None if the chapter is unknown
+        """
         raise NotImplementedError
 
-    def delete_chapter(self):
+    def delete_chapter(self, novel_source:str, chapter_id:str)->None:
+        """
+        Delete a chapter and its artefacts
+        :param novel_source:
+        :param chapter_id:
+        :return:
+        """
         raise NotImplementedError
 
-    def delete_novel(self):
-        raise NotImplementedError
\ No newline at end of file
+    def delete_novel(self, novel_source:str)->None:
+        """
+        Delete a novel, its chapters and their artefacts
+        :param novel_source:
+        :return:
+        """
+        raise NotImplementedError
@@ -0,0 +1,417 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+from contextlib import contextmanager
+from itertools import islice
+import json
+import sqlite3
+import threading
+
+from config import settings
+from .db import Database, get_ncode
+from ..data.compression import CODECS, PLAIN, CompressedText, TextCompressor, as_text, default_codec, read_header, \
+    train_dictionary
+from ..data.format import ArcHeader, Chapter, NovelInstance
+from ..log import getLogger
+
+
+log = getLogger(__name__)
+
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS novels (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    ncode TEXT,
+    extend TEXT
+);
+CREATE INDEX IF NOT EXISTS novels_ncode ON novels (ncode);
+CREATE TABLE IF NOT EXISTS arcs (
+    novel_id INTEGER NOT NULL REFERENCES novels (id) ON DELETE CASCADE,
+    arc_id INTEGER NOT NULL,
+    arc_title TEXT,
+    PRIMARY KEY (novel_id, arc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    novel_id INTEGER NOT NULL REFERENCES novels (id) ON DELETE CASCADE,
+    chapter_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    arc_id INTEGER,
+    language TEXT,
+    title TEXT,
+    source TEXT,
+    raw_content TEXT, -- plain text, or a blob compressed by data.compression
+    UNIQUE (novel_id, chapter_id)
+);
+CREATE INDEX IF NOT EXISTS chapters_source ON chapters (source);
+CREATE TABLE IF NOT EXISTS dictionaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, -- never reused: the compressors are cached by id
+    novel_id INTEGER NOT NULL REFERENCES novels (id) ON DELETE CASCADE,
+    codec INTEGER NOT NULL,
+    content BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dictionaries_novel ON dictionaries (novel_id);
+CREATE TABLE IF NOT EXISTS artefacts (
+    chapter INTEGER NOT NULL REFERENCES chapters (id) ON DELETE CASCADE,
+    href TEXT NOT NULL,
+    content BLOB,
+    PRIMARY KEY (chapter, href)
+) WITHOUT ROWID;
+"""
+
+
+class NovelSummary(NamedTuple):
+    source: str
+    ncode: Optional[str]
+    title: Optional[str] # from the info of the novel, if it was stored
+    author: Optional[str]
+    chapters: int
+
+
+class SQLiteDatabase(Database):
+    """
+    A database stored in a single sqlite file. Novels are indexed by source and ncode, chapters by
+    (novel, chapter id) and source, so that every lookup is a b-tree search.
+    Every store is a single transaction, several stores can be grouped with batch().
+    The texts of the chapters are compressed with a dictionary trained per novel (zstd if installed, else zlib),
+    set compression = "none" in the settings to store them as plain text
+    """
+    _BATCH_SIZE_ = 500 # number of chapters inserted per executemany
+    _DICTIONARY_SAMPLES_ = 4 # chapters needed to train the dictionary of a novel
+    _MAX_DICTIONARY_SAMPLES_ = 64
+
+    def __init__(self, path:Optional[str]=None, compression:Optional[str]=None):
+        """
+        :param path:
+        :param compression: "none", "zlib" or "zstd", else read from the settings. Default: the best one installed
+        """
+        super().__init__(path)
+        self._codec = self._parse_compression(compression) if compression is not None else None
+        self._compressors:Dict[int, TextCompressor] = {} # dictionary id -> compressor
+        self.connection = sqlite3.connect(self.db_location or ":memory:", check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(_SCHEMA_)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    @staticmethod
+    def _parse_compression(compression:Optional[str])->int:
+        if compression is None:
+            return default_codec()
+        if compression.lower() not in CODECS:
+            raise ValueError(f"Unknown compression {compression}, expected one of {list(CODECS)}")
+        return CODECS[compression.lower()]
+
+    @property
+    def codec(self)->int:
+        """
+        the codec of the texts stored, read from the settings on the first store: reading needs none
+        """
+        if self._codec is None:
+            try:
+                compression = settings[type(self).__name__]["compression"]
+            except (KeyError, TypeError):
+                compression = None
+            self._codec = self._parse_compression(compression)
+        return self._codec
+
+    def close(self)->None:
+        self.connection.close()
+
+    @contextmanager
+    def batch(self)->Iterator[sqlite3.Connection]:
+        """
+        Group every operation done inside the context in one transaction, rolled back on error
+        :return: the connection
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.connection.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.connection
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.connection.execute("ROLLBACK")
+                    self._compressors.clear() # the dictionaries inserted were rolled back with their ids
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("COMMIT")
+
+    def _novel_id(self, novel_source:str)->Optional[int]:
+        row = self.connection.execute("SELECT id FROM novels WHERE source = ?", (novel_source,)).fetchone()
+        return row[0] if row else None
+
+    def has_novel(self, novel_source:str)->bool:
+        return self._novel_id(novel_source) is not None
+
+    def _forget_dictionaries(self, novel_source:str)->None:
+        """
+        drop the cached compressors of the dictionaries of a novel about to be deleted: a database created before
+        the ids were autoincremented can give them to new dictionaries
+        """
+        for dictionary_id, in self.connection.execute(
+                "SELECT dictionaries.id FROM dictionaries JOIN novels ON novels.id = dictionaries.novel_id "
+                "WHERE novels.source = ?", (novel_source,)):
+            self._compressors.pop(dictionary_id, None)
+
+    def _chapter_key(self, novel_source:str, chapter_id)->Optional[int]:
+        row = self.connection.execute(
+            "SELECT chapters.id FROM chapters JOIN novels ON novels.id = chapters.novel_id "
+            "WHERE novels.source = ? AND chapters.chapter_id = ?", (novel_source, str(chapter_id))).fetchone()
+        return row[0] if row else None
+
+    def _insert_chapters(self, novel_id:int, chapters:Iterable[Chapter], arc:Optional[ArcHeader])->None:
+        """
+        Insert the chapters by batches, after the last stored chapter of the novel.
+        A chapter already stored keeps its position, and its arc unless a new one is given
+        """
+        if arc is not None:
+            self.connection.execute("INSERT OR REPLACE INTO arcs (novel_id, arc_id, arc_title) VALUES (?, ?, ?)",
+                                    (novel_id, arc.get("arc_id"), arc.get("arc_title")))
+        position = self.connection.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM chapters WHERE novel_id = ?", (novel_id,)).fetchone()[0]
+        chapters = iter(chapters)
+        compressor = None
+        while True:
+            batch = list(islice(chapters, self._BATCH_SIZE_))
+            if not batch:
+                return
+            if compressor is None or compressor.dictionary_id == 0:
+                compressor = self._novel_compressor(novel_id, batch)
+            rows = []
+            for index, chapter in enumerate(batch):
+                chapter_id = chapter.get("id")
+                rows.append((novel_id, str(chapter_id if chapter_id is not None else position + index),
+                             position + index, arc.get("arc_id") if arc is not None else None,
+                             chapter.get("language"), chapter.get("title"), chapter.get("source"),
+                             self._compress(compressor, chapter.get("raw_content"))))
+            self.connection.executemany(
+                "INSERT INTO chapters (novel_id, chapter_id, position, arc_id, language, title, source, raw_content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (novel_id, chapter_id) DO UPDATE SET arc_id = COALESCE(excluded.arc_id, arc_id), "
+                "language = excluded.language, title = excluded.title, source = excluded.source, "
+                "raw_content = excluded.raw_content", rows)
+            for row, chapter in zip(rows, batch):
+                if chapter.get("artefact"):
+                    chapter_key = self.connection.execute(
+                        "SELECT id FROM chapters WHERE novel_id = ? AND chapter_id = ?", (novel_id, row[1])).fetchone()[0]
+                    self._insert_artefacts(chapter_key, chapter["artefact"])
+            position += len(batch)
+
+    def _novel_compressor(self, novel_id:int, batch:List[Chapter])->Optional[TextCompressor]:
+        """
+        return the compressor of the novel, training its dictionary from the stored and the new chapters
+        once there are enough of them. Without enough chapters yet the texts are compressed without dictionary
+        :param novel_id:
+        :param batch: the chapters about to be stored
+        :return: None if the texts are stored as plain text
+        """
+        if self.codec == PLAIN:
+            return None
+        row = self.connection.execute("SELECT id FROM dictionaries WHERE novel_id = ? ORDER BY id DESC LIMIT 1",
+                                      (novel_id,)).fetchone()
+        if row is not None:
+            compressor = self._compressor(row[0])
+            if compressor.codec == self.codec:
+                return compressor
+        samples = [as_text(chapter.get("raw_content")) for chapter in batch if chapter.get("raw_content")]
+        samples = samples[:self._MAX_DICTIONARY_SAMPLES_]
+        if len(samples) < self._MAX_DICTIONARY_SAMPLES_:
+            samples += [self._decompress(content) for content, in self.connection.execute(
+                "SELECT raw_content FROM chapters WHERE novel_id = ? AND raw_content IS NOT NULL ORDER BY position DESC "
+                "LIMIT ?", (novel_id, self._MAX_DICTIONARY_SAMPLES_ - len(samples)))]
+        if len(samples) < self._DICTIONARY_SAMPLES_:
+            return self._compressor(0)
+        dictionary = train_dictionary(samples, self.codec)
+        dictionary_id = self.connection.execute(
+            "INSERT INTO dictionaries (novel_id, codec, content) VALUES (?, ?, ?) RETURNING id",
+            (novel_id, self.codec, dictionary)).fetchone()[0]
+        log.debug(f"Trained a dictionary of {len(dictionary)} bytes from {len(samples)} chapters for the novel {novel_id}")
+        return self._compressor(dictionary_id)
+
+    def _compressor(self, dictionary_id:int, codec:Optional[int]=None)->TextCompressor:
+        """
+        :param dictionary_id: 0 for no dictionary
+        :param codec: the codec used without dictionary, default: the one of the database
+        :return: the compressor of a dictionary, cached as the dictionaries never change
+        """
+        key = dictionary_id or -(self.codec if codec is None else codec)
+        compressor = self._compressors.get(key)
+        if compressor is None:
+            if dictionary_id == 0:
+                compressor = TextCompressor(self.codec if codec is None else codec)
+            else:
+                codec, content = self.connection.execute(
+                    "SELECT codec, content FROM dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+                compressor = TextCompressor(codec, content, dictionary_id)
+            self._compressors[key] = compressor
+        return compressor
+
+    @staticmethod
+    def _compress(compressor:Optional[TextCompressor], raw_content)->Union[str, bytes, None]:
+        raw_content = as_text(raw_content)
+        if compressor is None or raw_content is None:
+            return raw_content
+        return compressor.compress(raw_content)
+
+    def _decompress(self, raw_content:Union[str, bytes, None], lazy:bool=False)->Union[str, CompressedText, None]:
+        """
+        :param raw_content: as stored, plain texts (stored without compression) are returned as they are
+        :param lazy: return a CompressedText, decompressed when read
+        :return:
+        """
+        if not isinstance(raw_content, bytes):
+            return raw_content
+        codec, dictionary_id = read_header(raw_content)
+        compressor = self._compressor(dictionary_id, codec)
+        return CompressedText(raw_content, compressor) if lazy else compressor.decompress(raw_content)
+
+    def _insert_artefacts(self, chapter_key:int, artefacts:Dict)->None:
+        """
+        raw artefacts are stored as blobs, references to an artefact store as json
+        """
+        self.connection.executemany("INSERT OR REPLACE INTO artefacts (chapter, href, content) VALUES (?, ?, ?)",
+                                    [(chapter_key, href, content if isinstance(content, bytes) else json.dumps(content))
+                                     for href, content in artefacts.items()])
+
+    def _select_artefacts(self, chapter_key:int)->Dict:
+        return {href: content if isinstance(content, bytes) else json.loads(content)
+                for href, content in self.connection.execute("SELECT href, content FROM artefacts WHERE chapter = ?", (chapter_key,))}
+
+    def store_novel_instance(self, novel:NovelInstance, ncode:Optional[str]=None)->None:
+        with self.batch():
+            self._forget_dictionaries(novel["source"])
+            self.connection.execute("DELETE FROM novels WHERE source = ?", (novel["source"],))
+            novel_id = self.connection.execute(
+                "INSERT INTO novels (source, ncode, extend) VALUES (?, ?, ?) RETURNING id",
+                (novel["source"], ncode or get_ncode(novel["source"]), json.dumps(novel.get("extend")))).fetchone()[0]
+            # the dictionary is trained on the whole novel, not on its first arc
+            self._novel_compressor(novel_id, [chapter for element in novel.get("chapters") or []
+                                              for chapter in element.get("chapters", [element])])
+            for element in novel.get("chapters") or []:
+                if "chapters" in element: # an arc
+                    arc = ArcHeader(**{key: value for key, value in element.items() if key != "chapters"})
+                    self._insert_chapters(novel_id, element["chapters"], arc)
+                else:
+                    self._insert_chapters(novel_id, [element], None)
+
+    def store_chapter_instance(self, novel_source:str, chapters:Union[Chapter, Iterable[Chapter]],
+                               arc:Optional[ArcHeader]=None)->None:
+        if isinstance(chapters, dict):
+            chapters = [chapters]
+        with self.batch():
+            novel_id = self._novel_id(novel_source)
+            if novel_id is None:
+                novel_id = self.connection.execute(
+                    "INSERT INTO novels (source, ncode, extend) VALUES (?, ?, ?) RETURNING id",
+                    (novel_source, get_ncode(novel_source), json.dumps(None))).fetchone()[0]
+            self._insert_chapters(novel_id, chapters, arc)
+
+    def store_artefacts(self, novel_source:str, chapter_id:str, artefacts:Dict)->None:
+        with self.batch():
+            chapter_key = self._chapter_key(novel_source, chapter_id)
+            if chapter_key is None:
+                raise KeyError(f"Unknown chapter {chapter_id} of {novel_source}")
+            self._insert_artefacts(chapter_key, artefacts)
+
+    def get_artefacts(self, novel_source:str, chapter_id:str)->Dict:
+        chapter_key = self._chapter_key(novel_source, chapter_id)
+        if chapter_key is None:
+            return {}
+        return self._select_artefacts(chapter_key)
+
+    def _row_to_chapter(self, row, lazy:bool=False)->Chapter:
+        key, chapter_id, language, title, source, raw_content = row
+        chapter:Chapter = {
+            "language": language,
+            "id": chapter_id,
+            "source": source,
+            "raw_content": self._decompress(raw_content, lazy),
+            "artefact": self._select_artefacts(key)
+        }
+        if title is not None:
+            chapter["title"] = title
+        return chapter
+
+    def get_novel_instance(self, novel_source:Optional[str]=None, ncode:Optional[str]=None,
+                           lazy:bool=False)->Optional[NovelInstance]:
+        """
+        :param novel_source:
+        :param ncode:
+        :param lazy: keep the texts of the chapters compressed (CompressedText) until they are read
+        :return:
+        """
+        if novel_source is not None:
+            row = self.connection.execute("SELECT id, source, extend FROM novels WHERE source = ?", (novel_source,)).fetchone()
+        else:
+            row = self.connection.execute("SELECT id, source, extend FROM novels WHERE ncode = ?", (ncode.lower(),)).fetchone()
+        if row is None:
+            return None
+        novel_id, source, extend = row
+        arcs = {arc_id: arc_title for arc_id, arc_title in
+                self.connection.execute("SELECT arc_id, arc_title FROM arcs WHERE novel_id = ?", (novel_id,))}
+        chapters:List = []
+        for arc_id, *chapter_row in self.connection.execute(
+                "SELECT arc_id, id, chapter_id, language, title, source, raw_content FROM chapters "
+                "WHERE novel_id = ? ORDER BY position", (novel_id,)).fetchall():
+            chapter = self._row_to_chapter(chapter_row, lazy)
+            if arc_id is None:
+                chapters.append(chapter)
+                continue
+            if len(chapters) == 0 or chapters[-1].get("arc_id") != arc_id:
+                arc = {"chapters": [], "arc_id": arc_id}
+                if arcs.get(arc_id) is not None:
+                    arc["arc_title"] = arcs[arc_id]
+                chapters.append(arc)
+            chapters[-1]["chapters"].append(chapter)
+        return NovelInstance(source=source, chapters=chapters, extend=json.loads(extend) if extend else None)
+
+    def get_chapter_instance(self, novel_source:str, chapter_id:str, lazy:bool=False)->Optional[Chapter]:
+        row = self.connection.execute(
+            "SELECT chapters.id, chapter_id, language, title, chapters.source, raw_content FROM chapters "
+            "JOIN novels ON novels.id = chapters.novel_id WHERE novels.source = ? AND chapters.chapter_id = ?",
+            (novel_source, str(chapter_id))).fetchone()
+        return self._row_to_chapter(row, lazy) if row else None
+
+    def delete_chapter(self, novel_source:str, chapter_id:str)->None:
+        with self.batch():
+            chapter_key = self._chapter_key(novel_source, chapter_id)
+            if chapter_key is not None:
+                self.connection.execute("DELETE FROM chapters WHERE id = ?", (chapter_key,))
+
+    def delete_novel(self, novel_source:str)->None:
+        with self.batch():
+            self._forget_dictionaries(novel_source)
+            self.connection.execute("DELETE FROM novels WHERE source = ?", (novel_source,))
+
+    def iter_novels(self)->Iterator[NovelSummary]:
+        """
+        the novels stored, by source, without reading their chapters
+        :return:
+        """
+        yield from (NovelSummary(*row) for row in self.connection.execute(
+            "SELECT source, ncode, json_extract(extend, '$.title'), json_extract(extend, '$.author'), "
+            "(SELECT COUNT(*) FROM chapters WHERE novel_id = novels.id) FROM novels ORDER BY source"))
+
+    def stats(self)->Dict[str, int]:
+        """
+        :return: the number of novels, arcs, chapters, artefacts and dictionaries, the bytes of the stored texts
+        and of the file
+        """
+        count = lambda table: self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "novels": count("novels"),
+            "arcs": count("arcs"),
+            "chapters": count("chapters"),
+            "artefacts": count("artefacts"),
+            "dictionaries": count("dictionaries"),
+            "text_bytes": self.connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(CAST(raw_content AS BLOB))), 0) FROM chapters").fetchone()[0],
+            "file_bytes": page_count * page_size,
+        }
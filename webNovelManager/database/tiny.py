@@ -0,0 +1,146 @@
+from typing import Dict, Iterable, List, Optional, Union
+import base64
+
+import structlog
+from tinydb import TinyDB, Query
+
+from .db import Database, get_ncode
+from ..data.compression import as_text
+from ..data.format import ArcHeader, Chapter, NovelInstance
+
+
+log = structlog.getLogger(__name__)
+
+
+def _encode_artefacts(artefacts:Dict)->Dict:
+    return {href: base64.b64encode(content).decode("ascii") if isinstance(content, bytes) else content
+            for href, content in artefacts.items()}
+
+def _decode_artefacts(artefacts:Dict)->Dict:
+    return {href: base64.b64decode(content) if isinstance(content, str) else content
+            for href, content in artefacts.items()}
+
+
+class TinyDBDatabase(Database):
+    """
+    A database stored in a TinyDB json file. Every write rewrites the whole file and every lookup
+    is a full scan: it is kept as a simple reference for the other backends
+    """
+    def __init__(self, path:Optional[str]=None):
+        super().__init__(path)
+        self.db = TinyDB(self.db_location or "db.json")
+        self.novels = self.db.table("novels")
+        self.chapters = self.db.table("chapters")
+
+    def close(self)->None:
+        self.db.close()
+
+    def _chapter_documents(self, novel_source:str, chapters:Iterable[Chapter], arc:Optional[ArcHeader],
+                           position:int)->List[Dict]:
+        documents = []
+        for index, chapter in enumerate(chapters):
+            chapter_id = chapter.get("id")
+            documents.append({
+                "novel": novel_source,
+                "chapter_id": str(chapter_id if chapter_id is not None else position + index),
+                "position": position + index,
+                "arc_id": arc.get("arc_id") if arc is not None else None,
+                "arc_title": arc.get("arc_title") if arc is not None else None,
+                "language": chapter.get("language"),
+                "title": chapter.get("title"),
+                "source": chapter.get("source"),
+                "raw_content": as_text(chapter.get("raw_content")),
+                "artefact": _encode_artefacts(chapter.get("artefact") or {}),
+            })
+        return documents
+
+    def store_novel_instance(self, novel:NovelInstance, ncode:Optional[str]=None)->None:
+        self.delete_novel(novel["source"])
+        self.novels.insert({"source": novel["source"], "ncode": ncode or get_ncode(novel["source"]),
+                            "extend": novel.get("extend")})
+        documents = []
+        for element in novel.get("chapters") or []:
+            if "chapters" in element:
+                arc = ArcHeader(**{key: value for key, value in element.items() if key != "chapters"})
+                documents += self._chapter_documents(novel["source"], element["chapters"], arc, len(documents))
+            else:
+                documents += self._chapter_documents(novel["source"], [element], None, len(documents))
+        self.chapters.insert_multiple(documents)
+
+    def store_chapter_instance(self, novel_source:str, chapters:Union[Chapter, Iterable[Chapter]],
+                               arc:Optional[ArcHeader]=None)->None:
+        if isinstance(chapters, dict):
+            chapters = [chapters]
+        novel = Query()
+        if not self.novels.contains(novel.source == novel_source):
+            self.novels.insert({"source": novel_source, "ncode": get_ncode(novel_source), "extend": None})
+        chapter = Query()
+        position = max((document["position"] for document in self.chapters.search(chapter.novel == novel_source)), default=-1) + 1
+        for document in self._chapter_documents(novel_source, chapters, arc, position):
+            condition = (chapter.novel == novel_source) & (chapter.chapter_id == document["chapter_id"])
+            stored = self.chapters.get(condition)
+            if stored is None:
+                self.chapters.insert(document)
+                continue
+            document["position"] = stored["position"]
+            if arc is None:
+                document["arc_id"], document["arc_title"] = stored["arc_id"], stored["arc_title"]
+            self.chapters.update(document, condition)
+
+    def store_artefacts(self, novel_source:str, chapter_id:str, artefacts:Dict)->None:
+        chapter = Query()
+        condition = (chapter.novel == novel_source) & (chapter.chapter_id == str(chapter_id))
+        document = self.chapters.get(condition)
+        if document is None:
+            raise KeyError(f"Unknown chapter {chapter_id} of {novel_source}")
+        self.chapters.update({"artefact": {**document["artefact"], **_encode_artefacts(artefacts)}}, condition)
+
+    def get_artefacts(self, novel_source:str, chapter_id:str)->Dict:
+        chapter = Query()
+        document = self.chapters.get((chapter.novel == novel_source) & (chapter.chapter_id == str(chapter_id)))
+        return _decode_artefacts(document["artefact"]) if document else {}
+
+    def _document_to_chapter(self, document:Dict)->Chapter:
+        chapter:Chapter = {
+            "language": document["language"],
+            "id": document["chapter_id"],
+            "source": document["source"],
+            "raw_content": document["raw_content"],
+            "artefact": _decode_artefacts(document["artefact"]),
+        }
+        if document["title"] is not None:
+            chapter["title"] = document["title"]
+        return chapter
+
+    def get_novel_instance(self, novel_source:Optional[str]=None, ncode:Optional[str]=None)->Optional[NovelInstance]:
+        novel = Query()
+        document = self.novels.get(novel.source == novel_source if novel_source is not None else novel.ncode == ncode.lower())
+        if document is None:
+            return None
+        chapter = Query()
+        chapters = []
+        for chapter_document in sorted(self.chapters.search(chapter.novel == document["source"]), key=lambda doc: doc["position"]):
+            if chapter_document["arc_id"] is None:
+                chapters.append(self._document_to_chapter(chapter_document))
+                continue
+            if len(chapters) == 0 or chapters[-1].get("arc_id") != chapter_document["arc_id"]:
+                arc = {"chapters": [], "arc_id": chapter_document["arc_id"]}
+                if chapter_document["arc_title"] is not None:
+                    arc["arc_title"] = chapter_document["arc_title"]
+                chapters.append(arc)
+            chapters[-1]["chapters"].append(self._document_to_chapter(chapter_document))
+        return NovelInstance(source=document["source"], chapters=chapters, extend=document["extend"])
+
+    def get_chapter_instance(self, novel_source:str, chapter_id:str)->Optional[Chapter]:
+        chapter = Query()
+        document = self.chapters.get((chapter.novel == novel_source) & (chapter.chapter_id == str(chapter_id)))
+        return self._document_to_chapter(document) if document else None
+
+    def delete_chapter(self, novel_source:str, chapter_id:str)->None:
+        chapter = Query()
+        self.chapters.remove((chapter.novel == novel_source) & (chapter.chapter_id == str(chapter_id)))
+
+    def delete_novel(self, novel_source:str)->None:
+        novel, chapter = Query(), Query()
+        self.novels.remove(novel.source == novel_source)
+        self.chapters.remove(chapter.novel == novel_source)
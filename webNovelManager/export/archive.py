@@ -0,0 +1,137 @@
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime
+import struct
+import zipfile
+import zlib
+
+from ..log import getLogger
+
+
+log = getLogger(__name__)
+
+
+_LOCAL_HEADER_ = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER_ = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIRECTORY_ = struct.Struct("<IHHHHIIH")
+_UTF8_FLAG_ = 0x800
+_VERSION_ = 20 # 2.0: deflate, no zip64
+_MAX_SIZE_ = 0xFFFFFFFF
+_MAX_ENTRIES_ = 0xFFFF
+
+
+class RawEntry(NamedTuple):
+    """
+    an entry of a zip archive as it is stored: compressed data and what describes it
+    """
+    method: int # zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED
+    crc: int
+    compressed_size: int
+    size: int
+    data: bytes
+
+
+def _dos_date_time(date_time:datetime)->Tuple[int, int]:
+    return ((date_time.year - 1980) << 9 | date_time.month << 5 | date_time.day,
+            date_time.hour << 11 | date_time.minute << 5 | date_time.second // 2)
+
+
+class StreamingZipWriter:
+    """
+    Write a zip archive entry by entry, each entry being written as soon as it is given.
+    Contrary to zipfile, an entry already compressed in another archive can be copied
+    without being decompressed and compressed again.
+    Zip64 isn't supported: archives are limited to 65535 entries and 4GiB
+    """
+    def __init__(self, output:BinaryIO, date_time:Optional[datetime]=None, level:int=6):
+        self.output = output
+        self.level = level
+        self._date, self._time = _dos_date_time(date_time or datetime.now())
+        self._central_directory:List[bytes] = []
+        self._names = set()
+        self._offset = 0
+
+    def write(self, name:str, content:bytes, compress:bool=True)->RawEntry:
+        """
+        compress and write an entry
+        :param name: the path of the entry in the archive
+        :param content:
+        :param compress: False to store the content as is (ex: the epub mimetype, images already compressed)
+        :return: the entry as written
+        """
+        if compress:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            data = compressor.compress(content) + compressor.flush()
+            entry = RawEntry(zipfile.ZIP_DEFLATED, zlib.crc32(content), len(data), len(content), data)
+        else:
+            entry = RawEntry(zipfile.ZIP_STORED, zlib.crc32(content), len(content), len(content), content)
+        self.write_raw(name, entry)
+        return entry
+
+    def write_raw(self, name:str, entry:RawEntry)->None:
+        """
+        write an entry whose data is already compressed, ex: read from another archive by read_raw_entries
+        :param name: the path of the entry in the archive
+        :param entry:
+        :return:
+        """
+        if name in self._names:
+            raise ValueError(f"Duplicate entry {name}")
+        if len(self._names) >= _MAX_ENTRIES_ or max(entry.size, entry.compressed_size, self._offset) > _MAX_SIZE_:
+            raise ValueError("The archive is too large for a zip without zip64")
+        self._names.add(name)
+        encoded_name = name.encode("utf-8")
+        self.output.write(_LOCAL_HEADER_.pack(0x04034b50, _VERSION_, _UTF8_FLAG_, entry.method, self._time, self._date,
+                                              entry.crc, entry.compressed_size, entry.size, len(encoded_name), 0))
+        self.output.write(encoded_name)
+        self.output.write(entry.data)
+        self._central_directory.append(
+            _CENTRAL_HEADER_.pack(0x02014b50, _VERSION_, _VERSION_, _UTF8_FLAG_, entry.method, self._time, self._date,
+                                  entry.crc, entry.compressed_size, entry.size, len(encoded_name), 0, 0, 0, 0, 0,
+                                  self._offset) + encoded_name)
+        self._offset += _LOCAL_HEADER_.size + len(encoded_name) + len(entry.data)
+
+    def close(self)->None:
+        """
+        write the central directory, the archive is complete afterwards
+        :return:
+        """
+        central_directory = b"".join(self._central_directory)
+        self.output.write(central_directory)
+        self.output.write(_END_OF_CENTRAL_DIRECTORY_.pack(0x06054b50, 0, 0, len(self._central_directory),
+                                                          len(self._central_directory), len(central_directory),
+                                                          self._offset, 0))
+        self.output.flush()
+
+
+class RawZipReader:
+    """
+    Read the entries of a zip archive without decompressing them
+    """
+    def __init__(self, path:str):
+        self._zip = zipfile.ZipFile(path)
+        self._file = open(path, "rb")
+        self._infos:Dict[str, zipfile.ZipInfo] = {info.filename: info for info in self._zip.infolist()}
+
+    def __contains__(self, name:str)->bool:
+        return name in self._infos
+
+    def read(self, name:str)->bytes:
+        """
+        :return: the decompressed content of an entry
+        """
+        return self._zip.read(name)
+
+    def read_raw(self, name:str)->RawEntry:
+        """
+        :return: the compressed content of an entry, to be copied by StreamingZipWriter.write_raw
+        """
+        info = self._infos[name]
+        self._file.seek(info.header_offset)
+        header = _LOCAL_HEADER_.unpack(self._file.read(_LOCAL_HEADER_.size))
+        self._file.seek(header[9] + header[10], 1) # name and extra field
+        return RawEntry(info.compress_type, info.CRC, info.compress_size, info.file_size,
+                        self._file.read(info.compress_size))
+
+    def close(self)->None:
+        self._zip.close()
+        self._file.close()
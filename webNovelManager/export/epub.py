@@ -0,0 +1,327 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+import re
+import zipfile
+
+from ..data.compression import as_text
+from ..data.format import ArcHeader, Chapter, NovelInstance
+from ..database.artefact import ArtefactStore
+from ..log import getLogger
+from .archive import RawZipReader, StreamingZipWriter
+
+
+log = getLogger(__name__)
+
+
+_MANIFEST_ = "META-INF/export-manifest.json" # entry name -> sha256 of its content, to reuse the entries
+_CONTAINER_ = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+"""
+_STYLE_ = """body { margin: 0 1em; line-height: 1.7; }
+p { margin: 0; }
+div.illustration { text-align: center; margin: 1em 0; }
+div.illustration img { max-width: 100%; }
+"""
+_CHAPTER_ = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="{language}" lang="{language}">
+<head><meta charset="utf-8"/><title>{title}</title><link rel="stylesheet" type="text/css" href="../style.css"/></head>
+<body><section epub:type="chapter">
+{body}
+</section></body>
+</html>
+"""
+# characters which can't appear in xml
+_INVALID_XML_ = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_IMAGE_TYPES_ = {b"\x89PNG": ("image/png", ".png"), b"\xff\xd8": ("image/jpeg", ".jpg"),
+                 b"GIF8": ("image/gif", ".gif"), b"RIFF": ("image/webp", ".webp")}
+
+
+# xml.sax.saxutils does the same but imports urllib.request, http.client and ssl: longer than a local command
+def _escape(value:str)->str:
+    return value.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;")
+
+
+def _quoteattr(value:str)->str:
+    """
+    the value escaped and quoted as an attribute, as xml.sax.saxutils.quoteattr
+    """
+    value = _escape(value).replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return '"{}"'.format(value.replace('"', "&quot;"))
+
+
+def _text(value:Optional[str])->str:
+    return _escape(_INVALID_XML_.sub("", value or ""))
+
+
+def _image_type(content:bytes, media_type:Optional[str]=None)->Tuple[str, str]:
+    """
+    :return: the media type and the extension of an image
+    """
+    for magic, (sniffed_type, extension) in _IMAGE_TYPES_.items():
+        if content.startswith(magic):
+            return sniffed_type, extension
+    media_type = (media_type or "image/jpeg").split(";")[0].strip()
+    return media_type, {value[0]: value[1] for value in _IMAGE_TYPES_.values()}.get(media_type, ".img")
+
+
+def iter_novel_instance(novel:NovelInstance)->Iterator[Tuple[Optional[ArcHeader], Chapter]]:
+    """
+    yield the chapters of a novel held in memory as WebsitePlugin.iter_chapters does
+    :param novel:
+    :return: an iterator of (arc, chapter), the arc is None for the chapters outside of any arc
+    """
+    for item in novel.get("chapters") or []:
+        if "arc_id" in item:
+            arc = ArcHeader(**{key: value for key, value in item.items() if key != "chapters"})
+            for chapter in item["chapters"]:
+                yield arc, chapter
+        else:
+            yield None, item
+
+
+class EpubWriter:
+    """
+    Write an EPUB 3 book chapter by chapter: each chapter and its images are added to the archive
+    as soon as they are given, only their titles are kept to build the navigation and the package
+    document at the end.
+    When the book already exists, every entry whose content didn't change is copied from it
+    still compressed, so exporting a novel again after an update only compresses the new chapters
+    """
+    def __init__(self, path:str, title:str, author:Optional[str]=None, identifier:Optional[str]=None,
+                 language:str="ja", artefact_store:Optional[ArtefactStore]=None, reuse:bool=True):
+        self.path = path
+        self.title = title
+        self.author = author
+        self.identifier = identifier or f"urn:sha256:{hashlib.sha256(title.encode('utf-8')).hexdigest()}"
+        self.language = language
+        self.artefact_store = artefact_store
+        self.compressed = 0 # number of entries compressed
+        self.reused = 0 # number of entries copied from the previous book
+
+        self._previous:Optional[RawZipReader] = None
+        self._previous_names:Dict[str, str] = {} # sha256 -> entry of the previous book
+        if reuse and os.path.exists(path):
+            self._open_previous()
+        self._hashes:Dict[str, str] = {}
+        self._chapters:List[Tuple[str, str, Optional[ArcHeader]]] = [] # (entry, title, arc)
+        self._images:Dict[str, str] = {} # entry -> media type
+        self._file = open(f"{path}.part", "wb")
+        self._zip = StreamingZipWriter(self._file)
+        self._zip.write("mimetype", b"application/epub+zip", compress=False) # first and stored, as required
+        self._write("META-INF/container.xml", _CONTAINER_.encode("utf-8"))
+        self._write("OEBPS/style.css", _STYLE_.encode("utf-8"))
+
+    def _open_previous(self)->None:
+        try:
+            self._previous = RawZipReader(self.path)
+            previous_hashes = json.loads(self._previous.read(_MANIFEST_))
+        except (OSError, zipfile.BadZipFile, KeyError, ValueError) as error:
+            log.warning(f"Can't reuse the entries of {self.path}: {error!r}")
+            if self._previous is not None:
+                self._previous.close()
+                self._previous = None
+            return
+        self._previous_names = {sha256: name for name, sha256 in previous_hashes.items() if name in self._previous}
+
+    def __enter__(self)->"EpubWriter":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback)->None:
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write(self, name:str, content:Optional[bytes]=None, sha256:Optional[str]=None,
+               load:Optional[Callable[[], bytes]]=None, compress:bool=True)->None:
+        """
+        add an entry, copied from the previous book if it holds the same content
+        :param name:
+        :param content:
+        :param sha256: the hash of the content, if known the content is only loaded when it has to be written
+        :param load: return the content when it isn't given
+        :param compress:
+        :return:
+        """
+        if sha256 is None:
+            sha256 = hashlib.sha256(content).hexdigest()
+        previous_name = self._previous_names.get(sha256)
+        if previous_name is not None:
+            self._zip.write_raw(name, self._previous.read_raw(previous_name))
+            self.reused += 1
+        else:
+            self._zip.write(name, content if content is not None else load(), compress=compress)
+            self.compressed += 1
+        self._hashes[name] = sha256
+
+    def _add_image(self, image)->str:
+        """
+        add an image once whatever the number of chapters showing it
+        :param image: the bytes of the image, or its reference in the artefact store
+        :return: the entry of the image
+        """
+        if isinstance(image, dict): # ArtefactReference
+            if self.artefact_store is None:
+                raise ValueError("An artefact store is needed to export the artefact references")
+            sha256 = image["sha256"]
+            with self.artefact_store.open(sha256) as artefact_file:
+                media_type, extension = _image_type(artefact_file.read(16), image.get("media_type"))
+            load = lambda: self.artefact_store.get(sha256)
+        else:
+            sha256 = hashlib.sha256(image).hexdigest()
+            media_type, extension = _image_type(image)
+            load = lambda: image
+        name = f"OEBPS/images/{sha256[:32]}{extension}"
+        if name not in self._images:
+            self._write(name, sha256=sha256, load=load, compress=False) # images are already compressed
+            self._images[name] = media_type
+        return name
+
+    def add_chapter(self, chapter:Chapter, arc:Optional[ArcHeader]=None)->None:
+        """
+        add the next chapter of the book
+        :param chapter:
+        :param arc: the arc of the chapter, None if it isn't part of any
+        :return:
+        """
+        number = len(self._chapters) + 1
+        title = chapter.get("title") or f"{number}"
+        lines = _text((as_text(chapter.get("raw_content")) or "").strip("\n")).split("\n") # escaped at once, much faster
+        body = [f"<p>{line}</p>" if line.strip() else "<p><br/></p>" for line in lines]
+        for image in (chapter.get("artefact") or {}).values():
+            body.append(f'<div class="illustration"><img src="../{self._add_image(image)[len("OEBPS/"):]}" alt=""/></div>')
+        name = f"OEBPS/text/chapter_{number:05d}.xhtml"
+        self._write(name, _CHAPTER_.format(language=self.language, title=_text(title), body="\n".join(body)).encode("utf-8"))
+        self._chapters.append((name, title, arc))
+
+    def add_chapters(self, chapters:Iterable[Tuple[Optional[ArcHeader], Chapter]])->None:
+        """
+        add chapters as they come, ex: from WebsitePlugin.iter_chapters
+        :param chapters: an iterable of (arc, chapter)
+        :return:
+        """
+        for arc, chapter in chapters:
+            self.add_chapter(chapter, arc)
+
+    def _toc(self)->List[Tuple[Optional[str], List[Tuple[str, str]]]]:
+        """
+        :return: the chapters grouped by consecutive arc: [(arc title or None, [(href, title)])]
+        """
+        toc = []
+        previous_arc = object()
+        for name, title, arc in self._chapters:
+            arc_key = None if arc is None else arc.get("arc_id")
+            if arc_key != previous_arc:
+                toc.append((None if arc is None else (arc.get("arc_title") or f"{arc_key}"), []))
+                previous_arc = arc_key
+            toc[-1][1].append((name[len("OEBPS/"):], title))
+        return toc
+
+    def _navigation(self)->bytes:
+        items = []
+        for arc_title, chapters in self._toc():
+            links = "\n".join(f'<li><a href={_quoteattr(href)}>{_text(title)}</a></li>' for href, title in chapters)
+            if arc_title is None:
+                items.append(links)
+            else:
+                items.append(f'<li><a href={_quoteattr(chapters[0][0])}>{_text(arc_title)}</a>\n<ol>\n{links}\n</ol></li>')
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+                f'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+                f'xml:lang="{self.language}" lang="{self.language}">\n<head><meta charset="utf-8"/><title>{_text(self.title)}</title></head>\n'
+                f'<body><nav epub:type="toc" id="toc"><h1>{_text(self.title)}</h1>\n<ol>\n' + "\n".join(items)
+                + '\n</ol></nav></body>\n</html>\n').encode("utf-8")
+
+    def _ncx(self)->bytes:
+        """
+        the table of content of EPUB 2, for the readers ignoring the navigation document
+        """
+        points = []
+        order = 0
+        for arc_index, (arc_title, chapters) in enumerate(self._toc()):
+            children = []
+            for href, title in chapters:
+                order += 1
+                children.append(f'<navPoint id="p{order}" playOrder="{order}"><navLabel><text>{_text(title)}</text></navLabel>'
+                                f'<content src={_quoteattr(href)}/></navPoint>')
+            if arc_title is None:
+                points.extend(children)
+            else: # an arc points to its first chapter
+                points.append(f'<navPoint id="a{arc_index}" playOrder="{order - len(chapters) + 1}"><navLabel><text>{_text(arc_title)}</text></navLabel>'
+                              f'<content src={_quoteattr(chapters[0][0])}/>\n' + "\n".join(children) + '</navPoint>')
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+                f'<head><meta name="dtb:uid" content={_quoteattr(self.identifier)}/></head>\n'
+                f'<docTitle><text>{_text(self.title)}</text></docTitle>\n<navMap>\n' + "\n".join(points)
+                + '\n</navMap>\n</ncx>\n').encode("utf-8")
+
+    def _package(self)->bytes:
+        items = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>',
+                 '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>',
+                 '<item id="style" href="style.css" media-type="text/css"/>']
+        items += [f'<item id="c{index}" href={_quoteattr(name[len("OEBPS/"):])} media-type="application/xhtml+xml"/>'
+                  for index, (name, _, _) in enumerate(self._chapters, 1)]
+        items += [f'<item id="i{index}" href={_quoteattr(name[len("OEBPS/"):])} media-type={_quoteattr(media_type)}/>'
+                  for index, (name, media_type) in enumerate(self._images.items(), 1)]
+        spine = "\n".join(f'<itemref idref="c{index}"/>' for index in range(1, len(self._chapters) + 1))
+        creator = f"<dc:creator>{_text(self.author)}</dc:creator>\n" if self.author else ""
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" xml:lang="{self.language}">\n'
+                f'<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+                f'<dc:identifier id="book-id">{_text(self.identifier)}</dc:identifier>\n'
+                f'<dc:title>{_text(self.title)}</dc:title>\n{creator}<dc:language>{self.language}</dc:language>\n'
+                f'<meta property="dcterms:modified">{datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}</meta>\n'
+                f'</metadata>\n<manifest>\n' + "\n".join(items) + f'\n</manifest>\n<spine toc="ncx">\n{spine}\n</spine>\n'
+                f'</package>\n').encode("utf-8")
+
+    def close(self)->None:
+        """
+        write the navigation and the package document, then replace the previous book
+        :return:
+        """
+        self._write("OEBPS/nav.xhtml", self._navigation())
+        self._write("OEBPS/toc.ncx", self._ncx())
+        self._write("OEBPS/content.opf", self._package())
+        self._zip.write(_MANIFEST_, json.dumps(self._hashes).encode("utf-8"))
+        self._zip.close()
+        self._file.close()
+        if self._previous is not None:
+            self._previous.close()
+        os.replace(f"{self.path}.part", self.path)
+        log.info(f"Exported {len(self._chapters)} chapters to {self.path}: "
+                 f"{self.compressed} entries compressed, {self.reused} reused")
+
+    def abort(self)->None:
+        """
+        drop the book being written, the previous one is kept
+        :return:
+        """
+        self._file.close()
+        if self._previous is not None:
+            self._previous.close()
+        os.remove(f"{self.path}.part")
+
+
+def export_novel(path:str, novel_info:Dict, chapters:Iterable[Tuple[Optional[ArcHeader], Chapter]],
+                 artefact_store:Optional[ArtefactStore]=None, language:str="ja")->EpubWriter:
+    """
+    Export a novel into an epub, without holding it in memory
+    :param path: the epub file, its unchanged entries are reused if it already exists
+    :param novel_info: the info of the novel, as returned by get_novel_info (title, author, link)
+    :param chapters: an iterable of (arc, chapter), ex: WebsitePlugin.iter_chapters or iter_novel_instance
+    :param artefact_store: the store holding the images of the chapters, if they are references
+    :param language:
+    :return: the closed writer, holding the number of entries compressed and reused
+    """
+    with EpubWriter(path, novel_info.get("title") or path, author=novel_info.get("author"),
+                    identifier=novel_info.get("link"), language=language, artefact_store=artefact_store) as writer:
+        writer.add_chapters(chapters)
+    return writer
@@ -0,0 +1,276 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from contextlib import contextmanager
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+
+import structlog
+
+from ..data.format import ArcHeader, ArcIndex, Chapter, NovelInstance
+
+
+log = structlog.getLogger(__name__)
+
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    novel TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL, -- pending, done or failed
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL, -- index, chapter or store
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    arc_id INTEGER,
+    arc_title TEXT,
+    state TEXT NOT NULL DEFAULT 'pending', -- pending, leased, done or failed
+    owner TEXT,
+    lease_until REAL, -- end of the lease, or of the delay before trying a failed task again
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result BLOB, -- the checkpoint of a fetched chapter, or the arcs of a fetched index
+    UNIQUE (job, kind, url)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, kind);
+CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job, state);
+"""
+
+# the store task of a job waits for every other task of the job to be done
+_CLAIM_ = """
+SELECT id FROM tasks WHERE attempts < ? AND state IN ('pending', 'leased') AND COALESCE(lease_until, 0) < ?
+AND job IN (SELECT id FROM jobs WHERE state = 'pending')
+AND (kind != 'store' OR NOT EXISTS (SELECT 1 FROM tasks AS other WHERE other.job = tasks.job
+                                    AND other.kind != 'store' AND other.state != 'done'))
+ORDER BY CASE kind WHEN 'store' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, id LIMIT 1
+"""
+
+
+class Task(NamedTuple):
+    id: int
+    job: int
+    kind: str # "index": fetch the index of the novel, "chapter": fetch a chapter, "store": store the novel
+    url: str
+    position: int
+    arc_id: Optional[int]
+    arc_title: Optional[str]
+    attempts: int
+
+
+def default_owner()->str:
+    """
+    :return: an identifier of the worker unique across processes and threads, the host naming it in the logs
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    """
+    A queue of download jobs persisted in a sqlite file, shared by the worker processes of one host: the file is
+    journaled in WAL mode, whose index is in memory shared by the processes, so it mustn't be on a network filesystem.
+    A job fetches a whole novel: a task fetches its index, which adds a task per chapter, and a last task
+    stores the novel once every chapter is fetched. Each fetched chapter is checkpointed in the queue,
+    so a job interrupted by a crash continues where it stopped.
+    A worker claims a task for a lease: if it dies, the task is given to another worker once the lease expires
+    """
+    _MAX_ATTEMPTS_ = 5
+    _RETRY_DELAY_ = 10.0 # seconds before a failed task is tried again, doubled at each attempt
+    _TIMEOUT_ = 30.0 # seconds waited for the lock of the file held by another worker
+
+    def __init__(self, path:str, max_attempts:Optional[int]=None, retry_delay:Optional[float]=None):
+        self.path = path
+        self.max_attempts = max_attempts or self._MAX_ATTEMPTS_
+        self.retry_delay = self._RETRY_DELAY_ if retry_delay is None else retry_delay
+        self.connection = sqlite3.connect(path, timeout=self._TIMEOUT_, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(_SCHEMA_)
+        self._lock = threading.RLock()
+
+    def close(self)->None:
+        self.connection.close()
+
+    @contextmanager
+    def _transaction(self)->Iterator[sqlite3.Connection]:
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def submit(self, novel_link:str)->int:
+        """
+        add a job fetching a novel. A job not finished for the same novel is resumed instead,
+        its failed tasks are tried again
+        :param novel_link:
+        :return: the id of the job
+        """
+        with self._transaction():
+            row = self.connection.execute("SELECT id, state FROM jobs WHERE novel = ?", (novel_link,)).fetchone()
+            if row is not None and row[1] != "done":
+                self.connection.execute("UPDATE tasks SET state = 'pending', attempts = 0, lease_until = NULL "
+                                        "WHERE job = ? AND state = 'failed'", (row[0],))
+                self.connection.execute("UPDATE jobs SET state = 'pending', finished = NULL WHERE id = ?", (row[0],))
+                return row[0]
+            if row is not None: # fetch the novel again from scratch
+                self.connection.execute("DELETE FROM jobs WHERE id = ?", (row[0],))
+            job = self.connection.execute("INSERT INTO jobs (novel, state, created) VALUES (?, 'pending', ?) RETURNING id",
+                                          (novel_link, time.time())).fetchone()[0]
+            self.connection.executemany("INSERT INTO tasks (job, kind, url) VALUES (?, ?, ?)",
+                                        [(job, "index", novel_link), (job, "store", novel_link)])
+            return job
+
+    def claim(self, owner:Optional[str]=None, lease:float=60.0)->Optional[Task]:
+        """
+        lease the next task to do: a pending task, or a task whose lease expired
+        :param owner: the worker, see default_owner
+        :param lease: seconds the task is reserved for the worker
+        :return: None if there is nothing to do for now
+        """
+        now = time.time()
+        with self._transaction():
+            # the workers which had the last attempt of these tasks died
+            for task, job in self.connection.execute(
+                    "UPDATE tasks SET state = 'failed', error = 'lease expired' WHERE state = 'leased' AND lease_until < ? "
+                    "AND attempts >= ? RETURNING id, job", (now, self.max_attempts)).fetchall():
+                self.connection.execute("UPDATE jobs SET state = 'failed', finished = ? WHERE id = ?", (now, job))
+            row = self.connection.execute(_CLAIM_, (self.max_attempts, now)).fetchone()
+            if row is None:
+                return None
+            return Task(*self.connection.execute(
+                "UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ? "
+                "RETURNING id, job, kind, url, position, arc_id, arc_title, attempts",
+                (owner or default_owner(), now + lease, row[0])).fetchone())
+
+    def renew(self, task:Task, owner:Optional[str]=None, lease:float=60.0)->bool:
+        """
+        extend the lease of a task still being worked on
+        :return: False if the lease was lost, the task was given to another worker
+        """
+        with self._transaction():
+            return self.connection.execute(
+                "UPDATE tasks SET lease_until = ? WHERE id = ? AND state = 'leased' AND owner = ?",
+                (time.time() + lease, task.id, owner or default_owner())).rowcount == 1
+
+    def _finish(self, task:Task, result:Optional[bytes]=None)->None:
+        self.connection.execute("UPDATE tasks SET state = 'done', lease_until = NULL, error = NULL, result = ? "
+                                "WHERE id = ?", (result, task.id))
+
+    def complete_index(self, task:Task, arcs:List[ArcIndex])->None:
+        """
+        add a task for every chapter of the index, the chapters already fetched are kept
+        :param task: an index task
+        :param arcs: the index of the novel, empty for a single chapter novel
+        :return:
+        """
+        if arcs:
+            rows = [(task.job, entry["link"], position, arc.get("arc_id"), arc.get("arc_title"))
+                    for position, (arc, entry) in enumerate((arc, entry) for arc in arcs for entry in arc["chapters"])]
+        else:
+            rows = [(task.job, task.url, 0, None, None)]
+        # the arcs are kept for assemble, an arc without chapter having no task
+        headers = [ArcHeader(**{key: value for key, value in arc.items() if key != "chapters"}) for arc in arcs]
+        with self._transaction():
+            self.connection.executemany(
+                "INSERT INTO tasks (job, kind, url, position, arc_id, arc_title) VALUES (?, 'chapter', ?, ?, ?, ?) "
+                "ON CONFLICT (job, kind, url) DO UPDATE SET position = excluded.position, arc_id = excluded.arc_id, "
+                "arc_title = excluded.arc_title", rows)
+            self._finish(task, pickle.dumps(headers, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def complete_chapter(self, task:Task, chapter:Chapter)->None:
+        """
+        checkpoint a fetched chapter
+        :param task: a chapter task
+        :param chapter:
+        :return:
+        """
+        result = pickle.dumps(chapter, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._transaction():
+            self._finish(task, result)
+
+    def complete_store(self, task:Task)->None:
+        """
+        end the job of a store task, its checkpoints are dropped
+        :param task: a store task
+        :return:
+        """
+        with self._transaction():
+            self._finish(task)
+            self.connection.execute("UPDATE tasks SET result = NULL WHERE job = ?", (task.job,))
+            self.connection.execute("UPDATE jobs SET state = 'done', finished = ? WHERE id = ?", (time.time(), task.job))
+
+    def fail(self, task:Task, error:BaseException)->None:
+        """
+        give the task back to be tried again after a delay, the job fails once a task failed max_attempts times
+        :param task:
+        :param error:
+        :return:
+        """
+        failed = task.attempts >= self.max_attempts
+        retry_at = time.time() + self.retry_delay * 2 ** (task.attempts - 1)
+        with self._transaction():
+            self.connection.execute("UPDATE tasks SET state = ?, owner = NULL, lease_until = ?, error = ? WHERE id = ?",
+                                    ("failed" if failed else "pending", retry_at, repr(error), task.id))
+            if failed:
+                self.connection.execute("UPDATE jobs SET state = 'failed', finished = ? WHERE id = ?", (time.time(), task.job))
+        log.warning(f"{task.kind} task {task.url} failed ({task.attempts}/{self.max_attempts} attempts): {error!r}")
+
+    def assemble(self, task:Task)->NovelInstance:
+        """
+        build the novel of a job from its checkpointed chapters, as WebsitePlugin.fetch_novel does
+        :param task: the store task of the job
+        :return:
+        """
+        novel:NovelInstance = {"source": task.url}
+        row = self.connection.execute("SELECT result FROM tasks WHERE job = ? AND kind = 'index'", (task.job,)).fetchone()
+        chapters = [{"chapters": [], **header} for header in pickle.loads(row[0])] if row and row[0] else []
+        arcs = {element["arc_id"]: element for element in chapters}
+        for arc_id, arc_title, result in self.connection.execute(
+                "SELECT arc_id, arc_title, result FROM tasks WHERE job = ? AND kind = 'chapter' ORDER BY position",
+                (task.job,)):
+            chapter = pickle.loads(result)
+            if arc_id is None:
+                chapters.append(chapter)
+                continue
+            if arc_id not in arcs: # an index checkpointed without its arcs
+                arcs[arc_id] = {"chapters": [], "arc_id": arc_id, "arc_title": arc_title}
+                chapters.append(arcs[arc_id])
+            arcs[arc_id]["chapters"].append(chapter)
+        novel["chapters"] = chapters
+        novel["extend"] = None
+        return novel
+
+    def status(self, novel_link:Optional[str]=None)->Dict[str, int]:
+        """
+        :param novel_link: the job of a novel, else every job
+        :return: the number of tasks by state
+        """
+        if novel_link is None:
+            rows = self.connection.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state")
+        else:
+            rows = self.connection.execute("SELECT tasks.state, COUNT(*) FROM tasks JOIN jobs ON jobs.id = tasks.job "
+                                           "WHERE jobs.novel = ? GROUP BY tasks.state", (novel_link,))
+        return dict(rows.fetchall())
+
+    def has_work(self)->bool:
+        """
+        :return: whether a task is still to do or being done, which may add new tasks
+        """
+        return self.connection.execute(
+            "SELECT EXISTS (SELECT 1 FROM tasks JOIN jobs ON jobs.id = tasks.job WHERE jobs.state = 'pending' "
+            "AND tasks.state IN ('pending', 'leased'))").fetchone()[0] == 1
+
+    def job_state(self, novel_link:str)->Optional[str]:
+        row = self.connection.execute("SELECT state FROM jobs WHERE novel = ?", (novel_link,)).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,134 @@
+from typing import Callable, List, Optional
+import multiprocessing
+import threading
+import time
+
+import structlog
+
+from ..database.db import Database
+from ..database.sqlite import SQLiteDatabase
+from ..plugins.plugins import WebsitePlugin
+from ..plugins.registry import get_registry
+from .queue import JobQueue, Task, default_owner
+
+
+log = structlog.getLogger(__name__)
+
+
+class Worker:
+    """
+    Run the tasks of a job queue: fetch the indexes and the chapters with the plugin of their url,
+    and store the novels whose chapters are all fetched.
+    While a task runs its lease is renewed in the background, so a slow download isn't given to another worker
+    """
+    _LEASE_ = 60.0 # seconds
+
+    def __init__(self, queue:JobQueue, database:Database, get_plugin:Optional[Callable[[str], WebsitePlugin]]=None,
+                 owner:Optional[str]=None, lease:Optional[float]=None):
+        """
+        :param queue:
+        :param database: where the novels are stored
+        :param get_plugin: url -> plugin fetching it, default: the plugin registry
+        :param owner: the name of the worker in the leases
+        :param lease: seconds a task is reserved for the worker
+        """
+        self.queue = queue
+        self.database = database
+        self.get_plugin = get_plugin or get_registry().get_plugin
+        self.owner = owner or default_owner()
+        self.lease = lease or self._LEASE_
+        self.done = 0
+
+    def _keep_lease(self, task:Task, stop:threading.Event)->None:
+        while not stop.wait(self.lease / 3):
+            if not self.queue.renew(task, self.owner, self.lease):
+                log.warning(f"Lost the lease of the {task.kind} task {task.url}")
+                return
+
+    def run_task(self, task:Task)->None:
+        """
+        do a task and report it to the queue, a failed task is given back to be tried again
+        :param task:
+        :return:
+        """
+        stop = threading.Event()
+        keeper = threading.Thread(target=self._keep_lease, args=(task, stop), daemon=True)
+        keeper.start()
+        try:
+            if task.kind == "store":
+                self.database.store_novel_instance(self.queue.assemble(task))
+                self.queue.complete_store(task)
+                log.info(f"Stored {task.url}")
+            else:
+                plugin = self.get_plugin(task.url)
+                if plugin is None:
+                    raise ValueError(f"No plugin handles {task.url}")
+                if task.kind == "index":
+                    self.queue.complete_index(task, plugin.fetch_index(task.url))
+                else:
+                    self.queue.complete_chapter(task, plugin.fetch_chapter(task.url))
+            self.done += 1
+        except Exception as error:
+            self.queue.fail(task, error)
+        finally:
+            stop.set()
+            keeper.join()
+
+    def run_once(self)->bool:
+        """
+        :return: False if there was no task to do
+        """
+        task = self.queue.claim(self.owner, self.lease)
+        if task is None:
+            return False
+        self.run_task(task)
+        return True
+
+    def run(self, idle_timeout:Optional[float]=0.0, poll_interval:float=0.5)->int:
+        """
+        run tasks until the queue is empty. While the tasks left are leased by other workers,
+        wait for the tasks they may add (ex: the chapters of an index)
+        :param idle_timeout: seconds to wait for new jobs once the queue is empty, None to run forever
+        :param poll_interval: seconds between two looks at a queue without task to claim
+        :return: the number of tasks done
+        """
+        idle_since = None
+        while True:
+            if self.run_once():
+                idle_since = None
+                continue
+            if self.queue.has_work():
+                idle_since = None
+            else:
+                idle_since = idle_since or time.monotonic()
+                if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                    return self.done
+            time.sleep(poll_interval)
+
+
+def _work(queue_path:str, database_path:str, get_plugin:Optional[Callable[[str], WebsitePlugin]],
+          idle_timeout:Optional[float])->int:
+    queue = JobQueue(queue_path)
+    database = SQLiteDatabase(database_path)
+    try:
+        return Worker(queue, database, get_plugin).run(idle_timeout=idle_timeout)
+    finally:
+        database.close()
+        queue.close()
+
+
+def run_workers(queue_path:str, database_path:str, processes:Optional[int]=None,
+                get_plugin:Optional[Callable[[str], WebsitePlugin]]=None, idle_timeout:Optional[float]=0.0)->List[int]:
+    """
+    run worker processes on a queue until it is empty, each with its own connections and plugins.
+    More workers can join from other processes of the host sharing the files
+    :param queue_path:
+    :param database_path: the sqlite database where the novels are stored
+    :param processes: default: one per core
+    :param get_plugin: url -> plugin, must be picklable (a function of a module), default: the plugin registry
+    :param idle_timeout: see Worker.run
+    :return: the number of tasks done by each worker
+    """
+    processes = processes or multiprocessing.cpu_count()
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        return pool.starmap(_work, [(queue_path, database_path, get_plugin, idle_timeout)] * processes)
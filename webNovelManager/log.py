@@ -0,0 +1,54 @@
+from typing import Any, Optional
+import sys
+
+
+__LEVEL__:Optional[str] = None # set by set_level, structlog is configured with it once imported
+
+
+class LazyLogger:
+    """
+    A structlog logger importing structlog on its first event. Importing structlog costs more than
+    a local command of the cli (list, stats...), the modules these commands import log through it
+    """
+    __slots__ = ("_name", "_logger")
+
+    def __init__(self, name:Optional[str]=None):
+        self._name = name
+        self._logger = None
+
+    def __getattr__(self, method:str)->Any:
+        if self._logger is None:
+            if "structlog" not in sys.modules and __LEVEL__ is not None:
+                _configure()
+            import structlog
+            self._logger = structlog.getLogger(self._name)
+        return getattr(self._logger, method)
+
+
+def getLogger(name:Optional[str]=None)->LazyLogger:
+    """
+    same as structlog.getLogger
+    :param name:
+    :return:
+    """
+    return LazyLogger(name)
+
+
+def _configure()->None:
+    import structlog
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(__LEVEL__))
+
+
+def set_level(level:str, now:bool=False)->None:
+    """
+    Drop the events under level (debug, info, warning...), structlog printing every event otherwise.
+    structlog is configured at once if imported, else with its import by the first event of a LazyLogger,
+    so that a local command of the cli still doesn't import it
+    :param level:
+    :param now: import and configure structlog at once, for the modules logging through structlog itself
+    :return:
+    """
+    global __LEVEL__
+    __LEVEL__ = level
+    if now or "structlog" in sys.modules:
+        _configure()
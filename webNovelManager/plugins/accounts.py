@@ -0,0 +1,106 @@
+from typing import Callable, Dict, Iterator, List, Optional, Type, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+
+import structlog
+
+from ..data.format import LoginInfo, ShortNovel
+from ..database.artefact import ArtefactStore
+from .cookies import CookieStore, get_cookie_store
+from .plugins import WebsitePlugin
+
+
+log = structlog.getLogger(__name__)
+
+Result = TypeVar("Result")
+
+_NOT_LOGGED_ = object() # the result of an account which couldn't log in, a function may return None
+
+
+class AccountPool:
+    """
+    One logged plugin per account of a website, each with its own session and cookies.
+    The accounts are crawled in parallel, they still share the scheduler of the domain and the cookie store,
+    so that a login done by a process is reused by the others
+    """
+    def __init__(self, plugin_class:Type[WebsitePlugin], accounts:Optional[List[LoginInfo]]=None,
+                 cookie_store:Optional[CookieStore]=None, artefact_store:Optional[ArtefactStore]=None):
+        """
+        :param plugin_class:
+        :param accounts: default: the accounts of the plugin settings, see WebsitePlugin.get_accounts
+        :param cookie_store: default: the one of the settings
+        :param artefact_store:
+        """
+        accounts = accounts if accounts is not None else plugin_class.get_accounts()
+        if not accounts:
+            raise ValueError(f"No account configured for {plugin_class.__name__}")
+        cookie_store = cookie_store if cookie_store is not None else get_cookie_store()
+        self.plugins:Dict[str, WebsitePlugin] = {
+            account["login"]: plugin_class(artefact_store, credentials=account, cookie_store=cookie_store)
+            for account in accounts
+        }
+        self._idle:List[str] = list(self.plugins) # the logins of the plugins no one is using
+        self._condition = threading.Condition()
+
+    def __len__(self)->int:
+        return len(self.plugins)
+
+    @contextmanager
+    def _borrow(self, login:Optional[str]=None, timeout:Optional[float]=None)->Iterator[WebsitePlugin]:
+        """
+        take the plugin of an account out of the idle ones until the context ends, waiting for it if it is busy
+        :param login: the account, default: the first idle one
+        :param timeout: seconds to wait, None to wait forever
+        :return:
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: login in self._idle if login is not None else self._idle, timeout):
+                raise TimeoutError(f"No idle account after {timeout}s")
+            login = login if login is not None else self._idle[0]
+            self._idle.remove(login)
+        try:
+            yield self.plugins[login]
+        finally:
+            with self._condition:
+                self._idle.append(login)
+                self._condition.notify_all()
+
+    @contextmanager
+    def acquire(self, timeout:Optional[float]=None)->Iterator[WebsitePlugin]:
+        """
+        borrow the logged plugin of an account no one else is using, waiting for one if they are all busy
+        :param timeout: seconds to wait, None to wait forever
+        :return:
+        """
+        with self._borrow(timeout=timeout) as plugin:
+            if not plugin.ensure_logged():
+                raise RuntimeError(f"Could not log in {type(plugin).__name__} with {plugin.credentials['login']}")
+            yield plugin
+
+    def map(self, function:Callable[[WebsitePlugin], Result], max_workers:Optional[int]=None)->Dict[str, Result]:
+        """
+        call a function with the logged plugin of every account, the accounts in parallel. Each plugin is borrowed
+        as with acquire, so that no other thread uses it meanwhile. An account which can't log in is left out of the result
+        :param function:
+        :param max_workers: number of accounts crawled at the same time, default: all of them
+        :return: login -> result of the function
+        """
+        def run(login:str)->Result:
+            with self._borrow(login) as plugin:
+                if not plugin.ensure_logged():
+                    log.error(f"Could not log in {type(plugin).__name__} with {login}, the account is skipped")
+                    return _NOT_LOGGED_
+                return function(plugin)
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(self.plugins)) as executor:
+            results = dict(zip(self.plugins, executor.map(run, self.plugins)))
+        return {login: result for login, result in results.items() if result is not _NOT_LOGGED_}
+
+    def fetch_novels(self, max_workers:Optional[int]=None)->Dict[str, Dict[str, List[ShortNovel]]]:
+        """
+        the favorites of every account
+        :param max_workers: number of pages downloaded at the same time by each account
+        :return: login -> subdomain -> novels
+        """
+        return self.map(lambda plugin: plugin.fetch_novels(max_workers))
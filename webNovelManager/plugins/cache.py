@@ -0,0 +1,274 @@
+from typing import Dict, Optional, Tuple, TypedDict
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+import structlog
+from config import settings
+
+
+log = structlog.getLogger(__name__)
+
+
+class CacheEntry(TypedDict):
+    """
+    a response kept by the cache
+    """
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    encoding: Optional[str]
+    content: bytes
+    stored_at: float
+
+
+class ResponseCache:
+    """
+    A cache of GET responses with two levels:
+    - a small in-memory LRU of html pages answering the pages fetched again within a short time without any
+      request, as long as their Cache-Control or Expires header allows it
+    - an on-disk store of the responses carrying an ETag or a Last-Modified header, which are
+      revalidated with a conditional request and served again on 304
+    A response marked no-store is kept by neither
+    """
+    _MEMORY_SIZE_ = 128 # number of responses kept in memory
+    _MEMORY_BYTES_ = 16 * 2 ** 20 # total size of the bodies kept in memory
+    _MEMORY_TTL_ = 300 # seconds during which a response in memory is served without revalidation, at most
+    _MEMORY_TYPES_ = ("text/html", "application/xhtml+xml") # the images and archives would fill the memory
+
+    def __init__(self, path:Optional[str]=None, memory_size:Optional[int]=None, memory_ttl:Optional[float]=None,
+                 memory_bytes:Optional[int]=None):
+        self.path = path
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+        self.memory_size = self._MEMORY_SIZE_ if memory_size is None else memory_size
+        self.memory_bytes = self._MEMORY_BYTES_ if memory_bytes is None else memory_bytes
+        self.memory_ttl = self._MEMORY_TTL_ if memory_ttl is None else memory_ttl
+        self._memory:"OrderedDict[str, Tuple[CacheEntry, float]]" = OrderedDict() # key -> entry, expiry
+        self._memory_used = 0 # bytes of the bodies in memory
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key:str)->str:
+        return os.path.join(self.path, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def get_fresh(self, key:str)->Optional[CacheEntry]:
+        """
+        return the response in memory if it is recent enough to be used without revalidation
+        :param key: the key of the request, see request_key
+        :return:
+        """
+        with self._lock:
+            entry, expiry = self._memory.get(key, (None, 0.0))
+            if entry is None:
+                return None
+            if time.time() > expiry:
+                self._forget(key)
+                return None
+            self._memory.move_to_end(key)
+            return entry
+
+    def get_stored(self, key:str)->Optional[CacheEntry]:
+        """
+        return the response stored on disk, which has to be revalidated before use
+        :param key: the key of the request, see request_key
+        :return:
+        """
+        if self.path is None:
+            return None
+        try:
+            with open(f"{self._entry_path(key)}.json", encoding="utf-8") as metadata_file:
+                metadata = json.load(metadata_file)
+            with open(f"{self._entry_path(key)}.body", "rb") as body_file:
+                return CacheEntry(content=body_file.read(), **metadata)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store(self, key:str, response:requests.Response)->CacheEntry:
+        """
+        keep a response in memory, and on disk if it can be revalidated later
+        :param key: the key of the request, see request_key
+        :param response: a successful response
+        :return: the entry
+        """
+        entry = CacheEntry(url=response.url, status_code=response.status_code, headers=dict(response.headers),
+                           encoding=response.encoding, content=response.content, stored_at=time.time())
+        self._remember(key, entry)
+        if self.path is not None and ("ETag" in response.headers or "Last-Modified" in response.headers) \
+                and "no-store" not in cache_directives(entry["headers"]):
+            path = self._entry_path(key)
+            with open(f"{path}.body.tmp", "wb") as body_file:
+                body_file.write(entry["content"])
+            os.replace(f"{path}.body.tmp", f"{path}.body")
+            with open(f"{path}.json.tmp", "w", encoding="utf-8") as metadata_file:
+                json.dump({key: value for key, value in entry.items() if key != "content"}, metadata_file)
+            os.replace(f"{path}.json.tmp", f"{path}.json")
+        return entry
+
+    def revalidated(self, key:str, entry:CacheEntry)->CacheEntry:
+        """
+        mark a stored response as confirmed by the server (304)
+        :param key: the key of the request, see request_key
+        :param entry:
+        :return: the refreshed entry
+        """
+        entry = CacheEntry(**{**entry, "stored_at": time.time()})
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key:str, entry:CacheEntry)->None:
+        headers = CaseInsensitiveDict(entry["headers"])
+        lifetime = min(self.memory_ttl, freshness_lifetime(headers, self.memory_ttl))
+        size = len(entry["content"])
+        if self.memory_size <= 0 or lifetime <= 0 or size > self.memory_bytes \
+                or not headers.get("Content-Type", "").startswith(self._MEMORY_TYPES_):
+            with self._lock: # an older response may be in memory
+                self._forget(key)
+            return
+        with self._lock:
+            self._forget(key)
+            self._memory[key] = (entry, entry["stored_at"] + lifetime)
+            self._memory_used += size
+            while len(self._memory) > self.memory_size or self._memory_used > self.memory_bytes:
+                self._forget(next(iter(self._memory)))
+
+    def _forget(self, key:str)->None:
+        # under the lock
+        entry, _ = self._memory.pop(key, (None, 0.0))
+        if entry is not None:
+            self._memory_used -= len(entry["content"])
+
+    def invalidate(self, key:str)->None:
+        """
+        forget a response
+        :param key: the key of the request, see request_key
+        :return:
+        """
+        with self._lock:
+            self._forget(key)
+        if self.path is not None:
+            for extension in (".json", ".body"):
+                try:
+                    os.remove(f"{self._entry_path(key)}{extension}")
+                except FileNotFoundError:
+                    pass
+
+    def clear_memory(self)->None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+
+
+def request_key(request:requests.PreparedRequest)->str:
+    """
+    return the cache key of a request: its url and its cookies, so that a page fetched before
+    logging in or before setting a cookie is never served afterwards
+    :param request:
+    :return:
+    """
+    return f"{request.url}\n{request.headers.get('Cookie', '')}"
+
+
+def cache_directives(headers:Dict[str, str])->Dict[str, Optional[str]]:
+    """
+    :param headers: the headers of a response
+    :return: the directives of its Cache-Control header, ex: {"max-age": "60", "no-store": None}
+    """
+    directives = {}
+    for directive in CaseInsensitiveDict(headers).get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') if value else None
+    return directives
+
+
+def freshness_lifetime(headers:Dict[str, str], default:float)->float:
+    """
+    the seconds a response can be served without revalidation, as in http: from its Cache-Control header,
+    else its Expires header
+    :param headers: the headers of the response
+    :param default: the lifetime of a response telling nothing
+    :return: 0 if it must be revalidated every time
+    """
+    headers = CaseInsensitiveDict(headers)
+    directives = cache_directives(headers)
+    if "no-store" in directives or "no-cache" in directives:
+        return 0.0
+    try:
+        age = float(headers.get("Age", 0))
+    except ValueError:
+        age = 0.0
+    if "max-age" in directives:
+        try:
+            return float(directives["max-age"]) - age
+        except (TypeError, ValueError):
+            return 0.0
+    if "Expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["Expires"])
+            date = parsedate_to_datetime(headers["Date"]) if "Date" in headers else None
+        except (TypeError, ValueError): # an invalid date means already expired
+            return 0.0
+        return (expires - date).total_seconds() if date is not None else expires.timestamp() - time.time()
+    return default
+
+
+def conditional_headers(entry:CacheEntry)->Dict[str, str]:
+    """
+    return the headers asking the server to answer 304 if the stored response is still valid
+    :param entry:
+    :return:
+    """
+    headers = CaseInsensitiveDict(entry["headers"])
+    conditional = {}
+    if "ETag" in headers:
+        conditional["If-None-Match"] = headers["ETag"]
+    if "Last-Modified" in headers:
+        conditional["If-Modified-Since"] = headers["Last-Modified"]
+    return conditional
+
+
+def build_response(entry:CacheEntry, request:Optional[requests.PreparedRequest]=None)->requests.Response:
+    """
+    rebuild a requests response from a cache entry
+    :param entry:
+    :param request: the request being answered
+    :return:
+    """
+    response = requests.Response()
+    response.url = entry["url"]
+    response.status_code = entry["status_code"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = entry["encoding"]
+    response._content = entry["content"]
+    response.request = request
+    response.from_cache = True
+    return response
+
+
+__SHARED_CACHE__:Optional[ResponseCache] = None
+__SHARED_CACHE_LOCK__ = threading.Lock()
+
+def get_shared_cache()->ResponseCache:
+    """
+    return the cache shared by every plugin of the process, configured by the ResponseCache
+    section of the settings (path, memory_size, memory_ttl, memory_bytes). Without a path only the memory level is used
+    :return:
+    """
+    global __SHARED_CACHE__
+    with __SHARED_CACHE_LOCK__:
+        if __SHARED_CACHE__ is None:
+            try:
+                configuration = settings[ResponseCache.__name__]
+            except KeyError:
+                configuration = {}
+            __SHARED_CACHE__ = ResponseCache(path=configuration.get("path"),
+                                             memory_size=configuration.get("memory_size"),
+                                             memory_ttl=configuration.get("memory_ttl"),
+                                             memory_bytes=configuration.get("memory_bytes"))
+        return __SHARED_CACHE__
@@ -0,0 +1,120 @@
+from typing import Dict, Iterator, List, Optional
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from requests.cookies import RequestsCookieJar, create_cookie
+import structlog
+from config import settings
+
+try:
+    import fcntl
+except ImportError: # not on windows, the lock only holds between the threads of the process
+    fcntl = None
+
+
+log = structlog.getLogger(__name__)
+
+
+class CookieStore:
+    """
+    The cookies of the logged sessions saved on disk, one file per plugin and account, so that every
+    process reuses the login of the others instead of posting the credentials again.
+    The files hold session secrets, they are only readable by their owner
+    """
+    def __init__(self, path:str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._locks:Dict[str, threading.Lock] = {}
+
+    def _file(self, plugin:str, login:str)->str:
+        # the login isn't written in the name of the file
+        return os.path.join(self.path, f"{plugin}-{hashlib.sha256(login.encode('utf-8')).hexdigest()[:16]}.json")
+
+    def load(self, plugin:str, login:str)->Optional[RequestsCookieJar]:
+        """
+        :param plugin: the name of the plugin class
+        :param login: the account
+        :return: the cookies saved which aren't expired yet, None if there are none
+        """
+        try:
+            with open(self._file(plugin, login), encoding="utf-8") as cookie_file:
+                saved = json.load(cookie_file)
+        except (OSError, ValueError):
+            return None
+        jar = RequestsCookieJar()
+        for cookie in saved:
+            cookie = create_cookie(**cookie)
+            if not cookie.is_expired():
+                jar.set_cookie(cookie)
+        return jar if len(jar) else None
+
+    def save(self, plugin:str, login:str, jar:RequestsCookieJar)->None:
+        """
+        replace the cookies saved for an account, atomically
+        :param plugin: the name of the plugin class
+        :param login: the account
+        :param jar: the cookies of the logged session
+        :return:
+        """
+        cookies:List[Dict] = [{"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path,
+                               "expires": cookie.expires, "secure": cookie.secure, "rest": dict(cookie._rest)}
+                              for cookie in jar if not cookie.is_expired()]
+        descriptor, temporary = tempfile.mkstemp(dir=self.path, prefix=".cookies-")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as cookie_file: # mkstemp creates it readable by its owner only
+            json.dump(cookies, cookie_file)
+        os.replace(temporary, self._file(plugin, login))
+
+    def delete(self, plugin:str, login:str)->None:
+        try:
+            os.remove(self._file(plugin, login))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def locked(self, plugin:str, login:str)->Iterator[None]:
+        """
+        hold the lock of an account, across threads and processes, so that a single one logs in
+        while the others wait for its cookies
+        :param plugin: the name of the plugin class
+        :param login: the account
+        :return:
+        """
+        path = f"{self._file(plugin, login)}.lock"
+        with self._lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+__COOKIE_STORE__:Optional[CookieStore] = None
+__COOKIE_STORE_LOCK__ = threading.Lock()
+
+
+def get_cookie_store()->Optional[CookieStore]:
+    """
+    return the cookie store shared by the plugins of the process, configured by the path of the CookieStore
+    section of the settings. Without a path the cookies aren't saved
+    :return:
+    """
+    global __COOKIE_STORE__
+    with __COOKIE_STORE_LOCK__:
+        if __COOKIE_STORE__ is None:
+            try:
+                path = settings[CookieStore.__name__]["path"]
+            except (KeyError, TypeError):
+                return None
+            __COOKIE_STORE__ = CookieStore(path)
+        return __COOKIE_STORE__
@@ -0,0 +1,211 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import difflib
+
+import structlog
+
+
+log = structlog.getLogger(__name__)
+
+
+Opcode = Tuple[str, int, int, int, int] # as difflib: (tag, i1, i2, j1, j2)
+MatchingBlock = Tuple[int, int, int] # (i, j, size)
+
+
+def _bisect(a:Sequence[int], b:Sequence[int])->Optional[Tuple[int, int]]:
+    """
+    Find the middle snake of the shortest edit script between a and b (Myers, O((N+M)D) time, linear space)
+    :param a:
+    :param b:
+    :return: the point splitting the problem in two, None if a and b have nothing in common
+    """
+    len_a, len_b = len(a), len(b)
+    max_d = (len_a + len_b + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2 = [-1] * v_length
+    v2[v_offset + 1] = 0
+    delta = len_a - len_b
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < len_a and y1 < len_b and a[x1] == b[y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > len_a:
+                k1end += 2
+            elif y1 > len_b:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1 and x1 >= len_a - v2[k2_offset]:
+                    return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < len_a and y2 < len_b and a[-x2 - 1] == b[-y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > len_a:
+                k2end += 2
+            elif y2 > len_b:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    if x1 >= len_a - x2:
+                        return x1, v_offset + x1 - k1_offset
+    return None
+
+
+def _myers_matching_blocks(a:Sequence[int], b:Sequence[int])->List[MatchingBlock]:
+    """
+    return the matching blocks of a longest common subsequence of a and b, sorted
+    :param a:
+    :param b:
+    :return:
+    """
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_start, a_end, b_start, b_end = stack.pop()
+        # common prefix and suffix
+        prefix = 0
+        while a_start + prefix < a_end and b_start + prefix < b_end and a[a_start + prefix] == b[b_start + prefix]:
+            prefix += 1
+        if prefix:
+            blocks.append((a_start, b_start, prefix))
+            a_start += prefix
+            b_start += prefix
+        suffix = 0
+        while a_start < a_end - suffix and b_start < b_end - suffix and a[a_end - suffix - 1] == b[b_end - suffix - 1]:
+            suffix += 1
+        if suffix:
+            blocks.append((a_end - suffix, b_end - suffix, suffix))
+            a_end -= suffix
+            b_end -= suffix
+        if a_start == a_end or b_start == b_end:
+            continue
+        split = _bisect(a[a_start:a_end], b[b_start:b_end])
+        if split is None:
+            continue
+        x, y = split
+        stack.append((a_start, a_start + x, b_start, b_start + y))
+        stack.append((a_start + x, a_end, b_start + y, b_end))
+    return sorted(blocks)
+
+
+def matching_blocks(a:Sequence, b:Sequence)->List[MatchingBlock]:
+    """
+    return the matching blocks of a longest common subsequence of two sequences of hashable items,
+    merged and followed by the (len(a), len(b), 0) sentinel like difflib.SequenceMatcher.
+    The items which only appear in one of the sequences are discarded before running Myers'
+    algorithm, so that a heavily rewritten text is still diffed quickly
+    :param a:
+    :param b:
+    :return:
+    """
+    codes:Dict = {}
+    a_codes = [codes.setdefault(item, len(codes)) for item in a]
+    b_codes = [codes.setdefault(item, len(codes)) for item in b]
+    in_a, in_b = set(a_codes), set(b_codes)
+    a_kept = [index for index, code in enumerate(a_codes) if code in in_b]
+    b_kept = [index for index, code in enumerate(b_codes) if code in in_a]
+
+    blocks:List[MatchingBlock] = []
+    for i, j, size in _myers_matching_blocks([a_codes[index] for index in a_kept], [b_codes[index] for index in b_kept]):
+        for offset in range(size):
+            a_index, b_index = a_kept[i + offset], b_kept[j + offset]
+            if blocks and blocks[-1][0] + blocks[-1][2] == a_index and blocks[-1][1] + blocks[-1][2] == b_index:
+                blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + 1)
+            else:
+                blocks.append((a_index, b_index, 1))
+    blocks.append((len(a), len(b), 0))
+    return blocks
+
+
+def get_opcodes(a:Sequence, b:Sequence)->List[Opcode]:
+    """
+    return the operations turning a into b, in the format of difflib.SequenceMatcher.get_opcodes
+    :param a:
+    :param b:
+    :return:
+    """
+    opcodes = []
+    i = j = 0
+    for a_index, b_index, size in matching_blocks(a, b):
+        if i < a_index and j < b_index:
+            opcodes.append(("replace", i, a_index, j, b_index))
+        elif i < a_index:
+            opcodes.append(("delete", i, a_index, j, b_index))
+        elif j < b_index:
+            opcodes.append(("insert", i, a_index, j, b_index))
+        i, j = a_index + size, b_index + size
+        if size:
+            opcodes.append(("equal", a_index, i, b_index, j))
+    return opcodes
+
+
+class ChapterDiff:
+    """
+    The difference between two versions of a chapter, line by line.
+    The html rendering is only computed when asked for
+    """
+    def __init__(self, old_text:str, new_text:str, opcodes:List[Opcode]):
+        self.old_text = old_text
+        self.new_text = new_text
+        self.opcodes = opcodes
+        self._html:Optional[str] = None
+
+    @property
+    def changed(self)->bool:
+        return any(tag != "equal" for tag, *_ in self.opcodes)
+
+    def changes(self)->List[Opcode]:
+        """
+        :return: the opcodes which aren't equal
+        """
+        return [opcode for opcode in self.opcodes if opcode[0] != "equal"]
+
+    def html(self)->Optional[str]:
+        """
+        :return: a html table showing the changes side by side, None if nothing changed
+        """
+        if not self.changed:
+            return None
+        if self._html is None:
+            self._html = difflib.HtmlDiff().make_table(self.old_text.splitlines(), self.new_text.splitlines())
+        return self._html
+
+
+def diff_chapters(old_chapter_text:str, new_chapter_text:str,
+                  old_hash:Optional[str]=None, new_hash:Optional[str]=None)->ChapterDiff:
+    """
+    Compare two versions of a chapter. When both hashes are given and equal (ex: from a sync manifest),
+    or when the texts are equal, nothing is diffed
+    :param old_chapter_text:
+    :param new_chapter_text:
+    :param old_hash: the content hash of the old version, if known
+    :param new_hash: the content hash of the new version, if known
+    :return:
+    """
+    old_lines = old_chapter_text.splitlines()
+    if (old_hash is not None and old_hash == new_hash) or old_chapter_text == new_chapter_text:
+        return ChapterDiff(old_chapter_text, new_chapter_text,
+                           [("equal", 0, len(old_lines), 0, len(old_lines))] if old_lines else [])
+    return ChapterDiff(old_chapter_text, new_chapter_text, get_opcodes(old_lines, new_chapter_text.splitlines()))
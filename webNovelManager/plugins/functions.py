@@ -1,37 +1,81 @@
-from typing import Tuple, Optional
-import difflib
+from typing import Dict, Tuple, Optional
+from functools import lru_cache
+from urllib.parse import urlsplit
+import dataclasses
+import hashlib
+import re
 
-from tldextract.tldextract import ExtractResult, extract
-import validators
+from tldextract.tldextract import ExtractResult, TLDExtract
 import structlog
 
+from .diff import diff_chapters
+
 log = structlog.getLogger(__name__)
 
 
+# a resolver which only uses the public suffix list snapshot bundled with tldextract:
+# it never downloads the list, nor writes a cache on disk
+_EXTRACTOR_ = TLDExtract(cache_dir=None, suffix_list_urls=(), fallback_to_snapshot=True)
+# registered domains resolved without looking at the suffix list, any of their subdomains included
+_KNOWN_DOMAINS_ = ("syosetu.com",)
+_KNOWN_RESULTS_: Dict[str, ExtractResult] = {}
+_URL_SCHEMES_ = frozenset({"http", "https"})
+_INVALID_HOST_CHARACTERS_ = re.compile(r"[^a-z0-9.\-_\[\]:\u0080-\uffff]")
+
+
+def _with_subdomain(extract_result:ExtractResult, subdomain:str)->ExtractResult:
+    if dataclasses.is_dataclass(extract_result):
+        return dataclasses.replace(extract_result, subdomain=subdomain)
+    return extract_result._replace(subdomain=subdomain) # namedtuple in older tldextract versions
+
+
+@lru_cache(maxsize=4096)
+def resolve_host(host:str)->ExtractResult:
+    """
+    split a host name into subdomain, domain and suffix, memoized by host and without any network access
+    :param host: a lowercase host name, ex: ncode.syosetu.com
+    :return:
+    """
+    for known_domain in _KNOWN_DOMAINS_:
+        if host == known_domain or host.endswith(f".{known_domain}"):
+            if known_domain not in _KNOWN_RESULTS_:
+                _KNOWN_RESULTS_[known_domain] = _EXTRACTOR_(known_domain)
+            return _with_subdomain(_KNOWN_RESULTS_[known_domain], host[:-len(known_domain) - 1] if host != known_domain else "")
+    return _EXTRACTOR_(host)
+
+
 def resolve_url(url_candidate: str) -> ExtractResult:
     """
-    a function that check if the given text is an url and if it is, return the
-    :param url:
+    a function that check if the given text is an http(s) url and if it is, return the
+    subdomain, domain and suffix of its host. Never touches the network
+    :param url_candidate:
     :return:
     """
-    if validators.url(url_candidate):
-        return extract(url_candidate)
+    try:
+        split_url = urlsplit(url_candidate)
+        scheme, host = split_url.scheme, split_url.hostname
+    except ValueError: # ex: malformed port or ipv6 address
+        scheme, host = None, None
+    if scheme in _URL_SCHEMES_ and host and "." in host and not _INVALID_HOST_CHARACTERS_.search(host):
+        return resolve_host(host)
     # TODO : raise a warning instead if malformed
     log.error(f"Expected a valid url: {url_candidate}")
     raise TypeError
 
+def hash_content(text:str)->str:
+    """
+    return a stable hash of a chapter content, used to detect changes without keeping the text
+    :param text:
+    :return: the hexadecimal sha256 of the utf-8 text
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 def is_there_a_diff(old_chapter_text:str, new_chapter_text:str)->Tuple[bool, Optional[str]]:
     """
-    TODO
+    Compare two versions of a chapter line by line, see diff_chapters for the structured result
     :param old_chapter_text:
     :param new_chapter_text:
-    :return:
+    :return: whether the chapter changed, and a html table of the changes if it did
     """
-    differ = difflib.Differ()
-    difference_list = list(differ.compare(old_chapter_text.splitlines(), new_chapter_text.splitlines()))
-    diff_bool = len([line for line in difference_list if not line.startswith("  ")])>0
-    return (diff_bool,
-            difflib.HtmlDiff().make_table(
-                old_chapter_text.splitlines(),
-                new_chapter_text.splitlines())
-            if diff_bool else None)
\ No newline at end of file
+    chapter_diff = diff_chapters(old_chapter_text, new_chapter_text)
+    return chapter_diff.changed, chapter_diff.html()
\ No newline at end of file
@@ -0,0 +1,218 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+
+import structlog
+from config import settings
+
+
+log = structlog.getLogger(__name__)
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# the default buckets of the prometheus clients, in seconds
+_DURATION_BUCKETS_ = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HELP_ = {
+    "webnovel_http_request_duration_seconds": "Duration of the requests sent by the plugins, cache included",
+    "webnovel_http_response_bytes_total": "Bytes of the response bodies received from the network",
+    "webnovel_http_errors_total": "Requests which raised instead of returning a response",
+    "webnovel_cache_requests_total": "Requests by result of the response cache: fresh, revalidated, miss or bypass",
+    "webnovel_stage_duration_seconds": "Duration of the stages of the plugins (parsing, downloads...)",
+    "webnovel_stage_errors_total": "Stages which raised",
+}
+
+
+class Histogram:
+    """
+    a histogram with fixed buckets, as prometheus has: counts by upper bound, sum and count
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets:Tuple[float, ...]=_DURATION_BUCKETS_):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float)->None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, quantile:float)->float:
+        """
+        :return: the upper bound of the bucket holding the quantile, as precise as the buckets
+        """
+        rank, seen = quantile * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels:Labels)->str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Counters and histograms labelled as prometheus metrics are, kept in memory by the process.
+    Every operation is thread safe
+    """
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._counters:Dict[str, Dict[Labels, float]] = {}
+        self._histograms:Dict[str, Dict[Labels, Histogram]] = {}
+
+    def increment(self, name:str, amount:float=1.0, **labels:str)->None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0.0) + amount
+
+    def observe(self, name:str, value:float, **labels:str)->None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            if key not in histograms:
+                histograms[key] = Histogram()
+            histograms[key].observe(value)
+
+    def counter(self, name:str, **labels:str)->float:
+        return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0.0)
+
+    def histogram(self, name:str, **labels:str)->Optional[Histogram]:
+        return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def histograms(self, name:str)->Dict[Labels, Histogram]:
+        """
+        :return: the histograms of a metric by labels
+        """
+        with self._lock:
+            return dict(self._histograms.get(name, {}))
+
+    def reset(self)->None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self)->str:
+        """
+        :return: every metric in the prometheus text exposition format
+        """
+        lines:List[str] = []
+        with self._lock:
+            for name, counters in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {_HELP_.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{_format_labels(labels)} {value:g}" for labels, value in sorted(counters.items()))
+            for name, histograms in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {_HELP_.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels((*labels, ('le', f'{bound}')))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path:str)->None:
+        """
+        write the dump atomically, for the textfile collector of the node exporter
+        :param path:
+        :return:
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as dump:
+            dump.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+
+__METRICS__ = Metrics()
+
+
+def get_metrics()->Metrics:
+    """
+    return the metrics of the process, where the plugins record
+    :return:
+    """
+    return __METRICS__
+
+
+def timed(stage:Optional[str]=None)->Callable:
+    """
+    decorator recording the duration of every call of a function in webnovel_stage_duration_seconds
+    and as a debug log event
+    :param stage: the label of the stage, default: the qualified name of the function
+    :return:
+    """
+    def decorator(function:Callable)->Callable:
+        name = stage or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not __METRICS__.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                __METRICS__.increment("webnovel_stage_errors_total", stage=name)
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                __METRICS__.observe("webnovel_stage_duration_seconds", seconds, stage=name)
+                log.debug("stage", stage=name, seconds=round(seconds, 6))
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiled(path:Optional[str]=None, top:int=25)->Iterator[Optional[cProfile.Profile]]:
+    """
+    profile everything run inside the context with cProfile, the busiest functions are logged.
+    It does nothing unless a path is given or set as "profile" in the Metrics section of the settings
+    :param path: where the stats are dumped, to be read by pstats or snakeviz
+    :param top: number of functions logged
+    :return: the profiler, None when not profiling
+    """
+    if path is None:
+        try:
+            path = settings["Metrics"]["profile"]
+        except (KeyError, TypeError):
+            path = None
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(top)
+        log.info(f"Profile written to {path}\n{summary.getvalue()}")
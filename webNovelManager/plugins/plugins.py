@@ -1,10 +1,23 @@
-from typing import List, Optional, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlsplit
+import threading
+import time
 
+from requests.adapters import BaseAdapter, HTTPAdapter
 import structlog
 from config import settings
 
-from ..data.format import LoginInfo, NovelInstance, Chapter
+from ..data.format import LoginInfo, NovelInstance, Chapter, ArcIndex, ArcHeader, ShortNovel
+from ..database.artefact import ArtefactStore
+from .cache import get_shared_cache
+from .cookies import CookieStore, get_cookie_store
 from .functions import resolve_url
+from .registry import get_registry
+from .session import PluginSession
+from .throttle import DomainScheduler, get_scheduler
 
 
 log = structlog.getLogger(__name__)
@@ -17,21 +30,260 @@ class WebsitePlugin:
     _HEADERS_ = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:95.0) Gecko/20100101 Firefox/95.0"}
     _DOMAIN_:str = None
     _SUBDOMAIN_: Optional[Union[List[str], str]] = None
+    _MAX_WORKERS_: int = 4 # default size of the chapter download pool
+    _MAX_CONNECTIONS_PER_HOST_: int = 4 # never open more than this to a single host
+    _REQUESTS_PER_SECOND_: float = 2.0 # starting rate of the domain scheduler, adapted to the responses
+    _LOGIN_COOKIE_: Optional[str] = None # in the name of the cookies set by a login, None: every cookie
 
-    def __init__(self):
+    __HOST_LOCK__ = threading.Lock()
+    __HOST_SEMAPHORES__: Dict[str, threading.BoundedSemaphore] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        get_registry().register(cls)
+
+    def __init__(self, artefact_store:Optional[ArtefactStore]=None, credentials:Optional[LoginInfo]=None,
+                 cookie_store:Optional[CookieStore]=None):
+        """
+        :param artefact_store: when set, artefacts are kept on disk and chapters only hold their references
+        :param credentials: the account of the plugin, default: the one of the settings
+        :param cookie_store: where the cookies of the logged session are saved, default: the one of the settings
+        """
         self.require_login:Optional[bool] = None
+        self.session:Optional[PluginSession] = None # created by the child classes, see _make_session
+        self.artefact_store = artefact_store
+        self.credentials = credentials
+        self.cookie_store = cookie_store if cookie_store is not None else get_cookie_store()
+
+    def _make_session(self)->PluginSession:
+        """
+        Create a session going through the response cache shared by the plugins,
+        whose connection pool is large enough for the download workers
+        :return: a requests session
+        """
+        session = PluginSession(get_shared_cache(), self._get_scheduler())
+        adapter = HTTPAdapter(pool_connections=self._MAX_CONNECTIONS_PER_HOST_,
+                              pool_maxsize=max(self._MAX_WORKERS_, self._MAX_CONNECTIONS_PER_HOST_))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def use_transport(self, adapter:BaseAdapter, paced:bool=False)->None:
+        """
+        Send the requests of the plugin session through another transport, ex: a ReplayAdapter
+        serving recorded pages instead of the network
+        :param adapter: a requests transport adapter
+        :param paced: keep the scheduler of the domain, there is no server to spare when replaying
+        :return:
+        """
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not paced:
+            self.session.scheduler = None
+
+    def _get_scheduler(self)->DomainScheduler:
+        """
+        Return the scheduler pacing the requests to the domain of the plugin, shared by every instance.
+        It is configured by the "scheduler" table of the plugin settings
+        :return:
+        """
+        try:
+            parameters = dict(settings[type(self).__name__]["scheduler"])
+        except (KeyError, TypeError):
+            parameters = {}
+        parameters = {key.lower(): value for key, value in parameters.items()}
+        parameters.setdefault("rate", self._REQUESTS_PER_SECOND_)
+        return get_scheduler(self._DOMAIN_ or type(self).__name__, **parameters)
+
+    def _get_max_workers(self, max_workers:Optional[int]=None)->int:
+        """
+        Resolve the number of download workers: argument, then config, then class default
+        :param max_workers:
+        :return:
+        """
+        if max_workers is None:
+            try:
+                max_workers = int(settings[type(self).__name__]["max_workers"])
+            except (KeyError, TypeError, ValueError):
+                max_workers = self._MAX_WORKERS_
+        return max(1, max_workers)
+
+    @classmethod
+    def _host_semaphore(cls, url:str)->threading.BoundedSemaphore:
+        """
+        Return the semaphore limiting the concurrent connections to the host of the url.
+        The semaphores are shared by every plugin instance of the process
+        :param url:
+        :return:
+        """
+        host = urlsplit(url).hostname or ""
+        with cls.__HOST_LOCK__:
+            if host not in cls.__HOST_SEMAPHORES__:
+                cls.__HOST_SEMAPHORES__[host] = threading.BoundedSemaphore(cls._MAX_CONNECTIONS_PER_HOST_)
+            return cls.__HOST_SEMAPHORES__[host]
+
+    def _fetch_chapters(self, links:Iterable[str], max_workers:Optional[int]=None)->List[Chapter]:
+        """
+        Fetch several chapters, concurrently if allowed, and return them in the order of the links
+        :param links: the chapter links
+        :param max_workers: the number of download workers, 1 means sequential
+        :return: a list of chapters ordered as the links
+        """
+        return list(self._iter_fetch_chapters(links, max_workers=max_workers))
+
+    def _iter_fetch_chapters(self, links:Iterable[str], max_workers:Optional[int]=None)->Iterator[Chapter]:
+        """
+        Fetch several chapters, concurrently if allowed, and yield them in the order of the links.
+        At most twice the number of workers chapters are downloaded ahead of the consumer
+        so that the memory doesn't grow with the length of the novel
+        :param links: the chapter links
+        :param max_workers: the number of download workers, 1 means sequential
+        :return: an iterator of chapters ordered as the links
+        """
+        max_workers = self._get_max_workers(max_workers)
+        start = time.perf_counter()
+        count = 0
+        if max_workers == 1:
+            for link in links:
+                yield self._fetch_chapter(link)
+                count += 1
+        else:
+            links = iter(links)
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                pending = deque(executor.submit(self._fetch_chapter_limited, link)
+                                for link in islice(links, 2 * max_workers))
+                while pending:
+                    chapter = pending.popleft().result()
+                    next_link = next(links, None)
+                    if next_link is not None:
+                        pending.append(executor.submit(self._fetch_chapter_limited, next_link))
+                    yield chapter
+                    count += 1
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+        elapsed = time.perf_counter() - start
+        if count:
+            log.info(f"Fetched {count} chapters in {elapsed:.2f}s "
+                     f"({count/elapsed if elapsed else float('inf'):.2f} chapters/s, {max_workers} workers)")
+
+    def _fetch_chapter_limited(self, link:str)->Chapter:
+        """
+        Fetch a chapter while holding a connection slot for its host
+        :param link:
+        :return:
+        """
+        with self._host_semaphore(link):
+            return self._fetch_chapter(link)
 
     def _get_credentials(self)->Optional[LoginInfo]:
         """
         Fetch the login credentials from the environment/config using namespace
         :return: a dictionary containing the necessary credentials for login
         """
+        if self.credentials is not None:
+            return self.credentials
         try:
             return LoginInfo(login=settings[type(self).__name__]["login"], password=settings[type(self).__name__]["password"])
         except KeyError:
             log.error(f"Missing credentials in the secret file. Are you sure everything is properly setup?: {type(self).__name__}")
             return None
 
+    @classmethod
+    def get_accounts(cls)->List[LoginInfo]:
+        """
+        The accounts configured for the plugin: the "accounts" list of its settings (tables with a login
+        and a password), else its single login and password
+        :return:
+        """
+        try:
+            return [LoginInfo(login=account["login"], password=account["password"])
+                    for account in settings[cls.__name__]["accounts"]]
+        except (KeyError, TypeError):
+            pass
+        try:
+            return [LoginInfo(login=settings[cls.__name__]["login"], password=settings[cls.__name__]["password"])]
+        except (KeyError, TypeError):
+            return []
+
+    def ensure_logged(self, validate:bool=False)->bool:
+        """
+        Make the session logged, reusing the cookies saved by a previous login of any process:
+        the credentials are only posted when no cookie is saved, see relogin for the cookies rejected later
+        :param validate: check the cookies with the server (check_session) before trusting them
+        :return: whether the session is logged
+        """
+        if self.is_logged() and not validate:
+            return True
+        credentials = self._get_credentials()
+        if credentials is None:
+            return False
+        if self.cookie_store is None:
+            return self.login()
+        plugin = type(self).__name__
+        with self.cookie_store.locked(plugin, credentials["login"]):
+            saved = self.cookie_store.load(plugin, credentials["login"])
+            if saved is not None:
+                self.session.cookies.update(saved)
+                if self.is_logged() and (not validate or self.check_session()):
+                    log.debug(f"Reused the saved login of {plugin}")
+                    return True
+            return self._login_and_save(credentials)
+
+    def relogin(self)->bool:
+        """
+        Log in again once the server rejected the cookies of the session. When another process already
+        logged in again since, its cookies are taken instead
+        :return: whether the session is logged
+        """
+        credentials = self._get_credentials()
+        if credentials is None:
+            return False
+        if self.cookie_store is None:
+            self.session.cookies.clear()
+            return self.login()
+        plugin = type(self).__name__
+        rejected = self._login_cookies(self.session.cookies)
+        with self.cookie_store.locked(plugin, credentials["login"]):
+            saved = self.cookie_store.load(plugin, credentials["login"])
+            # the other cookies change without a login, the ones of the session being newer than the saved ones
+            if saved is not None and self._login_cookies(saved) and self._login_cookies(saved) != rejected:
+                self.session.cookies.update(saved)
+                return self.is_logged()
+            self.session.cookies.clear()
+            return self._login_and_save(credentials)
+
+    def _login_cookies(self, cookies)->Dict[str, str]:
+        """
+        :param cookies: a cookie jar
+        :return: the cookies set by a login, by name
+        """
+        return {cookie.name: cookie.value for cookie in cookies
+                if self._LOGIN_COOKIE_ is None or self._LOGIN_COOKIE_ in cookie.name}
+
+    def _login_and_save(self, credentials:LoginInfo)->bool:
+        if not self.login():
+            self.cookie_store.delete(type(self).__name__, credentials["login"])
+            return False
+        self.cookie_store.save(type(self).__name__, credentials["login"], self.session.cookies)
+        return True
+
+    def check_session(self)->bool:
+        """
+        Ask the server whether the session is still logged, contrary to is_logged which only looks at the cookies
+        Should be implemented by the child classes requiring a login
+        :return:
+        """
+        raise NotImplementedError
+
+    def is_logged(self)->bool:
+        """
+        Check the session holds the cookies of a login, without asking the server
+        Should be implemented by the child classes requiring a login
+        :return:
+        """
+        raise NotImplementedError
+
     def is_plugin_relevant(self, url: str) -> bool:
         """
         Given an url, return wheter or not this plugin should be used
@@ -49,22 +301,84 @@ class WebsitePlugin:
         """
         raise NotImplementedError
 
-    def fetch_novel(self, novel_link:str)->NovelInstance:
+    def fetch_novels(self, max_workers:Optional[int]=None)->Dict[str, List[ShortNovel]]:
+        """
+        Return the novels followed by the logged account, grouped by section of the website
+        Should be implemented by the child classes
+        :param max_workers: number of pages downloaded at the same time
+        :return:
+        """
+        raise NotImplementedError
+
+    def iter_novels(self, max_workers:Optional[int]=None)->Iterator[Tuple[str, ShortNovel]]:
+        """
+        Yield the novels followed by the logged account with their section of the website.
+        Child classes should override it to yield the novels as soon as they are fetched
+        :param max_workers: number of pages downloaded at the same time
+        :return: an iterator of (section, novel)
+        """
+        for section, novels in self.fetch_novels(max_workers=max_workers).items():
+            for novel in novels:
+                yield section, novel
+
+    def fetch_novel(self, novel_link:str, max_workers:Optional[int]=None)->NovelInstance:
         """
         Try to fetch a novel given a link and process as needed
         :param novel_link:
+        :param max_workers: number of chapters downloaded at the same time, 1 means sequential
         :return:
         """
-        return self._fetch_novel(novel_link)
+        return self._fetch_novel(novel_link, max_workers=max_workers)
 
-    def _fetch_novel(self, novel_link:str)->NovelInstance:
+    def _fetch_novel(self, novel_link:str, max_workers:Optional[int]=None)->NovelInstance:
         """
-        Try to fetch a novel given a link
+        Fetch every chapter of a novel and gather them by arc, in the order of the index
         :param novel_link:
+        :param max_workers:
         :return:
         """
+        novel:NovelInstance = {"source": novel_link}
+        arcs = self.fetch_index(novel_link)
+        if len(arcs) == 0: # single chapter
+            novel['chapters'] = [self._fetch_chapter(novel_link)]
+            novel['extend'] = None
+            return novel
+        # every arc of the index is kept, an arc without chapter too
+        chapters = [{"chapters": [], **{key: value for key, value in arc.items() if key != "chapters"}} for arc in arcs]
+        owners = (element["chapters"] for element, arc in zip(chapters, arcs) for _ in arc["chapters"])
+        links = (entry["link"] for arc in arcs for entry in arc["chapters"])
+        for owner, chapter in zip(owners, self._iter_fetch_chapters(links, max_workers=max_workers)):
+            owner.append(chapter)
+        novel['chapters'] = chapters
+        novel['extend'] = None
+        return novel
+
+    def fetch_index(self, novel_link:str)->List[ArcIndex]:
+        """
+        Return the index of a novel (arcs and chapter links) without fetching the chapters
+        Should be implemented by the child classes
+        :param novel_link:
+        :return: a list of arcs, empty if the novel is a single chapter
+        """
         raise NotImplementedError
 
+    def iter_chapters(self, novel_link:str, max_workers:Optional[int]=None)->Iterator[Tuple[Optional[ArcHeader], Chapter]]:
+        """
+        Yield the chapters of a novel one by one, as soon as they are parsed, along with their arc.
+        Contrary to fetch_novel, the whole novel is never held in memory
+        :param novel_link:
+        :param max_workers: number of chapters downloaded at the same time, 1 means sequential
+        :return: an iterator of (arc, chapter), the arc is None for a single chapter novel
+        """
+        arcs = self.fetch_index(novel_link)
+        if len(arcs) == 0:
+            yield None, self._fetch_chapter(novel_link)
+            return
+        headers = (ArcHeader(**{key: value for key, value in arc.items() if key != "chapters"})
+                   for arc in arcs for _ in arc["chapters"])
+        links = (entry["link"] for arc in arcs for entry in arc["chapters"])
+        yield from zip(headers, self._iter_fetch_chapters(links, max_workers=max_workers))
+
     def fetch_chapter(self, link_url)->Chapter:
         """
         Try to fetch a chapter given the link
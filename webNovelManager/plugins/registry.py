@@ -0,0 +1,171 @@
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Type
+from urllib.parse import urlsplit
+import importlib
+import pkgutil
+import threading
+
+import structlog
+
+from .functions import resolve_host
+
+if TYPE_CHECKING:
+    from .plugins import WebsitePlugin
+
+
+log = structlog.getLogger(__name__)
+
+
+class PluginSpec:
+    """
+    What the registry knows of a plugin before it is imported: its module, its class and the hosts it handles
+    """
+    def __init__(self, domain:str, module:str, class_name:str, subdomains:Iterable[str]=()):
+        self.domain = domain
+        self.module = module
+        self.class_name = class_name
+        self.subdomains = tuple(subdomains)
+        self._plugin_class:Optional[Type["WebsitePlugin"]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_class(cls, plugin_class:Type["WebsitePlugin"])->"PluginSpec":
+        subdomains = plugin_class._SUBDOMAIN_ or ()
+        spec = cls(plugin_class._DOMAIN_, plugin_class.__module__, plugin_class.__name__,
+                   [subdomains] if isinstance(subdomains, str) else subdomains)
+        spec._plugin_class = plugin_class
+        return spec
+
+    def load(self)->Type["WebsitePlugin"]:
+        """
+        import the plugin on first use
+        :return: the plugin class
+        """
+        if self._plugin_class is None:
+            with self._lock:
+                if self._plugin_class is None:
+                    log.debug(f"Loading the plugin {self.module}.{self.class_name}")
+                    self._plugin_class = getattr(importlib.import_module(self.module), self.class_name)
+        return self._plugin_class
+
+
+class PluginRegistry:
+    """
+    Map urls to the plugin handling them. The hosts are indexed by _DOMAIN_ and _SUBDOMAIN_,
+    so that routing an url costs one memoized host parse and two dictionary lookups,
+    and a plugin is only imported when an url actually needs it
+    """
+    # the plugins shipped with the package, known without importing them
+    _BUNDLED_PLUGINS_ = [
+        PluginSpec("syosetu", "webNovelManager.plugins.syosetu", "Syosetu", ["novel18", "ncode"]),
+    ]
+
+    def __init__(self, specs:Optional[Iterable[PluginSpec]]=None):
+        self._by_domain:Dict[str, PluginSpec] = {}
+        self._by_host:Dict[Tuple[str, str], PluginSpec] = {}
+        self._instances:Dict[Type["WebsitePlugin"], "WebsitePlugin"] = {}
+        self._lock = threading.Lock()
+        for spec in self._BUNDLED_PLUGINS_ if specs is None else specs:
+            self.add(spec)
+
+    def add(self, spec:PluginSpec)->None:
+        """
+        index a plugin. A plugin declaring subdomains takes precedence on them over
+        another plugin of the same domain
+        :param spec:
+        :return:
+        """
+        with self._lock:
+            known = self._by_domain.get(spec.domain)
+            if known is None or (known.module, known.class_name) == (spec.module, spec.class_name):
+                self._by_domain[spec.domain] = spec
+            for subdomain in spec.subdomains:
+                self._by_host[(subdomain, spec.domain)] = spec
+
+    def register(self, plugin_class:Type["WebsitePlugin"])->Type["WebsitePlugin"]:
+        """
+        index an imported plugin class, called for every WebsitePlugin subclass defining a _DOMAIN_
+        :param plugin_class:
+        :return: the class, so that it can be used as a decorator
+        """
+        if plugin_class._DOMAIN_:
+            self.add(PluginSpec.from_class(plugin_class))
+        return plugin_class
+
+    def discover(self, package:str=__package__)->None:
+        """
+        import every module of a package so that the plugins it defines register themselves
+        :param package: the name of the package holding the plugins
+        :return:
+        """
+        for module in pkgutil.iter_modules(importlib.import_module(package).__path__):
+            importlib.import_module(f"{package}.{module.name}")
+
+    def find_spec(self, url:str)->Optional[PluginSpec]:
+        """
+        return the spec of the plugin handling an url, without importing the plugin
+        :param url:
+        :return: None if no plugin handles the url
+        """
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            return None
+        if not host:
+            return None
+        extract_result = resolve_host(host)
+        return (self._by_host.get((extract_result.subdomain, extract_result.domain))
+                or self._by_domain.get(extract_result.domain))
+
+    def find_plugin_class(self, url:str)->Optional[Type["WebsitePlugin"]]:
+        """
+        return the class of the plugin handling an url, importing it if needed
+        :param url:
+        :return: None if no plugin handles the url
+        """
+        spec = self.find_spec(url)
+        return spec.load() if spec is not None else None
+
+    def get_plugin(self, url:str)->Optional["WebsitePlugin"]:
+        """
+        return the instance of the plugin handling an url, created on first use and then shared
+        :param url:
+        :return: None if no plugin handles the url
+        """
+        plugin_class = self.find_plugin_class(url)
+        if plugin_class is None:
+            return None
+        with self._lock:
+            if plugin_class not in self._instances:
+                self._instances[plugin_class] = plugin_class()
+            return self._instances[plugin_class]
+
+    def route(self, urls:Iterable[str])->Tuple[Dict[str, List[str]], List[str]]:
+        """
+        group urls by the domain of their plugin, without importing any plugin
+        :param urls:
+        :return: the urls by plugin domain, and the urls no plugin handles
+        """
+        routed:Dict[str, List[str]] = {}
+        unhandled = []
+        for url in urls:
+            spec = self.find_spec(url)
+            if spec is None:
+                unhandled.append(url)
+            else:
+                routed.setdefault(spec.domain, []).append(url)
+        return routed, unhandled
+
+
+__REGISTRY__:Optional[PluginRegistry] = None
+__REGISTRY_LOCK__ = threading.Lock()
+
+def get_registry()->PluginRegistry:
+    """
+    return the registry shared by the process, holding the bundled plugins and every plugin imported since
+    :return:
+    """
+    global __REGISTRY__
+    with __REGISTRY_LOCK__:
+        if __REGISTRY__ is None:
+            __REGISTRY__ = PluginRegistry()
+        return __REGISTRY__
@@ -0,0 +1,165 @@
+from typing import Dict, Iterator, List, Optional, Tuple, TypedDict
+from http.client import HTTPMessage
+import base64
+import io
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import structlog
+
+
+log = structlog.getLogger(__name__)
+
+
+class Interaction(TypedDict):
+    """
+    a request and its response, as kept in a cassette
+    """
+    method: str
+    url: str
+    status_code: int
+    headers: List[Tuple[str, str]] # a list as a response may hold several Set-Cookie
+    body: Optional[str] # the utf-8 text of the body, if it is text
+    body_base64: Optional[str] # else the body in base64
+
+
+# headers describing the transfer of the recorded body, meaningless once it is decoded
+_TRANSFER_HEADERS_ = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection"})
+
+
+class Cassette:
+    """
+    A file of recorded interactions, one json object per line.
+    The last interaction recorded for a method and an url is the one replayed
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self._interactions:Dict[Tuple[str, str], Interaction] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as cassette_file:
+                for line in cassette_file:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._interactions[(interaction["method"], interaction["url"])] = interaction
+
+    def __len__(self)->int:
+        return len(self._interactions)
+
+    def __iter__(self)->Iterator[Interaction]:
+        return iter(list(self._interactions.values()))
+
+    def find(self, method:str, url:str)->Optional[Interaction]:
+        return self._interactions.get((method.upper(), url))
+
+    def add(self, method:str, url:str, status_code:int, headers:List[Tuple[str, str]], content:bytes)->Interaction:
+        """
+        record an interaction and append it to the file
+        :param method:
+        :param url:
+        :param status_code:
+        :param headers:
+        :param content: the decoded body
+        :return:
+        """
+        try:
+            body, body_base64 = content.decode("utf-8"), None
+        except UnicodeDecodeError:
+            body, body_base64 = None, base64.b64encode(content).decode("ascii")
+        interaction = Interaction(method=method.upper(), url=url, status_code=status_code,
+                                  headers=[(name, value) for name, value in headers if name.lower() not in _TRANSFER_HEADERS_],
+                                  body=body, body_base64=body_base64)
+        with self._lock:
+            self._interactions[(interaction["method"], url)] = interaction
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as cassette_file:
+                cassette_file.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+        return interaction
+
+
+def interaction_content(interaction:Interaction)->bytes:
+    if interaction["body"] is not None:
+        return interaction["body"].encode("utf-8")
+    return base64.b64decode(interaction["body_base64"])
+
+
+class _RecordedBody(io.BytesIO):
+    """
+    the raw body of a replayed response. It carries the headers the way urllib3 does
+    so that requests puts the recorded cookies in the session
+    """
+    def __init__(self, content:bytes, headers:List[Tuple[str, str]]):
+        super().__init__(content)
+        message = HTTPMessage()
+        for name, value in headers:
+            message[name] = value
+        self._original_response = type("RecordedResponse", (), {"msg": message})()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    A transport adapter serving the responses recorded in a cassette, mounted on a session instead of
+    the network. In "replay" mode an url missing from the cassette raises a ConnectionError,
+    in "record" mode the requests are sent to the network and their responses recorded
+    """
+    MODES = ("replay", "record")
+
+    def __init__(self, cassette:Cassette, mode:str="replay", network_adapter:Optional[BaseAdapter]=None):
+        super().__init__()
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {self.MODES}")
+        self.cassette = cassette
+        self.mode = mode
+        self.network_adapter = network_adapter if network_adapter is not None else HTTPAdapter()
+        self.replayed = 0 # number of responses served
+
+    def send(self, request:requests.PreparedRequest, stream=False, timeout=None, verify=True, cert=None, proxies=None)->requests.Response:
+        if self.mode == "record":
+            response = self.network_adapter.send(request, stream=stream, timeout=timeout, verify=verify,
+                                                 cert=cert, proxies=proxies)
+            headers = list(response.raw.headers.items()) if hasattr(response.raw, "headers") else list(response.headers.items())
+            self.cassette.add(request.method, request.url, response.status_code, headers, response.content)
+            return response
+        interaction = self.cassette.find(request.method, request.url)
+        if interaction is None:
+            raise requests.ConnectionError(f"No recorded response for {request.method} {request.url}", request=request)
+        self.replayed += 1
+        return self.build_response(request, interaction)
+
+    def build_response(self, request:requests.PreparedRequest, interaction:Interaction)->requests.Response:
+        """
+        build a response whose body is read lazily, so that streamed downloads are replayed as well
+        :param request:
+        :param interaction:
+        :return:
+        """
+        response = requests.Response()
+        response.status_code = interaction["status_code"]
+        response.headers = CaseInsensitiveDict()
+        for name, value in interaction["headers"]:
+            response.headers[name] = f"{response.headers[name]}, {value}" if name in response.headers else value
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _RecordedBody(interaction_content(interaction), interaction["headers"])
+        response.reason = requests.status_codes._codes.get(response.status_code, ("",))[0].upper()
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self)->None:
+        self.network_adapter.close()
+
+
+def open_cassette(path:str, mode:str="replay")->ReplayAdapter:
+    """
+    return an adapter replaying (or recording into) a cassette file
+    :param path:
+    :param mode: "replay" or "record"
+    :return:
+    """
+    return ReplayAdapter(Cassette(path), mode)
@@ -0,0 +1,130 @@
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+import time
+
+import requests
+import structlog
+import urllib3
+
+from .cache import ResponseCache, build_response, conditional_headers, request_key
+from .metrics import get_metrics
+from .throttle import DomainScheduler, parse_retry_after
+
+
+log = structlog.getLogger(__name__)
+
+
+class PluginSession(requests.Session):
+    """
+    The session used by the plugins: a requests session whose GET requests go through a response cache
+    and whose requests are paced and retried by the scheduler of the domain
+    """
+    # sent again on a timeout or an overloaded server, the other methods only when the server surely didn't act on them
+    _IDEMPOTENT_METHODS_ = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+    def __init__(self, cache:Optional[ResponseCache]=None, scheduler:Optional[DomainScheduler]=None):
+        super().__init__()
+        self.cache = cache
+        self.scheduler = scheduler
+
+    def request(self, method, url, *args, **kwargs)->requests.Response:
+        """
+        Send a request, recording its duration, status, size and cache result in the metrics of the process
+        """
+        start = time.perf_counter()
+        host = urlsplit(url).hostname or ""
+        try:
+            response, cache_result = self._cached_request(method, url, *args, **kwargs)
+        except Exception as error:
+            get_metrics().increment("webnovel_http_errors_total", host=host, error=type(error).__name__)
+            raise
+        seconds = time.perf_counter() - start
+        size = 0
+        if cache_result in ("miss", "bypass"):
+            if kwargs.get("stream"): # not read yet, the announced size
+                size = int(response.headers.get("Content-Length") or 0)
+            else:
+                size = len(response.content)
+        metrics = get_metrics()
+        metrics.observe("webnovel_http_request_duration_seconds", seconds, method=method.upper(), host=host,
+                        status=str(response.status_code))
+        metrics.increment("webnovel_http_response_bytes_total", size, host=host)
+        metrics.increment("webnovel_cache_requests_total", cache=cache_result)
+        log.debug("request", method=method.upper(), url=url, status=response.status_code, seconds=round(seconds, 6),
+                  bytes=size, cache=cache_result)
+        return response
+
+    def _cached_request(self, method, url, *args, **kwargs)->Tuple[requests.Response, str]:
+        """
+        :return: the response and how the cache answered: fresh, revalidated, miss, or bypass when not used
+        """
+        if self.cache is None or method.upper() != "GET" or kwargs.get("stream") or args:
+            return self._send(method, url, *args, **kwargs), "bypass"
+        key = request_key(self.prepare_request(requests.Request(
+            method, url, params=kwargs.get("params"), headers=kwargs.get("headers"), cookies=kwargs.get("cookies"))))
+
+        # as in http, no-cache asks for a response checked with the server
+        entry = None if "no-cache" in (kwargs.get("headers") or {}).get("Cache-Control", "") else self.cache.get_fresh(key)
+        if entry is not None:
+            return build_response(entry), "fresh"
+
+        entry = self.cache.get_stored(key)
+        if entry is not None:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **conditional_headers(entry)}
+        response = self._send(method, url, *args, **kwargs)
+        if entry is not None and response.status_code == 304:
+            return build_response(self.cache.revalidated(key, entry), response.request), "revalidated"
+        if response.status_code == 200:
+            self.cache.store(key, response)
+        return response, "miss"
+
+    @staticmethod
+    def _not_sent(error:requests.RequestException)->bool:
+        """
+        :return: whether the connection failed before the request was sent
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+    def _may_retry(self, method:str, error:Optional[requests.RequestException]=None,
+                   response:Optional[requests.Response]=None)->bool:
+        """
+        A POST (a login, a form) is only sent again when the server didn't get it, or refused it until Retry-After:
+        sent again after a read timeout, it would be acted on twice
+        """
+        if method.upper() in self._IDEMPOTENT_METHODS_:
+            return True
+        if error is not None:
+            return self._not_sent(error)
+        return response.status_code in (429, 503) and "Retry-After" in response.headers
+
+    def _send(self, method, url, *args, **kwargs)->requests.Response:
+        """
+        Send a request when the scheduler allows it, retrying on connection errors and on
+        the statuses meaning the server is overloaded, see _may_retry for the methods not idempotent
+        :return: the last response, the last connection error is raised if every attempt failed
+        """
+        if self.scheduler is None:
+            return super().request(method, url, *args, **kwargs)
+        for attempt in range(self.scheduler.max_retries + 1):
+            last_attempt = attempt == self.scheduler.max_retries
+            self.scheduler.acquire()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if last_attempt or not self._may_retry(method, error=error):
+                    raise
+                log.warning(f"{type(error).__name__} on {url}, attempt {attempt + 1}")
+                time.sleep(self.scheduler.record_failure(attempt))
+                continue
+            if response.status_code not in self.scheduler.RETRY_STATUSES:
+                self.scheduler.record_success()
+                return response
+            if last_attempt or not self._may_retry(method, response=response):
+                log.error(f"Status code:{response.status_code} on {url} after {attempt + 1} attempts")
+                return response
+            log.warning(f"Status code:{response.status_code} on {url}, attempt {attempt + 1}")
+            response.close()
+            time.sleep(self.scheduler.record_failure(attempt, parse_retry_after(response.headers.get("Retry-After"))))
+        return response
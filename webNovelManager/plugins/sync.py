@@ -0,0 +1,169 @@
+from typing import Dict, Iterable, Iterator, List, Optional, TypedDict, Union
+import itertools
+import hashlib
+import json
+import os
+
+import structlog
+from config import settings
+
+from .plugins import WebsitePlugin
+from .functions import hash_content
+from ..data.format import (ArcChapter, ArcHeader, ArcIndex, Chapter, ChapterIndexEntry, ChapterManifestEntry,
+                           NovelManifest, ShortNovel)
+
+
+log = structlog.getLogger(__name__)
+
+
+class SyncReport(TypedDict):
+    """
+    the outcome of the synchronization of one novel
+    """
+    source: str
+    skipped: bool # the novel didn't change since the last synchronization
+    new: List[Chapter]
+    changed: List[Chapter]
+    removed: List[str] # links of the chapters which disappeared from the index
+    arcs: Dict[str, ArcHeader] # the arc of each new or changed chapter, by link
+
+
+def group_by_arc(chapters:List[Chapter], arcs:Dict[str, ArcHeader])->List[Union[Chapter, ArcChapter]]:
+    """
+    :param arcs: the arc of the chapters, by source
+    :return: the chapters as the chapters of a NovelInstance, the following chapters of an arc gathered in it
+    """
+    elements = []
+    for arc_id, group in itertools.groupby(chapters, key=lambda chapter: arcs.get(chapter.get('source'), {}).get('arc_id')):
+        group = list(group)
+        if arc_id is None:
+            elements.extend(group)
+        else:
+            elements.append(ArcChapter(chapters=group, **arcs[group[0]['source']]))
+    return elements
+
+
+class ManifestStore:
+    """
+    Keep one json manifest per novel in a directory
+    """
+    def __init__(self, path:Optional[str]=None):
+        if path is None:
+            try:
+                path = settings[type(self).__name__]['path']
+            except KeyError:
+                log.warning(f"No path configured for {type(self).__name__}, using manifests/ in the working directory")
+                path = "manifests"
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def _manifest_path(self, source:str)->str:
+        return os.path.join(self.path, f"{hashlib.sha1(source.encode('utf-8')).hexdigest()}.json")
+
+    def load(self, source:str)->Optional[NovelManifest]:
+        """
+        Return the manifest of a novel if it was already synchronized
+        :param source: the link of the novel
+        :return:
+        """
+        try:
+            with open(self._manifest_path(source), encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, manifest:NovelManifest)->None:
+        """
+        Write the manifest of a novel, atomically so that a crash never leaves half a manifest
+        :param manifest:
+        :return:
+        """
+        path = self._manifest_path(manifest["source"])
+        with open(f"{path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+
+class NovelSynchronizer:
+    """
+    Incrementally synchronize novels: a novel whose last modification date didn't change costs
+    no request, otherwise only its index and its new or revised chapters are downloaded
+    """
+    def __init__(self, plugin:WebsitePlugin, manifest_store:Optional[ManifestStore]=None):
+        self.plugin = plugin
+        self.manifest_store = manifest_store if manifest_store is not None else ManifestStore()
+
+    def sync_novel(self, short_novel:ShortNovel, max_workers:Optional[int]=None,
+                   arcs:Optional[List[ArcIndex]]=None)->SyncReport:
+        """
+        Synchronize one novel against its manifest
+        :param short_novel: the novel as listed in the favorites
+        :param max_workers: number of chapters downloaded at the same time
+        :param arcs: the index of the novel if it was just downloaded, default: it is downloaded
+        :return: a report holding the new and changed chapters
+        """
+        source = short_novel['ref']
+        last_modified = short_novel['last_modified'].isoformat() if short_novel.get('last_modified') else None
+        report = SyncReport(source=source, skipped=False, new=[], changed=[], removed=[], arcs={})
+
+        manifest = self.manifest_store.load(source)
+        if manifest is not None and last_modified is not None and manifest['last_modified'] == last_modified:
+            report['skipped'] = True
+            return report
+
+        if arcs is None:
+            arcs = self.plugin.fetch_index(source)
+        entries = [entry for arc in arcs for entry in arc['chapters']]
+        headers = {entry['link']: ArcHeader(**{key: value for key, value in arc.items() if key != 'chapters'})
+                   for arc in arcs for entry in arc['chapters']}
+        if len(entries) == 0: # single chapter, the novel page is the chapter
+            entries = [ChapterIndexEntry(link=source, update=last_modified)]
+
+        known: Dict[str, ChapterManifestEntry] = {entry['link']: entry for entry in manifest['chapters']} if manifest else {}
+        to_fetch = [entry['link'] for entry in entries
+                    if entry['link'] not in known
+                    or entry['update'] is None
+                    or known[entry['link']]['update'] != entry['update']]
+        fetched = dict(zip(to_fetch, self.plugin._fetch_chapters(to_fetch, max_workers=max_workers)))
+
+        manifest_chapters = []
+        for entry in entries:
+            link = entry['link']
+            if link in fetched:
+                chapter = fetched[link]
+                content_hash = hash_content(chapter['raw_content'])
+                if link not in known or known[link]['hash'] != content_hash:
+                    report['new' if link not in known else 'changed'].append(chapter)
+                    if link in headers:
+                        report['arcs'][link] = headers[link]
+                manifest_chapters.append(ChapterManifestEntry(
+                    link=link, id=chapter.get('id'), update=entry['update'], hash=content_hash))
+            else:
+                manifest_chapters.append(known[link])
+        links = {entry['link'] for entry in entries}
+        report['removed'] = [link for link in known if link not in links]
+
+        self.manifest_store.save(NovelManifest(source=source, last_modified=last_modified, chapters=manifest_chapters))
+        log.info(f"Synchronized {source}: {len(report['new'])} new, {len(report['changed'])} changed, "
+                 f"{len(report['removed'])} removed, {len(to_fetch)} chapters downloaded")
+        return report
+
+    def sync(self, short_novels:Iterable[ShortNovel], max_workers:Optional[int]=None)->Iterator[SyncReport]:
+        """
+        Synchronize several novels, one report per novel
+        :param short_novels:
+        :param max_workers:
+        :return:
+        """
+        for short_novel in short_novels:
+            yield self.sync_novel(short_novel, max_workers=max_workers)
+
+    def sync_favorites(self, max_workers:Optional[int]=None)->Iterator[SyncReport]:
+        """
+        Synchronize every favorite novel of the logged account, starting as soon as the first
+        page of favorites arrives
+        :param max_workers:
+        :return:
+        """
+        yield from self.sync((short_novel for _, short_novel in self.plugin.iter_novels(max_workers=max_workers)),
+                             max_workers=max_workers)
@@ -1,27 +1,108 @@
-from typing import Dict, List, Optional, TypedDict, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import requests
+from urllib.parse import urlsplit
+import queue
 
 from structlog import get_logger
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+import lxml.html
+import requests
 
 from .plugins import WebsitePlugin
 from .functions import resolve_url
-from ..data.format import NovelInstance, Chapter
+from .cookies import CookieStore
+from .metrics import timed
+from ..database.artefact import ArtefactStore
+from ..data.format import Chapter, ArcIndex, ChapterIndexEntry, LoginInfo, ShortNovel
 
 
 log = get_logger(__name__)
 
+_CHAPTER_STRAINER_ = SoupStrainer("div", id="novel_color")
+# id -> component of the chapter, for the divisions which are children of novel_color
+_CHAPTER_COMPONENT_IDS_ = {"novel_no": "number", "novel_p": "preface", "novel_honbun": "main", "novel_a": "appendix"}
+_CHAPTER_COMPONENTS_XPATH_ = {
+    "number": './/div[@id="novel_no"]',
+    "subtitle": './/p[contains(concat(" ", normalize-space(@class), " "), " novel_subtitle ")]',
+    "preface": './/div[@id="novel_p"]',
+    "main": './/div[@id="novel_honbun"]',
+    "appendix": './/div[@id="novel_a"]',
+}
+# like BeautifulSoup, the text of these elements is not part of the text of a chapter
+_NOT_TEXT_XPATH_ = './/div[contains(concat(" ", normalize-space(@class), " "), " novel_bn ")] | .//script | .//style | .//template'
+# flag of the novel API -> tag shown on the novel information page
+_API_FLAG_TAGS_ = {"isr15": "R15", "isbl": "ボーイズラブ", "isgl": "ガールズラブ", "iszankoku": "残酷な描写あり",
+                   "istensei": "異世界転生", "istenni": "異世界転移"}
+# the fields asked to the API: title, ncode, writer, story, keyword, noveltype and the flags above
+_API_OUTPUT_FIELDS_ = "t-n-w-s-k-nt-ir-ibl-igl-izk-its-iti"
+_NOVEL_INFO_FIELDS_ = ("ncode", "title", "link", "age_limit", "type", "abstract", "author", "tags")
+
+
+def _drop_element(element:lxml.html.HtmlElement)->None:
+    """
+    remove an element from its tree but keep the text which follows it
+    :param element:
+    :return:
+    """
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+def _tree_text(element:lxml.html.HtmlElement)->str:
+    """
+    the text of an element, as BeautifulSoup .text
+    :param element:
+    :return:
+    """
+    return "".join(element.itertext())
 
-class ShortNovel(TypedDict):
+def _find_chapter_tree(page_tree:lxml.html.HtmlElement)->lxml.html.HtmlElement:
     """
-    A typed dict representing a novel to use for updates or quick presentation
+    return the novel_color division of a chapter page without the next/previous links
+    :param page_tree:
+    :return:
     """
-    title: str
-    author: str
-    ref: str
-    last_modified: datetime
+    chapter_tree = page_tree.xpath('//div[@id="novel_color"]')[0]
+    for element in chapter_tree.xpath(_NOT_TEXT_XPATH_):
+        _drop_element(element)
+    return chapter_tree
 
+def _split_chapter_tree_into_component(chapter_tree:lxml.html.HtmlElement)->Dict:
+    """
+    Find the components of a chapter in a single pass over the children of novel_color,
+    falling back to a search for the ones which are not direct children
+    :param chapter_tree:
+    :return: a dictionary component -> element or None
+    """
+    components = dict.fromkeys(_CHAPTER_COMPONENTS_XPATH_)
+    for child in chapter_tree.iterchildren("div", "p"):
+        if child.tag == "div":
+            component = _CHAPTER_COMPONENT_IDS_.get(child.get("id"))
+        else:
+            component = "subtitle" if "novel_subtitle" in child.get("class", "").split() else None
+        if component is not None and components[component] is None:
+            components[component] = child
+    for component, xpath in _CHAPTER_COMPONENTS_XPATH_.items():
+        if components[component] is None:
+            found = chapter_tree.xpath(xpath)
+            components[component] = found[0] if found else None
+    return components
+
+def _find_images(main_tree:lxml.html.HtmlElement)->List[Tuple[str, str]]:
+    """
+    return the (href, src) of the images of a chapter
+    :param main_tree: the body of the chapter
+    :return:
+    """
+    return [(link.get("href"), link.xpath('.//img')[0].get("src")) for link in main_tree.xpath('.//a[@href][.//img]')]
+
+@timed()
 def _get_novels_from_category_page(category_page: BeautifulSoup) -> List[ShortNovel]:
     """
     Given a beautiful soup which correspond to a page of favorit return a list of novels
@@ -50,6 +131,58 @@ def _find_novel_info_page(novel_page:BeautifulSoup)->str:
     """
     return novel_page.find('ul', id='head_nav').find_all('li')[1].next['href']
 
+def _split_novel_link(novel_link:str)->Tuple[str, str]:
+    """
+    return the subdomain and the lowercase ncode of a novel link
+    :param novel_link: ex: https://ncode.syosetu.com/n7975cr/
+    :return: ex: ("ncode", "n7975cr")
+    """
+    return resolve_url(novel_link).subdomain, urlsplit(novel_link).path.strip("/").split("/")[0].lower()
+
+def _novel_info_from_api(api_novel:Dict, subdomain:str)->Dict:
+    """
+    convert a novel of the novel API into the dictionary of get_novel_info,
+    the fields the API didn't return are missing
+    :param api_novel: a novel of the json answer of the API
+    :param subdomain: ncode or novel18
+    :return:
+    """
+    novel_info = {}
+    if "ncode" in api_novel:
+        novel_info['ncode'] = api_novel['ncode'].upper()
+        novel_info['link'] = f"https://{subdomain}.syosetu.com/{api_novel['ncode'].lower()}/"
+    if "title" in api_novel:
+        novel_info['title'] = api_novel['title']
+    novel_info['age_limit'] = subdomain == "novel18"
+    if "noveltype" in api_novel:
+        novel_info['type'] = 'oneshot' if api_novel['noveltype'] == 2 else 'webnovel'
+    if "story" in api_novel:
+        novel_info['abstract'] = api_novel['story']
+    if "writer" in api_novel:
+        novel_info['author'] = api_novel['writer']
+    if "keyword" in api_novel:
+        keywords = api_novel['keyword'].replace(u'\xa0', ' ').split()
+        # the page lists the flags of the novel before its keywords, the API gives them apart
+        flags = [tag for flag, tag in _API_FLAG_TAGS_.items() if api_novel.get(flag) == 1 and tag not in keywords]
+        novel_info['tags'] = flags + keywords
+    return novel_info
+
+def _get_index_update_stamp(index_element:BeautifulSoup)->Optional[str]:
+    """
+    return the publication date of a chapter in the index, followed by its revision date if any
+    :param index_element: a novel_sublist2 element of the index
+    :return:
+    """
+    update_tree = index_element.find('dt', {'class': 'long_update'})
+    if update_tree is None:
+        return None
+    stamp = update_tree.find(string=True, recursive=False)
+    stamp = stamp.strip() if stamp else ""
+    revision = update_tree.find('span', title=True)
+    if revision is not None:
+        stamp = f"{stamp} {revision['title']}"
+    return stamp
+
 class Syosetu(WebsitePlugin):
     """
     This a plugin implementing the gestion of syosetu novels
@@ -62,11 +195,17 @@ class Syosetu(WebsitePlugin):
         "ncode" : f"{_DEFAULT_LINK}/favnovelmain/list/"
     }
     __LOGIN__URL = "https://ssl.syosetu.com/login/login/"
+    _API_ = {
+        "ncode": "https://api.syosetu.com/novelapi/api/",
+        "novel18": "https://api.syosetu.com/novel18api/api/"
+    }
+    _API_BATCH_SIZE_ = 100 # ncodes per request, the API answers up to 500 novels
+    _LOGIN_COOKIE_ = "userl"
 
-    MAX_LOOP_ = 10 # max iteration loop for avoiding infinite loop
-    def __init__(self):
-        super().__init__()
-        self.session = requests.session()
+    def __init__(self, artefact_store:Optional[ArtefactStore]=None, credentials:Optional[LoginInfo]=None,
+                 cookie_store:Optional[CookieStore]=None):
+        super().__init__(artefact_store, credentials, cookie_store)
+        self.session = self._make_session()
 
     def login(self)->bool:
         """
@@ -104,10 +243,42 @@ class Syosetu(WebsitePlugin):
 
     def is_logged(self)->bool:
         """
-        Check if the session is logged in
+        Check if the session holds the login cookie, see check_session to know if the server still accepts it
+        :return:
+        """
+        return any(self._LOGIN_COOKIE_ in cookie for cookie in self.session.cookies.keys())
+
+    def check_session(self)->bool:
+        """
+        Check the server still accepts the login: the favorites are only shown to a logged session
+        :return:
+        """
+        response = self.session.get(self.__FAVORITE_SUBDOMAIN__["ncode"], allow_redirects=False,
+                                    headers={**self._HEADERS_, "Cache-Control": "no-cache"})
+        return not self._is_rejected(response)
+
+    @staticmethod
+    def _is_rejected(response:requests.Response)->bool:
+        """
+        the pages requiring a login redirect to the login form when the session isn't logged
+        """
+        return response.status_code in (301, 302, 303, 401, 403) or urlsplit(response.url or "").path.startswith("/login")
+
+    def _get_logged_page(self, link:str)->requests.Response:
+        """
+        get a page requiring the login, logging in again once if the server rejects the session
+        :param link:
         :return:
+        :raise PermissionError: if the server still rejects the session, the page being the login form
         """
-        return any("userl" in cookie for cookie in self.session.cookies.keys())
+        response = self.session.get(link, headers=self._HEADERS_)
+        if self._is_rejected(response):
+            log.info(f"The login was rejected on {link}, logging in again")
+            if self.relogin():
+                response = self.session.get(link, headers=self._HEADERS_)
+            if self._is_rejected(response):
+                raise PermissionError(f"The login was rejected on {link}")
+        return response
 
     def _get_favorite_page(self, subdomain:str)->Optional[BeautifulSoup]:
         """
@@ -117,11 +288,14 @@ class Syosetu(WebsitePlugin):
         """
         try:
             link = self.__FAVORITE_SUBDOMAIN__[subdomain]
-            response = self.session.get(link, headers=self._HEADERS_)
+            response = self._get_logged_page(link)
             assert response.status_code == 200
             return BeautifulSoup(response.text, "lxml")
         except AssertionError:
-            log.error("Are you sure you are logged in?")
+            log.error(f"Status code:{response.status_code} on {link}. Are you sure you are logged in?")
+            return None
+        except PermissionError as error:
+            log.error(f"{error}. Are the credentials right?")
             return None
 
     def _get_categories_from_favorite_page(self, favorite_page_response: BeautifulSoup)->List:
@@ -139,20 +313,34 @@ class Syosetu(WebsitePlugin):
         and the title
         :return: a list of dictionary
         """
+        return [novel for novels in self._iter_category_pages(category_link, subdomain) for novel in novels]
+
+    def _iter_category_pages(self, category_link:str, subdomain:str)->Iterator[List[ShortNovel]]:
+        """
+        Given a category link, yield the novels of each page of the category.
+        The crawl stops on an empty page or on a page already visited, so it can't loop forever
+        :param category_link:
+        :param subdomain:
+        :return: an iterator of list of novels, one list per page
+        """
+        visited = set()
         more_page = True
-        novels_list = []
-        index = 0
         try:
-            while more_page & (index<self.MAX_LOOP_):
-                response = self.session.get(category_link, headers= self._HEADERS_)
+            while more_page and category_link not in visited:
+                visited.add(category_link)
+                response = self._get_logged_page(category_link)
                 assert response.status_code == 200
                 category_soup = BeautifulSoup(response.text, "lxml")
-                novels_list += _get_novels_from_category_page(category_soup)
+                novels = _get_novels_from_category_page(category_soup)
+                if len(novels) == 0:
+                    return
+                yield novels
                 more_page, category_link = self._get_next_page(category_soup, subdomain)
-                index+=1
         except AssertionError:
-            log.error("Are you sure you are logged in?")
-        return novels_list
+            # the scheduler already retried the transient errors (429, 503...)
+            log.error(f"Status code:{response.status_code} on {category_link}. Are you sure you are logged in?")
+        except PermissionError as error:
+            log.error(f"{error}. Are the credentials right?")
 
     def _get_next_page(self, category_soup:BeautifulSoup, subdomain:str)->Tuple[bool, Optional[str]]:
         """
@@ -166,24 +354,82 @@ class Syosetu(WebsitePlugin):
         f"{self.__FAVORITE_SUBDOMAIN__[subdomain]}{next_page['href']}"
         if next_page is not None else None)
 
-    def fetch_novels(self)->Dict[str,List[ShortNovel]]:
+    def fetch_novels(self, max_workers:Optional[int]=None)->Dict[str,List[ShortNovel]]:
         """
         return for each subdomain
+        :param max_workers: number of pages downloaded at the same time
         :return:
         """
-        novels_by_subdomain = {}
+        pages_by_subdomain = {subdomain: [] for subdomain in self._SUBDOMAIN_}
+        for subdomain, category_index, page_index, novels in self._iter_favorite_pages(max_workers):
+            pages_by_subdomain[subdomain].append((category_index, page_index, novels))
+        return {
+            subdomain: [novel for _, _, novels in sorted(pages, key=lambda page: page[:2]) for novel in novels]
+            for subdomain, pages in pages_by_subdomain.items()
+        }
+
+    def iter_novels(self, max_workers:Optional[int]=None)->Iterator[Tuple[str, ShortNovel]]:
+        """
+        yield the favorite novels as soon as their page arrives, the subdomains and categories
+        being crawled at the same time
+        :param max_workers: number of pages downloaded at the same time
+        :return: an iterator of (subdomain, novel)
+        """
+        for subdomain, _, _, novels in self._iter_favorite_pages(max_workers):
+            for novel in novels:
+                yield subdomain, novel
+
+    def _iter_favorite_pages(self, max_workers:Optional[int]=None)->Iterator[Tuple[str, int, int, List[ShortNovel]]]:
+        """
+        Crawl the favorite pages of every subdomain and category concurrently,
+        the pages of a category being crawled in sequence
+        :param max_workers: number of pages downloaded at the same time
+        :return: an iterator of (subdomain, category index, page index, novels) in the order the pages arrive
+        """
         try:
             assert self.is_logged()
         except AssertionError:
             log.error("Are you sure you are logged in?")
-        for subdomain in self._SUBDOMAIN_:
-            favorite_soup = self._get_favorite_page(subdomain)
-            favorite_categories = self._get_categories_from_favorite_page(favorite_soup)
-            novels_by_subdomain[subdomain] = []
-            for category_link in favorite_categories:
-                novels_by_subdomain[subdomain] += self._get_novels_from_category_ref(category_link, subdomain)
-        return novels_by_subdomain
+        results = queue.Queue()
 
+        def crawl_subdomain(subdomain):
+            favorite_soup = self._get_favorite_page(subdomain)
+            if favorite_soup is None:
+                return
+            for category_index, category_link in enumerate(self._get_categories_from_favorite_page(favorite_soup)):
+                results.put(("category", subdomain, category_index, category_link))
+
+        def crawl_category(subdomain, category_index, category_link):
+            for page_index, novels in enumerate(self._iter_category_pages(category_link, subdomain)):
+                results.put(("page", subdomain, category_index, page_index, novels))
+
+        def run(task, *args):
+            try:
+                task(*args)
+            except Exception as error:
+                log.error(f"Failed to crawl the favorites {args}: {error!r}")
+            finally:
+                results.put(None) # the task is over
+
+        executor = ThreadPoolExecutor(max_workers=self._get_max_workers(max_workers))
+        try:
+            pending = 0
+            for subdomain in self._SUBDOMAIN_:
+                executor.submit(run, crawl_subdomain, subdomain)
+                pending += 1
+            while pending > 0:
+                result = results.get()
+                if result is None:
+                    pending -= 1
+                elif result[0] == "category":
+                    executor.submit(run, crawl_category, *result[1:])
+                    pending += 1
+                else:
+                    yield result[1:]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @timed()
     def _get_novel_info(self, novel_info_link:str)->Dict:
         """
         given a syotesu link, return a dictionary with detailed information
@@ -221,23 +467,95 @@ class Syosetu(WebsitePlugin):
         :param novel_link: 
         :return: 
         """
+        return self.get_novels_info([novel_link])[novel_link]
+
+    def _scrape_novel_info(self, novel_link:str)->Dict:
+        """
+        get the novel info from its pages: the top page of the novel, then its information page
+        :param novel_link:
+        :return:
+        """
         response = self.session.get(novel_link, headers = self._HEADERS_)
         soup = BeautifulSoup(response.text, "lxml")
         novel_info_link = _find_novel_info_page(soup)
         return self._get_novel_info(novel_info_link)
 
+    def get_novels_info(self, novel_links:List[str])->Dict[str, Dict]:
+        """
+        get the info of many novels from the novel API, up to _API_BATCH_SIZE_ novels per request.
+        The pages of a novel are only scraped when the API doesn't know it or misses a field
+        :param novel_links:
+        :return: a dictionary novel link -> novel info, as get_novel_info
+        """
+        links_by_ncode:Dict[Tuple[str, str], List[str]] = {}
+        for novel_link in novel_links:
+            links_by_ncode.setdefault(_split_novel_link(novel_link), []).append(novel_link)
+
+        api_novels = {}
+        for subdomain in self._SUBDOMAIN_:
+            ncodes = sorted({ncode for novel_subdomain, ncode in links_by_ncode if novel_subdomain == subdomain})
+            for start in range(0, len(ncodes), self._API_BATCH_SIZE_):
+                for api_novel in self._query_novel_api(subdomain, ncodes[start:start + self._API_BATCH_SIZE_]):
+                    api_novels[(subdomain, api_novel.get('ncode', '').lower())] = _novel_info_from_api(api_novel, subdomain)
+
+        novels_info = {}
+        for (subdomain, ncode), links in links_by_ncode.items():
+            novel_info = api_novels.get((subdomain, ncode), {})
+            missing = [field for field in _NOVEL_INFO_FIELDS_ if field not in novel_info]
+            if missing:
+                log.info(f"The novel API lacks {missing} for {ncode}, scraping its pages")
+                novel_info = {**self._scrape_novel_info(links[0]), **novel_info}
+            for novel_link in links:
+                novels_info[novel_link] = novel_info
+        return novels_info
+
+    def _query_novel_api(self, subdomain:str, ncodes:List[str])->List[Dict]:
+        """
+        ask the novel API the info of several novels in one request
+        :param subdomain: ncode or novel18, each has its own API
+        :param ncodes:
+        :return: the novels found, an empty list if the API failed
+        """
+        if subdomain not in self._API_:
+            return []
+        parameters = {"out": "json", "ncode": "-".join(ncodes), "of": _API_OUTPUT_FIELDS_, "lim": len(ncodes)}
+        try:
+            response = self.session.get(self._API_[subdomain], params=parameters, headers=self._HEADERS_)
+            response.raise_for_status()
+            answer = response.json()
+        except (requests.RequestException, ValueError) as error:
+            log.warning(f"The novel API failed for {len(ncodes)} novels of {subdomain}: {error!r}")
+            return []
+        return [api_novel for api_novel in answer if "allcount" not in api_novel] # the first item is the count
+
+    @timed()
     def _fetch_chapter(self, link:str) ->Chapter:
-        chapter_cleaned_soup = self._get_chapter_raw(link)
-        artefacts = self._resolve_artefact(chapter_cleaned_soup)
+        response = self.session.get(link, headers = self._HEADERS_)
+        response.raise_for_status() # never parse an error page into a broken chapter
+        return self._parse_chapter(link, response.text)
+
+    @timed()
+    def _parse_chapter(self, link:str, html:str)->Chapter:
+        """
+        Build a chapter from the html of its page.
+        The page is parsed by lxml without building a BeautifulSoup tree and the components
+        are found in a single pass over novel_color, the result is the same as parsing the
+        soup returned by _get_chapter_raw
+        :param link: the link of the chapter
+        :param html: the html of the chapter page
+        :return:
+        """
+        chapter_tree = _find_chapter_tree(lxml.html.document_fromstring(html))
+        split_chapter = _split_chapter_tree_into_component(chapter_tree)
         chapter:Chapter = {
             "language": "jp",
-            "id": chapter_cleaned_soup.find("div", id="novel_no").text.split("/")[0] if chapter_cleaned_soup.find("div", id="novel_no") else None,
+            "id": _tree_text(split_chapter["number"]).split("/")[0] if split_chapter["number"] is not None else None,
             "source": link,
-            "raw_content": chapter_cleaned_soup.text,
-            "artefact": artefacts
+            "raw_content": _tree_text(chapter_tree),
+            "artefact": self._download_artefacts(_find_images(split_chapter["main"]))
         }
-        if chapter_cleaned_soup.find("p", {'class': 'novel_subtitle'}):
-            chapter['title'] = chapter_cleaned_soup.find("p", {'class': 'novel_subtitle'}).text
+        if split_chapter["subtitle"] is not None:
+            chapter['title'] = _tree_text(split_chapter["subtitle"])
         return chapter
 
     def _split_chapter_soup_into_component(self, chapter_clean_soup)->Dict:
@@ -247,45 +565,57 @@ class Syosetu(WebsitePlugin):
             "appendix": chapter_clean_soup.find('div', id="novel_a")
         }
 
+    @timed()
     def _resolve_artefact(self, chapter_soup:BeautifulSoup)->Dict:
         """
-        TODO
+        Download the images of a chapter
         :param chapter_soup:
-        :return:
+        :return: a dictionary href -> image, the image being a reference in the artefact store
+        if the plugin has one, else the raw bytes
         """
-        artefacts = {}
         split_chapter = self._split_chapter_soup_into_component(chapter_soup)
         list_of_images = split_chapter["main"].find_all("a")
-        for image_soup in list_of_images:
-            if ("href" in image_soup.attrs.keys()) & (image_soup.find("img") is not None):
-                artefacts[image_soup['href']] = self.session.get(f"https:{image_soup.find('img')['src']}").content
+        return self._download_artefacts([
+            (image_soup['href'], image_soup.find('img')['src'])
+            for image_soup in list_of_images
+            if ("href" in image_soup.attrs.keys()) & (image_soup.find("img") is not None)
+        ])
+
+    @timed()
+    def _download_artefacts(self, images:List[Tuple[str, str]])->Dict:
+        """
+        Download images given as (href, src)
+        :param images:
+        :return: a dictionary href -> image, the image being a reference in the artefact store
+        if the plugin has one, else the raw bytes
+        """
+        artefacts = {}
+        for href, src in images:
+            image_url = f"https:{src}"
+            if self.artefact_store is not None:
+                artefacts[href] = self.artefact_store.fetch(self.session, image_url, headers=self._HEADERS_)
+            else:
+                artefacts[href] = self.session.get(image_url).content
         return artefacts
 
-    def _fetch_novel(self, novel_link:str) ->NovelInstance:
+    @timed()
+    def _parse_index(self, soup:BeautifulSoup, fqdn:str)->List[ArcIndex]:
         """
-        TODO
-        :param url:
-        :return:
+        Parse the index of a serialized novel into its arcs, each arc holding the index entries of its chapters
+        :param soup: the soup of the novel top page
+        :param fqdn: the host of the novel
+        :return: a list of arcs, empty for a single chapter novel
         """
-        # initialize output
-
-        novel:NovelInstance = {"source": novel_link}
-        resolved_url = resolve_url(novel_link)
-        fqdn = resolved_url.fqdn
-        # get html page
-        response = self.session.get(novel_link, headers = self._HEADERS_)
-        soup = BeautifulSoup(response.text, 'lxml')
-
-        # parse novel content
-        chapters = []
-        index_tree = soup.find('div', {'class':'index_box'}).findChildren(recursive=False) if soup.find('div', {'class':'index_box'}) else []
+        arcs = []
+        index_box = soup.find('div', {'class':'index_box'})
+        index_tree = index_box.find_all(recursive=False) if index_box is not None else []
         if len(index_tree)>0: # serialization
             arc_id = 0
             chapter_arc = {"chapters": [], "arc_id":arc_id}
             for element in index_tree:
                 if element['class'][0] == 'chapter_title':
                     if 'arc_title' in chapter_arc.keys(): #new arc
-                        chapters.append(chapter_arc)
+                        arcs.append(chapter_arc)
                         arc_id += 1
                         chapter_arc = {'arc_title': element.text, "chapters": [], "arc_id":arc_id}
                     else:
@@ -293,14 +623,22 @@ class Syosetu(WebsitePlugin):
                         chapter_arc["arc_title"] = element.text
                 elif element['class'][0].startswith('novel_sublist2'):
                     chapter_link = element.find('a')['href']
-                    chapter_arc['chapters'].append(self._fetch_chapter(f"https://{fqdn}{chapter_link}"))
-            chapters.append(chapter_arc)
-        else: # single chapter
-            chapters = [self._fetch_chapter(novel_link)] # only one chapter and subchapter
-
-        novel['chapters'] = chapters
-        novel['extend'] = None
-        return novel
+                    chapter_arc['chapters'].append(ChapterIndexEntry(
+                        link=f"https://{fqdn}{chapter_link}",
+                        update=_get_index_update_stamp(element)
+                    ))
+            arcs.append(chapter_arc)
+        return arcs
+
+    def fetch_index(self, novel_link:str)->List[ArcIndex]:
+        """
+        Download the top page of a novel and return its index without fetching the chapters
+        :param novel_link:
+        :return: a list of arcs, empty for a single chapter novel
+        """
+        response = self.session.get(novel_link, headers = self._HEADERS_)
+        response.raise_for_status()
+        return self._parse_index(BeautifulSoup(response.text, 'lxml'), resolve_url(novel_link).fqdn)
 
     def _get_chapter_raw(self, url:str)->BeautifulSoup:
         """
@@ -309,7 +647,15 @@ class Syosetu(WebsitePlugin):
         :return:
         """
         response = self.session.get(url, headers = self._HEADERS_)
-        soup = BeautifulSoup(response.text, "lxml")
+        return self._parse_chapter_html(response.text)
+
+    def _parse_chapter_html(self, html:str)->Optional[BeautifulSoup]:
+        """
+        Parse only the novel_color division of a chapter page, the rest of the page is skipped
+        :param html:
+        :return: the cleaned novel_color division
+        """
+        soup = BeautifulSoup(html, "lxml", parse_only=_CHAPTER_STRAINER_)
         return self._minimun_parse_raw_chapter(soup.find('div', id="novel_color"))
 
     def _minimun_parse_raw_chapter(self, raw_chapter:Optional[BeautifulSoup])->Optional[BeautifulSoup]:
@@ -320,4 +666,4 @@ class Syosetu(WebsitePlugin):
         """
         for div in raw_chapter.find_all("div", {"class":"novel_bn"}):
             div.decompose()
-        return raw_chapter
\ No newline at end of file
+        return raw_chapter
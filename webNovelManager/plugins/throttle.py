@@ -0,0 +1,153 @@
+from typing import Dict, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import random
+import threading
+import time
+
+import structlog
+
+
+log = structlog.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket: tokens are refilled at `rate` per second up to `capacity`
+    and each request consumes one
+    """
+    def __init__(self, rate:float, capacity:float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now:float)->None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self)->float:
+        """
+        take a token, possibly in advance
+        :return: the number of seconds to wait before the token can be used
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self)->None:
+        """
+        block until a token is available
+        :return:
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DomainScheduler:
+    """
+    Pace the requests sent to a domain. The rate increases additively while the responses are
+    healthy and is divided on errors, and every worker pauses when the server asks to (Retry-After)
+    """
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, domain:str, rate:float=2.0, min_rate:float=0.2, max_rate:float=10.0,
+                 burst:float=4, increase:float=0.05, max_retries:int=3, base_backoff:float=1.0,
+                 max_backoff:float=120.0):
+        self.domain = domain
+        self.increase = increase
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate, burst)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self)->float:
+        return self.bucket.rate
+
+    def acquire(self)->None:
+        """
+        block until a request can be sent to the domain
+        :return:
+        """
+        with self._lock:
+            pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        self.bucket.acquire()
+
+    def record_success(self)->None:
+        """
+        speed up a little after a healthy response
+        :return:
+        """
+        with self._lock:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase)
+
+    def record_failure(self, attempt:int, retry_after:Optional[float]=None)->float:
+        """
+        slow down after an error
+        :param attempt: the number of the failed attempt, starting at 0
+        :param retry_after: the delay asked by the server, if any
+        :return: the number of seconds to wait before retrying
+        """
+        delay = self.backoff(attempt, retry_after)
+        with self._lock:
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+            if retry_after is not None: # the whole domain waits, not only this request
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        log.warning(f"Slowing down {self.domain} to {self.bucket.rate:.2f} requests/s, retrying in {delay:.1f}s")
+        return delay
+
+    def backoff(self, attempt:int, retry_after:Optional[float]=None)->float:
+        """
+        the delay before retrying: the delay asked by the server if any,
+        else an exponential backoff with full jitter
+        :param attempt:
+        :param retry_after:
+        :return:
+        """
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+
+def parse_retry_after(value:Optional[str])->Optional[float]:
+    """
+    parse a Retry-After header, either a number of seconds or an http date
+    :param value:
+    :return: a number of seconds, None if missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+__SCHEDULERS__: Dict[str, DomainScheduler] = {}
+__SCHEDULERS_LOCK__ = threading.Lock()
+
+def get_scheduler(domain:str, **kwargs)->DomainScheduler:
+    """
+    return the scheduler of a domain, shared by every plugin and session of the process
+    :param domain: a plugin _DOMAIN_
+    :param kwargs: the parameters of the scheduler when it is created
+    :return:
+    """
+    with __SCHEDULERS_LOCK__:
+        if domain not in __SCHEDULERS__:
+            __SCHEDULERS__[domain] = DomainScheduler(domain, **kwargs)
+        return __SCHEDULERS__[domain]
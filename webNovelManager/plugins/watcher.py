@@ -0,0 +1,460 @@
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from bisect import bisect_right
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import math
+import sqlite3
+import time
+
+import structlog
+from config import settings
+
+from .metrics import get_metrics
+from .plugins import WebsitePlugin
+from ..data.format import ArcIndex, ShortNovel
+
+
+log = structlog.getLogger(__name__)
+
+
+_DAY_ = 86400.0
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS novels (
+    source TEXT PRIMARY KEY,
+    title TEXT,
+    author TEXT,
+    last_modified TEXT, -- as listed in the favorites
+    updates TEXT NOT NULL, -- json list of the known update times, oldest first
+    checked REAL NOT NULL, -- when the novel was last known to be up to date
+    digest TEXT, -- of its index, NULL until the index is checked
+    chapters INTEGER NOT NULL DEFAULT 0, -- in its index
+    ahead INTEGER NOT NULL DEFAULT 0 -- the index showed an update the favorites don't list yet
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def count_requests()->float:
+    """
+    :return: the number of requests sent by the sessions of the process so far, read from the metrics
+    """
+    return sum(histogram.count for histogram in get_metrics().histograms("webnovel_http_request_duration_seconds").values())
+
+
+def count_chapters(arcs:List[ArcIndex])->int:
+    return sum(len(arc['chapters']) for arc in arcs)
+
+
+def index_digest(arcs:List[ArcIndex])->str:
+    """
+    :return: a digest of the chapters of an index and their update stamps, it changes with a new or revised chapter
+    """
+    entries = [(entry['link'], entry['update']) for arc in arcs for entry in arc['chapters']]
+    return hashlib.sha1(json.dumps(entries, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class WatchedNovel:
+    """
+    A favorite novel and what is known of its updates. Once a few updates are known, the next one is predicted
+    from the gaps between them: a novel updated every day at the same hour is unlikely updated an hour after its
+    last update, and very likely a day after. Before that, or once the novel is late on its pace, its updates are
+    modeled as a Poisson process whose rate is estimated from the known updates, with a prior of one update
+    per `prior_span` seconds
+    """
+    __slots__ = ("source", "title", "author", "last_modified", "updates", "checked", "digest", "chapters", "ahead",
+                 "_gaps", "_areas")
+    _MAX_UPDATES_ = 16 # the older updates are forgotten, so that the pace learnt follows a change of pace
+    _MIN_GAPS_ = 3
+    _SPREAD_ = (0.8, 1.0, 1.25) # each gap stands for gaps a little shorter or longer, as the pace isn't exact
+    _LATE_ = 0.05 # the pace doesn't hold anymore once the time without update is longer than 95% of the gaps
+
+    def __init__(self, source:str, title:str="", author:str="", last_modified:Optional[str]=None,
+                 updates:Optional[List[float]]=None, checked:float=0.0, digest:Optional[str]=None, chapters:int=0,
+                 ahead:bool=False):
+        self.source = source
+        self.title = title
+        self.author = author
+        self.last_modified = last_modified
+        self.updates = updates if updates is not None else []
+        self.checked = checked
+        self.digest = digest
+        self.chapters = chapters
+        self.ahead = ahead
+        self._learn_pace()
+
+    def _learn_pace(self)->None:
+        """
+        sort the gaps between the updates, and the area under the share of the gaps longer than each of them
+        """
+        self._gaps, self._areas = [], []
+        if len(self.updates) <= self._MIN_GAPS_:
+            return
+        self._gaps = sorted(max(0.0, later - earlier) * spread for earlier, later in zip(self.updates, self.updates[1:])
+                            for spread in self._SPREAD_)
+        area, previous = 0.0, 0.0
+        for position, gap in enumerate(self._gaps):
+            area += (gap - previous) * (1 - (position + 0.5) / len(self._gaps))
+            self._areas.append(area)
+            previous = gap
+
+    def record_updates(self, last:float, count:int=1, since:Optional[float]=None)->None:
+        """
+        Record new updates: several chapters found at once were published between two checks
+        :param last: when the last one was published
+        :param count: the number of updates
+        :param since: the others were published after, evenly
+        """
+        count = min(count, self._MAX_UPDATES_)
+        since = last if since is None else since
+        times = (last - (last - since) * number / count for number in range(count))
+        self.updates = sorted(set(self.updates).union(times))[-self._MAX_UPDATES_:]
+        self._learn_pace()
+
+    def rate(self, now:float, prior_span:float)->float:
+        """
+        :return: the expected number of updates per second. The span runs until now, so the rate of a novel
+        which stopped updating keeps decreasing
+        """
+        if not self.updates:
+            return 1 / prior_span
+        return len(self.updates) / (max(0.0, now - self.updates[0]) + prior_span)
+
+    def _survival(self, elapsed:float)->Tuple[float, float]:
+        """
+        :return: the share of the gaps longer than elapsed, interpolated between the gaps, and its integral from 0
+        """
+        gaps = self._gaps
+        position = bisect_right(gaps, elapsed)
+        if position == len(gaps):
+            return 0.0, self._areas[-1]
+        previous = gaps[position - 1] if position else 0.0
+        survival = 1 - (position + (elapsed - previous) / (gaps[position] - previous)) / len(gaps)
+        start = 1 - position / len(gaps)
+        return survival, (self._areas[position - 1] if position else 0.0) + (elapsed - previous) * (start + survival) / 2
+
+    def expectations(self, now:float, prior_span:float)->Tuple[float, float]:
+        """
+        :return: the probability that the novel was updated since it was last checked, and the expected time
+        since that update (0 if not updated), which grows as fast as the probability
+        """
+        elapsed = max(0.0, now - self.checked)
+        if self._gaps:
+            last = self.updates[-1]
+            checked_survival, checked_area = self._survival(max(0.0, self.checked - last))
+            if checked_survival >= self._LATE_:
+                survival, area = self._survival(max(0.0, now - last))
+                return 1 - survival / checked_survival, elapsed - (area - checked_area) / checked_survival
+        rate = self.rate(now, prior_span)
+        probability = 1 - math.exp(-rate * elapsed)
+        return probability, elapsed - probability / rate
+
+    def to_short_novel(self, last_modified:Optional[datetime]=None)->ShortNovel:
+        if last_modified is None and self.last_modified is not None:
+            last_modified = datetime.fromisoformat(self.last_modified)
+        return ShortNovel(title=self.title, author=self.author, ref=self.source, last_modified=last_modified)
+
+
+class WatchStore:
+    """
+    Keep what the watcher learnt of the novels in a sqlite file, so that a restarted watcher keeps their pace
+    """
+    def __init__(self, path:Optional[str]=None):
+        if path is None:
+            try:
+                path = settings[type(self).__name__]['path']
+            except KeyError:
+                log.warning(f"No path configured for {type(self).__name__}, using the working directory")
+                path = "watch.sqlite"
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA_)
+
+    def load(self)->Dict[str, WatchedNovel]:
+        return {row[0]: WatchedNovel(*row[:4], json.loads(row[4]), *row[5:8], bool(row[8]))
+                for row in self.connection.execute("SELECT source, title, author, last_modified, updates, checked, "
+                                                   "digest, chapters, ahead FROM novels")}
+
+    def save(self, novels:Iterable[WatchedNovel])->None:
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO novels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                (novel.source, novel.title, novel.author, novel.last_modified, json.dumps(novel.updates),
+                 novel.checked, novel.digest, novel.chapters, int(novel.ahead)) for novel in novels))
+
+    def delete(self, sources:Iterable[str])->None:
+        with self.connection:
+            self.connection.executemany("DELETE FROM novels WHERE source = ?", ((source,) for source in sources))
+
+    def get_state(self, key:str)->Optional[str]:
+        row = self.connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key:str, value:str)->None:
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, value))
+
+    def close(self)->None:
+        self.connection.close()
+
+
+class RequestBudget:
+    """
+    The global request budget of the watcher: `rate` requests per second, up to `capacity` of them saved
+    for a burst. The requests are charged once sent, as the cost of a crawl of the favorites is only known then
+    """
+    def __init__(self, rate:float, capacity:float, clock:Callable[[], float]=time.time):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    @property
+    def tokens(self)->float:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self._tokens
+
+    def delay(self, cost:float)->float:
+        """
+        :param cost: the expected number of requests, at most `capacity` of them are waited for
+        :return: the number of seconds to wait before spending them
+        """
+        return max(0.0, min(cost, self.capacity) - self.tokens) / self.rate
+
+    def charge(self, requests:float)->None:
+        self._tokens = self.tokens - requests
+
+
+class UpdateWatcher:
+    """
+    Watch the favorite novels of an account for new chapters, checking first the novels most likely updated.
+    A check either crawls the favorites, which lists the last modification of every novel for a few requests,
+    or downloads the index of one novel. The watcher picks the check which shortens the most the time the updates
+    wait to be found, per request, once it is worth `delay_per_request`, and never exceeds `requests_per_hour`:
+    a novel updated daily is checked about when it updates, a dormant one only by the crawls of the favorites,
+    themselves rare when few novels are active
+    """
+    def __init__(self, plugin:WebsitePlugin,
+                 on_update:Optional[Callable[[ShortNovel, Optional[List[ArcIndex]]], Union[None, Awaitable]]]=None,
+                 store:Optional[WatchStore]=None, requests_per_hour:Optional[float]=None,
+                 delay_per_request:Optional[float]=None, prior_span:float=7 * _DAY_, max_sleep:float=900.0,
+                 clock:Callable[[], float]=time.time, sleep:Callable[[float], Awaitable]=asyncio.sleep,
+                 request_counter:Callable[[], float]=count_requests):
+        """
+        :param plugin: a plugin logged in the account
+        :param on_update: called with each updated novel, as listed in the favorites (or with the time the update
+        was found if seen in its index), and its index just downloaded (None if it failed),
+        ex: lambda novel, arcs: synchronizer.sync_novel(novel, arcs=arcs). Its requests are charged to the budget
+        :param store: default: a WatchStore at the path of the settings
+        :param requests_per_hour: the global budget, default: UpdateWatcher.requests_per_hour of the settings or 60
+        :param delay_per_request: the seconds of waiting of the updates a request must save, the lower the sooner the
+        updates are found for more requests, default: UpdateWatcher.delay_per_request of the settings or an hour
+        :param prior_span: the novels are assumed to update once in this span (seconds) until their updates are known
+        :param max_sleep: the longest wait between two plans
+        :param clock: the current time in seconds since the epoch
+        :param sleep: awaited to wait, both are replaced to simulate the watcher
+        :param request_counter: the number of requests sent so far, to charge the budget
+        """
+        self.plugin = plugin
+        self.on_update = on_update
+        self.store = store if store is not None else WatchStore()
+        try:
+            requests_per_hour = requests_per_hour or settings[type(self).__name__]['requests_per_hour']
+        except (KeyError, TypeError):
+            requests_per_hour = 60
+        try:
+            delay_per_request = delay_per_request or settings[type(self).__name__]['delay_per_request']
+        except (KeyError, TypeError):
+            delay_per_request = 3600.0
+        self.delay_per_request = delay_per_request
+        self.prior_span = prior_span
+        self.max_sleep = max_sleep
+        self.clock = clock
+        self.sleep = sleep
+        self.request_counter = request_counter
+        # a crawl of the favorites can be paid at once with a quarter of the hourly budget
+        self.budget = RequestBudget(requests_per_hour / 3600, max(1.0, requests_per_hour / 4), clock)
+        self.novels = self.store.load()
+        # the novels listed by the first crawl are known, not updated: stored as the favorites can be found empty
+        self.crawled = bool(self.novels) or self.store.get_state("crawled") is not None
+        self.crawl_cost = 1.0 # learnt at each crawl
+        self.requests = 0.0
+        self.found = 0
+
+    def plan(self, now:float)->Tuple[Optional[str], float, float]:
+        """
+        Choose the next check, the one saving the most waiting of the updates per request
+        :param now:
+        :return: the novel to check (None to crawl the favorites), the seconds of waiting it saves per request,
+        and the seconds before it is worth delay_per_request, 0 if it already is
+        """
+        if not self.novels:
+            return None, math.inf, 0.0
+        best, best_value, soonest = None, 0.0, math.inf
+        crawl_delay, crawl_updates = 0.0, 0.0
+        for source, novel in self.novels.items():
+            probability, delay = novel.expectations(now, self.prior_span)
+            crawl_delay += delay
+            crawl_updates += probability
+            if delay > best_value:
+                best, best_value = source, delay
+            if probability > 0: # the delay grows as fast as the probability
+                soonest = min(soonest, (self.delay_per_request - delay) / probability)
+        # a crawl costs its pages, then the index of each updated novel
+        cost = self.crawl_cost + crawl_updates
+        if crawl_delay / cost >= best_value:
+            best, best_value = None, crawl_delay / cost
+        if best_value >= self.delay_per_request:
+            return best, best_value, 0.0
+        if crawl_updates > 0:
+            soonest = min(soonest, (self.delay_per_request * cost - crawl_delay) / crawl_updates)
+        return best, best_value, max(0.0, soonest)
+
+    async def run(self, duration:Optional[float]=None)->None:
+        """
+        Watch until cancelled
+        :param duration: stop after this many seconds
+        :return:
+        """
+        end = None if duration is None else self.clock() + duration
+        while end is None or self.clock() < end:
+            now = self.clock()
+            source, _, wait = self.plan(now)
+            if wait <= 0: # then wait for the budget, and plan again as the probabilities changed meanwhile
+                wait = self.budget.delay(self.crawl_cost if source is None else 1)
+                if wait <= 0:
+                    await (self.crawl() if source is None else self.check(source))
+                    continue
+            # at least a second, the budget or the end being otherwise waited for in steps too short to pass
+            await self.sleep(max(1.0, min(wait, self.max_sleep, math.inf if end is None else end - now)))
+
+    def _charge(self, start:float)->None:
+        # a failed check is charged too, so that the watcher slows down when the website is down
+        requests = max(1.0, self.request_counter() - start)
+        self.budget.charge(requests)
+        self.requests += requests
+
+    async def crawl(self)->List[ShortNovel]:
+        """
+        Crawl the favorites: every novel is known up to date, except the ones whose last modification changed.
+        The index of these is downloaded, which is needed to synchronize them anyway
+        :return: the updated novels, the novels added to the favorites since the previous crawl being updated
+        """
+        start = self.request_counter()
+        try:
+            sections = await asyncio.to_thread(self.plugin.fetch_novels)
+        except Exception as error:
+            log.error(f"Failed to crawl the favorites: {error!r}")
+            return []
+        finally:
+            self._charge(start)
+        self.crawl_cost = max(1.0, self.request_counter() - start)
+        now = self.clock()
+        listed = {novel['ref']: novel for novels in sections.values() for novel in novels}
+        if not listed and self.novels:
+            # the plugins log the pages they fail to download: the favorites are empty when the site is down or
+            # the login rejected, the novels are kept until they are listed again
+            log.error("Failed to crawl the favorites: none listed")
+            return []
+        first = not self.crawled
+        updated = []
+        for source, short_novel in listed.items():
+            last_modified = short_novel['last_modified'].isoformat() if short_novel.get('last_modified') else None
+            novel = self.novels.get(source)
+            changed = last_modified is not None and (novel is None or last_modified != novel.last_modified)
+            if novel is None:
+                novel = self.novels[source] = WatchedNovel(source)
+                if changed:
+                    novel.record_updates(short_novel['last_modified'].timestamp())
+                if not first:
+                    updated.append((short_novel, None))
+            elif changed:
+                if novel.ahead: # the update was already found in the index
+                    novel.ahead = False
+                else:
+                    updated.append((short_novel, novel.checked))
+            novel.title, novel.author, novel.last_modified = short_novel['title'], short_novel['author'], last_modified
+            novel.checked = now
+        removed = [source for source in self.novels if source not in listed]
+        for source in removed:
+            del self.novels[source]
+        self.store.save(self.novels[source] for source in listed)
+        self.store.delete(removed)
+        if first:
+            self.crawled = True
+            self.store.set_state("crawled", datetime.fromtimestamp(now).isoformat())
+        log.info(f"Crawled the favorites for {self.crawl_cost:.0f} requests: {len(listed)} novels, "
+                 f"{len(updated)} updated")
+        for short_novel, checked in updated:
+            novel = self.novels[short_novel['ref']]
+            arcs = await self._fetch_index(novel.source)
+            count = 1
+            if arcs is not None:
+                chapters = count_chapters(arcs)
+                if novel.digest is not None:
+                    count = max(1, chapters - novel.chapters)
+                novel.digest, novel.chapters = index_digest(arcs), chapters
+            if checked is not None:
+                novel.record_updates(short_novel['last_modified'].timestamp(), count, since=checked)
+            self.store.save([novel])
+            await self._report(short_novel, arcs)
+        return [short_novel for short_novel, _ in updated]
+
+    async def check(self, source:str)->bool:
+        """
+        Download the index of a novel, it was updated if the index changed
+        :param source:
+        :return: whether the novel was updated
+        """
+        novel = self.novels[source]
+        previous = novel.checked
+        arcs = await self._fetch_index(source)
+        now = self.clock()
+        novel.checked = now # a failed check isn't tried again at once
+        updated = False
+        if arcs is not None:
+            digest, chapters = index_digest(arcs), count_chapters(arcs)
+            if novel.digest is not None and digest != novel.digest:
+                updated = novel.ahead = True
+                # published between the two checks, about in the middle
+                novel.record_updates((previous + now) / 2, max(1, chapters - novel.chapters), since=previous)
+            novel.digest, novel.chapters = digest, chapters
+        self.store.save([novel])
+        if updated:
+            await self._report(novel.to_short_novel(datetime.fromtimestamp(now)), arcs)
+        return updated
+
+    async def _fetch_index(self, source:str)->Optional[List[ArcIndex]]:
+        start = self.request_counter()
+        try:
+            return await asyncio.to_thread(self.plugin.fetch_index, source)
+        except Exception as error:
+            log.warning(f"Failed to download the index of {source}: {error!r}")
+            return None
+        finally:
+            self._charge(start)
+
+    async def _report(self, short_novel:ShortNovel, arcs:Optional[List[ArcIndex]])->None:
+        self.found += 1
+        log.info(f"{short_novel['ref']} was updated")
+        if self.on_update is None:
+            return
+        start = self.request_counter()
+        try:
+            if asyncio.iscoroutinefunction(self.on_update):
+                await self.on_update(short_novel, arcs)
+            else:
+                await asyncio.to_thread(self.on_update, short_novel, arcs)
+        except Exception as error:
+            log.error(f"Failed to handle the update of {short_novel['ref']}: {error!r}")
+        finally:
+            requests = self.request_counter() - start
+            self.budget.charge(requests)
+            self.requests += requests
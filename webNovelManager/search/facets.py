@@ -0,0 +1,378 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from operator import itemgetter
+import sqlite3
+import threading
+
+from config import settings
+
+from ..log import getLogger
+
+
+log = getLogger(__name__)
+
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS bitmaps (
+    id INTEGER PRIMARY KEY,
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    bits BLOB NOT NULL, -- see _encode_bitmap
+    UNIQUE (facet, value)
+);
+CREATE INDEX IF NOT EXISTS bitmaps_count ON bitmaps (facet, count);
+CREATE TABLE IF NOT EXISTS novels (
+    id INTEGER PRIMARY KEY, -- the bit of the novel in the bitmaps
+    source TEXT NOT NULL UNIQUE,
+    bitmaps BLOB NOT NULL -- the ids of its bitmaps, as 32 bits integers
+);
+"""
+
+# the fields of the novel info indexed, as returned by get_novel_info
+FACETS = ("tags", "author", "type", "age_limit")
+_ALL_ = ("", "") # the bitmap of every novel indexed, for the negations
+
+Key = Tuple[str, str] # (facet, value)
+Term = Union[str, Key] # "facet:value", a bare value being a tag, or (facet, value)
+Container = Union[int, array] # a bitset, or the increasing ids of a value held by few novels
+
+
+def novel_facets(info:Dict)->Set[Key]:
+    """
+    :param info: the info of a novel
+    :return: its (facet, value), the values being strings: "true"/"false" for the booleans
+    """
+    facets = set()
+    for facet in FACETS:
+        values = info.get(facet)
+        if values is None:
+            continue
+        for value in values if isinstance(values, (list, tuple, set)) else [values]:
+            if isinstance(value, dict): # a data.format.Tag
+                value = value.get("original_term") or value.get("description")
+            elif isinstance(value, bool):
+                value = "true" if value else "false"
+            value = str(value).strip() if value is not None else ""
+            if value:
+                facets.add((facet, value))
+    return facets
+
+
+def parse_term(term:Term)->Key:
+    if not isinstance(term, str):
+        return term
+    facet, separator, value = term.partition(":")
+    if separator and facet in FACETS:
+        return facet, value
+    return "tags", term
+
+
+def _encode_bitmap(container:Container)->bytes:
+    """
+    :return: the ids as 32 bits integers, or the bitset in little endian, after their type code
+    """
+    if isinstance(container, array):
+        return b"a" + container.tobytes()
+    return b"b" + container.to_bytes((container.bit_length() + 7) // 8, "little")
+
+
+def _decode_bitmap(encoded:bytes)->Container:
+    if encoded[:1] == b"b":
+        return int.from_bytes(encoded[1:], "little")
+    ids = array("I")
+    ids.frombytes(encoded[1:])
+    return ids
+
+
+def _to_bits(container:Container)->int:
+    if isinstance(container, int):
+        return container
+    if len(container) == 0:
+        return 0
+    bits = bytearray(container[-1] // 8 + 1)
+    for novel in container:
+        bits[novel >> 3] |= 1 << (novel & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _cardinality(container:Container)->int:
+    return len(container) if isinstance(container, array) else container.bit_count()
+
+
+def bit_positions(bits:int)->List[int]:
+    """
+    :return: the positions of the bits set, increasing
+    """
+    digits = bin(bits)[:1:-1] # the lowest bit first, searched by str.find rather than bit by bit
+    positions = []
+    position = digits.find("1")
+    while position >= 0:
+        positions.append(position)
+        position = digits.find("1", position + 1)
+    return positions
+
+
+
+
+class FacetIndex:
+    """
+    An index of the tags, authors, types and age limits of the novels, for the faceted queries of a library:
+    "tagged 異世界転生 and 女主人公, not R15" or the tag counts of the results.
+    Every novel is a bit, every (facet, value) the bitmap of its novels. As in roaring bitmaps a value held by few
+    novels keeps the array of their ids, a frequent one a bitset (a python int), so that the bitwise
+    operations are done by the big integers of python. Every novel also keeps the ids of its bitmaps,
+    to count the values of the novels of a result. Everything is stored in a sqlite file, loaded on first use
+    """
+    _DENSE_RATIO_ = 32 # a bitmap becomes a bitset once it holds more than 1/32 of the novels
+    _SPARSE_RATIO_ = 64 # and an array again under 1/64
+    _IN_SIZE_ = 500 # ids per "IN" clause
+
+    def __init__(self, path:Optional[str]=None):
+        if path is None:
+            try:
+                path = settings[type(self).__name__]['path']
+            except KeyError:
+                log.warning(f"No path configured for {type(self).__name__}, using the working directory")
+                path = "facets.sqlite"
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA_)
+        self._size = (self.connection.execute("SELECT MAX(id) FROM novels").fetchone()[0] or 0) + 1 # bits of a bitset
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._forget()
+
+    def _forget(self)->None:
+        """
+        drop what was loaded from the file
+        """
+        self._bitmaps:Dict[Key, Container] = {}
+        self._dirty:Set[Key] = set() # the bitmaps changed since the last flush
+        self._ids:Optional[Dict[Key, int]] = None # the ids of the bitmaps, see _load_ids
+        self._keys:Dict[int, Key] = {}
+        self._novel_bitmaps:Optional[Dict[int, bytes]] = None # novel -> ids of its bitmaps, see _load_novel_bitmaps
+
+    def close(self)->None:
+        self.connection.close()
+
+    @contextmanager
+    def batch(self)->Iterator[sqlite3.Connection]:
+        """
+        Group every update done inside the context in one transaction, rolled back on error.
+        The bitmaps changed are written once, at the end
+        :return: the connection
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.connection.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.connection
+                if self._depth == 1:
+                    self._flush()
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.connection.execute("ROLLBACK")
+                    self._forget()
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("COMMIT")
+
+    def _flush(self)->None:
+        updated, removed = [], []
+        for key in sorted(self._dirty):
+            container = self._bitmaps[key]
+            count = _cardinality(container)
+            if count == 0:
+                removed.append(self._ids.pop(key))
+                del self._keys[removed[-1]], self._bitmaps[key]
+                continue
+            if isinstance(container, array) and count * self._DENSE_RATIO_ > self._size:
+                container = self._bitmaps[key] = _to_bits(container)
+            elif isinstance(container, int) and count * self._SPARSE_RATIO_ < self._size:
+                container = self._bitmaps[key] = array("I", bit_positions(container))
+            updated.append((count, _encode_bitmap(container), self._ids[key]))
+        self.connection.executemany("UPDATE bitmaps SET count = ?, bits = ? WHERE id = ?", updated)
+        self.connection.executemany("DELETE FROM bitmaps WHERE id = ?", [(bitmap,) for bitmap in removed])
+        self._dirty.clear()
+
+    def _load(self, key:Key)->Container:
+        container = self._bitmaps.get(key)
+        if container is None:
+            row = self.connection.execute("SELECT bits FROM bitmaps WHERE facet = ? AND value = ?", key).fetchone()
+            container = self._bitmaps[key] = _decode_bitmap(row[0]) if row is not None else array("I")
+        return container
+
+    def _load_ids(self)->Dict[Key, int]:
+        if self._ids is None:
+            self._keys = {bitmap: (facet, value) for bitmap, facet, value in
+                          self.connection.execute("SELECT id, facet, value FROM bitmaps")}
+            self._ids = {key: bitmap for bitmap, key in self._keys.items()}
+        return self._ids
+
+    def _bitmap_id(self, key:Key)->int:
+        ids = self._load_ids()
+        if key not in ids:
+            ids[key] = self.connection.execute("INSERT INTO bitmaps (facet, value, count, bits) VALUES (?, ?, 0, ?) "
+                                               "RETURNING id", (*key, _encode_bitmap(array("I")))).fetchone()[0]
+            self._keys[ids[key]] = key
+        return ids[key]
+
+    def _load_novel_bitmaps(self)->Dict[int, bytes]:
+        if self._novel_bitmaps is None:
+            self._novel_bitmaps = dict(self.connection.execute("SELECT id, bitmaps FROM novels"))
+        return self._novel_bitmaps
+
+    def _set_bit(self, key:Key, novel:int, value:bool)->None:
+        container = self._load(key)
+        if isinstance(container, int):
+            self._bitmaps[key] = container | (1 << novel) if value else container & ~(1 << novel)
+        else:
+            position = bisect_left(container, novel)
+            present = position < len(container) and container[position] == novel
+            if value and not present:
+                container.insert(position, novel)
+            elif not value and present:
+                del container[position]
+        self._dirty.add(key)
+
+    def _set_novel_bitmaps(self, novel:int, bitmaps:Optional[bytes])->None:
+        if self._novel_bitmaps is None:
+            return
+        if bitmaps is None:
+            self._novel_bitmaps.pop(novel, None)
+        else:
+            self._novel_bitmaps[novel] = bitmaps
+
+    def set_novel_info(self, source:str, info:Dict)->bool:
+        """
+        index the facets of a novel, replacing the previous ones
+        :param source: the source of the novel
+        :param info: as returned by get_novel_info
+        :return: False if its facets didn't change
+        """
+        facets = novel_facets(info)
+        with self.batch():
+            self._bitmap_id(_ALL_)
+            bitmaps = array("I", sorted(self._bitmap_id(key) for key in facets)).tobytes()
+            row = self.connection.execute("SELECT id, bitmaps FROM novels WHERE source = ?", (source,)).fetchone()
+            if row is None:
+                novel = self.connection.execute("INSERT INTO novels (source, bitmaps) VALUES (?, ?) RETURNING id",
+                                                (source, bitmaps)).fetchone()[0]
+                self._size = max(self._size, novel + 1)
+                self._set_bit(_ALL_, novel, True)
+                previous = set()
+            else:
+                if row[1] == bitmaps:
+                    return False
+                novel, previous = row[0], {self._keys[bitmap] for bitmap in array("I", row[1])}
+                self.connection.execute("UPDATE novels SET bitmaps = ? WHERE id = ?", (bitmaps, novel))
+            for key in previous - facets:
+                self._set_bit(key, novel, False)
+            for key in facets - previous:
+                self._set_bit(key, novel, True)
+            self._set_novel_bitmaps(novel, bitmaps)
+        return True
+
+    def set_novels_info(self, novels_info:Dict[str, Dict])->int:
+        """
+        :param novels_info: source -> info, as returned by get_novels_info
+        :return: the number of novels whose facets changed
+        """
+        with self.batch():
+            return sum(self.set_novel_info(source, info) for source, info in novels_info.items())
+
+    def remove_novel(self, source:str)->None:
+        with self.batch():
+            row = self.connection.execute("SELECT id, bitmaps FROM novels WHERE source = ?", (source,)).fetchone()
+            if row is None:
+                return
+            self._load_ids()
+            for key in [_ALL_, *(self._keys[bitmap] for bitmap in array("I", row[1]))]:
+                self._set_bit(key, row[0], False)
+            self.connection.execute("DELETE FROM novels WHERE id = ?", (row[0],))
+            self._set_novel_bitmaps(row[0], None)
+
+    def bitmap(self, term:Term)->int:
+        """
+        :param term: "facet:value", a bare value being a tag, or (facet, value)
+        :return: the bitset of the novels holding the value
+        """
+        with self._lock:
+            return _to_bits(self._load(parse_term(term)))
+
+    def query(self, all_of:Iterable[Term]=(), any_of:Iterable[Term]=(), none_of:Iterable[Term]=())->int:
+        """
+        the novels holding every value of all_of, at least one of any_of (when given) and none of none_of,
+        ex: query(["異世界転生", "女主人公"], none_of=["R15"])
+        :return: their bitset, see sources and count
+        """
+        with self._lock:
+            bits = _to_bits(self._load(_ALL_))
+            # the rarest first, the intersection only gets smaller
+            for key in sorted(map(parse_term, all_of), key=lambda key: _cardinality(self._load(key))):
+                if not bits:
+                    return 0
+                bits &= _to_bits(self._load(key))
+            any_of = [parse_term(term) for term in any_of]
+            if any_of:
+                union = 0
+                for key in any_of:
+                    union |= _to_bits(self._load(key))
+                bits &= union
+            for key in map(parse_term, none_of):
+                bits &= ~_to_bits(self._load(key))
+            return bits
+
+    def sources(self, bits:int, limit:Optional[int]=None)->List[str]:
+        """
+        :param bits: a bitset, see query
+        :param limit: the maximum number of novels
+        :return: the sources of its novels, in the order they were indexed
+        """
+        novels = bit_positions(bits)[:limit]
+        sources:Dict[int, str] = {}
+        for start in range(0, len(novels), self._IN_SIZE_):
+            chunk = novels[start:start + self._IN_SIZE_]
+            sources.update(self.connection.execute(
+                f"SELECT id, source FROM novels WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return [sources[novel] for novel in novels if novel in sources]
+
+    def count(self, facet:str, within:Optional[int]=None, limit:Optional[int]=None)->List[Tuple[str, int]]:
+        """
+        the number of novels by value of a facet, ex: the tag counts
+        :param facet: tags, author, type or age_limit
+        :param within: count only the novels of this bitset, see query
+        :param limit: the maximum number of values
+        :return: (value, number of novels), the most frequent first
+        """
+        with self._lock:
+            if within is None:
+                if self._dirty: # in a batch, the counts stored are written first
+                    self._flush()
+                return self.connection.execute(
+                    "SELECT value, count FROM bitmaps WHERE facet = ? ORDER BY count DESC, value LIMIT ?",
+                    (facet, -1 if limit is None else limit)).fetchall()
+            novel_bitmaps = self._load_novel_bitmaps()
+            bitmaps = array("I")
+            bitmaps.frombytes(b"".join(novel_bitmaps.get(novel, b"") for novel in bit_positions(within)))
+            self._load_ids()
+            keys = self._keys
+            counts = [(keys[bitmap][1], count) for bitmap, count in Counter(bitmaps).items() # counted in C
+                      if keys[bitmap][0] == facet]
+            # by value then by count, two sorts in C rather than a key built by item
+            counts.sort(key=itemgetter(0))
+            counts.sort(key=itemgetter(1), reverse=True)
+            return counts[:limit]
+
+    def __len__(self)->int:
+        with self._lock:
+            return _cardinality(self._load(_ALL_))
@@ -0,0 +1,387 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+import hashlib
+import heapq
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from config import settings
+
+from ..data.compression import TextCompressor, as_text, read_header
+from ..data.format import Chapter, NovelInstance
+from ..export.epub import iter_novel_instance
+from ..log import getLogger
+
+
+log = getLogger(__name__)
+
+
+_SCHEMA_ = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    novel TEXT NOT NULL,
+    chapter_id TEXT NOT NULL, -- '' for the info of the novel
+    field TEXT NOT NULL, -- text, title, abstract or author
+    title TEXT,
+    length INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    content BLOB NOT NULL, -- the compressed text, for the snippets
+    grams BLOB NOT NULL, -- its distinct grams, to remove its postings
+    UNIQUE (novel, chapter_id, field)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    gram TEXT NOT NULL,
+    document INTEGER NOT NULL,
+    positions BLOB NOT NULL, -- the positions of the gram in the document, see _encode_positions
+    PRIMARY KEY (gram, document)
+) WITHOUT ROWID;
+"""
+
+_WORD_ = re.compile(r"\w+") # japanese has no spaces: a word is a run of letters, kana, kanji or digits
+_FIELD_WEIGHTS_ = {"title": 3.0, "author": 2.0, "abstract": 1.5, "text": 1.0}
+_INFO_FIELDS_ = ("title", "abstract", "author")
+_LAST_CHARACTER_ = "\U0010ffff"
+_K1_ = 1.2
+_B_ = 0.75
+
+
+class _Fold(dict):
+    """
+    str.translate table folding every character to its NFKC lower case form (full width latin, half width kana...)
+    when it stays a single character, so that the positions in the folded text are the ones of the original text
+    """
+    def __missing__(self, codepoint:int)->str:
+        character = chr(codepoint)
+        folded = unicodedata.normalize("NFKC", character).lower()
+        self[codepoint] = folded = folded if len(folded) == 1 else character
+        return folded
+
+
+_FOLD_ = _Fold()
+
+
+def normalize(text:str)->str:
+    return text.translate(_FOLD_)
+
+
+def tokenize(text:str)->Iterator[Tuple[str, int]]:
+    """
+    split a text into character bi-grams. The last character of every word is also a gram by itself,
+    so that every character starts a gram and a single character can be looked up by prefix
+    :param text: a normalized text
+    :return: an iterator of (gram, position of the gram in the text)
+    """
+    for match in _WORD_.finditer(text):
+        word, start = match.group(), match.start()
+        for offset in range(len(word) - 1):
+            yield word[offset:offset + 2], start + offset
+        yield word[-1], start + len(word) - 1
+
+
+def _encode_positions(positions:List[int])->bytes:
+    """
+    :param positions: increasing positions
+    :return: the positions as 16 bits integers (32 bits past 65535 characters), after their type code.
+    Denser varints would be decoded in python, much slower than array
+    """
+    typecode = "H" if positions[-1] <= 0xFFFF else "I"
+    return typecode.encode("ascii") + array(typecode, positions).tobytes()
+
+
+def _decode_positions(encoded:bytes)->List[int]:
+    positions = array(chr(encoded[0]))
+    positions.frombytes(encoded[1:])
+    return positions.tolist()
+
+
+class SearchResult(NamedTuple):
+    novel: str
+    chapter_id: Optional[str] # None for a match in the info of the novel
+    field: str
+    title: Optional[str]
+    score: float
+    snippet: str
+
+
+class SearchIndex:
+    """
+    An inverted index of the chapters and the info (title, abstract, author) of the novels, stored in a sqlite file.
+    Texts are split in character bi-grams, which works for japanese without a dictionary: a word of the query matches
+    the documents holding all its bi-grams one after the other. Results are ranked by BM25, weighted by field.
+    Every chapter is a document of its own, indexing it again only replaces its postings
+    """
+    _SNIPPET_WIDTH_ = 40 # characters kept on each side of the match
+    _IN_SIZE_ = 500 # documents per "IN" clause
+    _CACHE_SIZE_ = 64 * 2 ** 20 # bytes of pages cached by sqlite
+
+    def __init__(self, path:Optional[str]=None):
+        if path is None:
+            try:
+                path = settings[type(self).__name__]['path']
+            except KeyError:
+                log.warning(f"No path configured for {type(self).__name__}, using the working directory")
+                path = "search.sqlite"
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # the postings of a chapter are spread all over the b-tree, it is much faster with its pages in memory
+        self.connection.execute(f"PRAGMA cache_size=-{self._CACHE_SIZE_ // 1024}")
+        self.connection.executescript(_SCHEMA_)
+        self._compressor = TextCompressor()
+        self._decompressors:Dict[int, TextCompressor] = {self._compressor.codec: self._compressor}
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._statistics:Optional[Tuple[int, float]] = None # documents, average length
+
+    def close(self)->None:
+        self.connection.close()
+
+    @contextmanager
+    def batch(self)->Iterator[sqlite3.Connection]:
+        """
+        Group every update done inside the context in one transaction, rolled back on error
+        :return: the connection
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.connection.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.connection
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.connection.execute("ROLLBACK")
+                    self._statistics = None
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("COMMIT")
+
+    def _remove_document(self, document:int, grams:bytes)->None:
+        grams = [(gram, document) for gram in self._decompress(grams).split("\n")]
+        self.connection.executemany("DELETE FROM postings WHERE gram = ? AND document = ?", grams)
+        self.connection.execute("DELETE FROM documents WHERE id = ?", (document,))
+        self._statistics = None
+
+    def add_document(self, novel:str, chapter_id:Optional[str], field:str, text:Optional[str],
+                     title:Optional[str]=None)->bool:
+        """
+        index a text, replacing its previous version
+        :param novel: the source of the novel
+        :param chapter_id: None for the info of the novel
+        :param field: text for a chapter, else title, abstract or author
+        :param text:
+        :param title: shown with the results
+        :return: False if the text was already indexed as is
+        """
+        chapter_id = "" if chapter_id is None else str(chapter_id)
+        text = as_text(text) or ""
+        digest = hashlib.sha256(f"{title}\n{text}".encode("utf-8")).digest()
+        with self.batch():
+            row = self.connection.execute("SELECT id, digest, grams FROM documents WHERE novel = ? AND chapter_id = ? "
+                                          "AND field = ?", (novel, chapter_id, field)).fetchone()
+            if row is not None:
+                if row[1] == digest:
+                    return False
+                self._remove_document(row[0], row[2])
+            if not text:
+                return True
+            positions:Dict[str, List[int]] = defaultdict(list)
+            for gram, position in tokenize(normalize(text)):
+                positions[gram].append(position)
+            document = self.connection.execute(
+                "INSERT INTO documents (novel, chapter_id, field, title, length, digest, content, grams) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING id",
+                (novel, chapter_id, field, title, len(text), digest, self._compressor.compress(text),
+                 self._compressor.compress("\n".join(positions)))).fetchone()[0]
+            # in the order of the primary key, the pages of the b-tree are visited once
+            self.connection.executemany("INSERT INTO postings (gram, document, positions) VALUES (?, ?, ?)",
+                                        [(gram, document, _encode_positions(positions[gram])) for gram in sorted(positions)])
+            self._statistics = None
+        return True
+
+    def add_chapter(self, novel:str, chapter:Chapter)->bool:
+        """
+        index a chapter, replacing its postings if it was already indexed
+        :param novel: the source of the novel
+        :param chapter:
+        :return: False if the chapter didn't change since it was indexed
+        """
+        return self.add_document(novel, chapter.get("id"), "text", chapter.get("raw_content"), chapter.get("title"))
+
+    def add_chapters(self, novel:str, chapters:Iterable[Chapter])->int:
+        """
+        :return: the number of chapters indexed, the ones which didn't change aren't
+        """
+        with self.batch():
+            return sum(self.add_chapter(novel, chapter) for chapter in chapters)
+
+    def add_novel_info(self, novel:str, info:Dict)->None:
+        """
+        index the title, abstract and author of a novel
+        :param novel: the source of the novel
+        :param info: as returned by get_novel_info
+        :return:
+        """
+        with self.batch():
+            for field in _INFO_FIELDS_:
+                self.add_document(novel, None, field, info.get(field), info.get("title"))
+
+    def add_novel(self, novel:NovelInstance, info:Optional[Dict]=None)->int:
+        """
+        index every chapter of a novel, and its info if given
+        :return: the number of chapters indexed
+        """
+        with self.batch():
+            if info is not None:
+                self.add_novel_info(novel["source"], info)
+            return self.add_chapters(novel["source"], (chapter for _, chapter in iter_novel_instance(novel)))
+
+    def remove_chapter(self, novel:str, chapter_id:str)->None:
+        with self.batch():
+            for document, grams in self.connection.execute(
+                    "SELECT id, grams FROM documents WHERE novel = ? AND chapter_id = ?", (novel, str(chapter_id))).fetchall():
+                self._remove_document(document, grams)
+
+    def remove_novel(self, novel:str)->None:
+        with self.batch():
+            for document, grams in self.connection.execute(
+                    "SELECT id, grams FROM documents WHERE novel = ?", (novel,)).fetchall():
+                self._remove_document(document, grams)
+
+    def _decompress(self, blob:bytes)->str:
+        codec = read_header(blob)[0]
+        if codec not in self._decompressors:
+            self._decompressors[codec] = TextCompressor(codec)
+        return self._decompressors[codec].decompress(blob)
+
+    def _document_frequency(self, gram:str)->int:
+        return self.connection.execute("SELECT COUNT(*) FROM postings WHERE gram = ?", (gram,)).fetchone()[0]
+
+    def _postings(self, gram:str, documents:Optional[Set[int]])->Dict[int, bytes]:
+        """
+        :param gram:
+        :param documents: the only documents to look at, None for all of them
+        :return: document -> encoded positions
+        """
+        if documents is None:
+            return dict(self.connection.execute("SELECT document, positions FROM postings WHERE gram = ?", (gram,)))
+        postings = {}
+        documents = sorted(documents)
+        for start in range(0, len(documents), self._IN_SIZE_):
+            chunk = documents[start:start + self._IN_SIZE_]
+            postings.update(self.connection.execute(
+                f"SELECT document, positions FROM postings WHERE gram = ? AND document IN ({','.join('?' * len(chunk))})",
+                [gram, *chunk]))
+        return postings
+
+    def _prefix_postings(self, character:str, documents:Optional[Set[int]])->Dict[int, List[int]]:
+        """
+        :return: document -> positions of the grams starting with the character
+        """
+        positions:Dict[int, List[int]] = defaultdict(list)
+        for document, encoded in self.connection.execute(
+                "SELECT document, positions FROM postings WHERE gram BETWEEN ? AND ?", (character, character + _LAST_CHARACTER_)):
+            if documents is None or document in documents:
+                positions[document].extend(_decode_positions(encoded))
+        return {document: sorted(document_positions) for document, document_positions in positions.items()}
+
+    def _match_word(self, word:str, documents:Optional[Set[int]])->Tuple[Dict[int, List[int]], int]:
+        """
+        find the occurrences of a word, all its grams one after the other
+        :param word: a normalized word of the query
+        :param documents: the only documents to look at, None for all of them
+        :return: document -> positions of the word, and an estimate of the number of documents holding it
+        """
+        if len(word) == 1:
+            occurrences = self._prefix_postings(word, documents)
+            return occurrences, len(occurrences)
+        # bi-grams every other character cover the word, the positions of the others add nothing
+        grams = [(word[offset:offset + 2], offset) for offset in sorted({*range(0, len(word) - 1, 2), len(word) - 2})]
+        frequencies = {gram: self._document_frequency(gram) for gram, _ in grams}
+        if not all(frequencies.values()):
+            return {}, 0
+        grams.sort(key=lambda item: frequencies[item[0]]) # the rarest first, it gives the fewest candidates
+        occurrences:Optional[Dict[int, Set[int]]] = None # document -> positions where the word may start
+        for gram, offset in grams:
+            postings = self._postings(gram, documents if occurrences is None else set(occurrences))
+            starts = {document: {position - offset for position in _decode_positions(encoded)}
+                      for document, encoded in postings.items()}
+            if occurrences is None:
+                occurrences = starts
+            else:
+                occurrences = {document: document_starts & starts[document]
+                               for document, document_starts in occurrences.items() if document in starts}
+                occurrences = {document: document_starts for document, document_starts in occurrences.items() if document_starts}
+            if not occurrences:
+                return {}, 0
+        return {document: sorted(starts) for document, starts in occurrences.items()}, frequencies[grams[0][0]]
+
+    def _get_statistics(self)->Tuple[int, float]:
+        if self._statistics is None:
+            count, total = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents").fetchone()
+            self._statistics = count, total / count if count else 0.0
+        return self._statistics
+
+    def search(self, query:str, limit:int=20, novel:Optional[str]=None,
+               highlight:Tuple[str, str]=("【", "】"))->List[SearchResult]:
+        """
+        find the documents holding every word of the query
+        :param query: words separated by spaces or punctuation, ex: "勇者 魔王"
+        :param limit: the maximum number of results
+        :param novel: search only in this novel
+        :param highlight: what surrounds the match in the snippets
+        :return: the results, best first
+        """
+        words = list(dict.fromkeys(match.group() for match in _WORD_.finditer(normalize(query))))
+        if not words:
+            return []
+        with self._lock:
+            count, average_length = self._get_statistics()
+            documents:Optional[Set[int]] = None
+            if novel is not None:
+                documents = {document for document, in self.connection.execute("SELECT id FROM documents WHERE novel = ?", (novel,))}
+            matches = []
+            for word in sorted(words, key=len, reverse=True): # the longest words are usually the rarest
+                occurrences, frequency = self._match_word(word, documents)
+                if not occurrences:
+                    return []
+                documents = set(occurrences)
+                matches.append((word, occurrences, math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))))
+            rows = {}
+            chunk_documents = sorted(documents)
+            for start in range(0, len(chunk_documents), self._IN_SIZE_):
+                chunk = chunk_documents[start:start + self._IN_SIZE_]
+                rows.update((row[0], row[1:]) for row in self.connection.execute(
+                    f"SELECT id, novel, chapter_id, field, title, length FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+            scores = []
+            for document in documents:
+                length = rows[document][4]
+                score = 0.0
+                for _, occurrences, idf in matches:
+                    frequency = len(occurrences[document])
+                    score += idf * frequency * (_K1_ + 1) / (frequency + _K1_ * (1 - _B_ + _B_ * length / (average_length or 1)))
+                scores.append((score * _FIELD_WEIGHTS_.get(rows[document][2], 1.0), document))
+            results = []
+            for score, document in heapq.nlargest(limit, scores):
+                novel_source, chapter_id, field, title, _ = rows[document]
+                content = self._decompress(self.connection.execute(
+                    "SELECT content FROM documents WHERE id = ?", (document,)).fetchone()[0])
+                word, occurrences, _ = matches[0]
+                results.append(SearchResult(novel_source, chapter_id or None, field, title, score,
+                                            self._snippet(content, occurrences[document][0], len(word), highlight)))
+        return results
+
+    def _snippet(self, content:str, position:int, length:int, highlight:Tuple[str, str])->str:
+        start, end = max(0, position - self._SNIPPET_WIDTH_), position + length + self._SNIPPET_WIDTH_
+        snippet = (content[start:position] + highlight[0] + content[position:position + length] + highlight[1] +
+                   content[position + length:end])
+        snippet = " ".join(snippet.split())
+        return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")